@@ -1,9 +1,49 @@
 import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
 import re
-from collections import Counter
+from collections import Counter, namedtuple
 import time
 from tqdm import tqdm
 import os 
+import argparse
+import contextlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pipeline_io import ExcelExportQueue, split_long_format, call_with_captured_output
+from stage_cache import StageCache, default_cache_dir, fingerprint_frame
+from run_report import RunReport, stage, current_rss_mb
+from stage_profiler import StageProfiler, merge_collapsed
+from live_metrics import LiveMetrics, serve_metrics, track
+from patent_corpus import corpus_path, compile_corpus, open_corpus, source_signature
+from shared_arrays import SharedArrays
+from checkpoint import CheckpointStore, fingerprint_of
+try:
+    import pyarrow as pa # 可选依赖 (v8): 专利文本列使用 Arrow 字符串，块提取使用 Arrow 计算内核
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# 进程的基础内存 (解释器 + 已加载的库，MB; 无法获取时为 None)。内存预算按 "基础内存 + 本任务的数据" 计算当前占用，
+# 不用运行中的 RSS: RSS 只增不减，前面任务释放的内存仍计在内，后面的任务会被误判为放不下
+BASE_RSS_MB = current_rss_mb()
+
+# 处理算法版本: 改变 process_row 的计算结果时必须更新，阶段缓存以此区分新旧结果
+# (v8: 方法1/方法2 的列表列改为 float32/uint16 紧凑存储，质量值按 float32 精度输出)
+PROCESSING_VERSION = 'v8'
+
+# 专利数据列名: 发明申请A类 ~ 实用新型申请H类
+PATENT_DATA_COL_RE = re.compile(r'(发明申请|实用新型申请)[A-H]类')
+
+# (v8) 语料模式下每个专利数据列附带一个块 id 列 (Arrow list<int32>，语料内块号，由 load_data 添加)，
+# 处理时代替从文本中提取块; 不参与缓存指纹，也不输出
+BLOCK_ID_SUFFIX = '#块id'
+
+def block_id_col(col):
+    return f"{col}{BLOCK_ID_SUFFIX}"
+
+def without_block_ids(df):
+    return df.drop(columns=[c for c in df.columns if str(c).endswith(BLOCK_ID_SUFFIX)])
 
 # --- 核心函数1: 提取专利部分 (无需修改) ---
 def extract_patent_parts(patent_num_str):
@@ -34,106 +74,655 @@ def extract_patent_parts(patent_num_str):
     sub_class = main_group[:4]
     return main_group, sub_class
 
-# --- 核心函数2: 处理单行 (v7 更新: 增加专利块去重) ---
-def process_row(row, patent_cols, summary_col_name):
+# --- 辅助类: 数据形态计数 (v8 新增) ---
+class ProcessingStats:
+    """
+    process_row 热循环中的低开销计数器，用于容量规划。
+    只做整数累加和 dict 计数 (每个块一次)，相对正则解析的开销可以忽略。
+    - blocks_total / blocks_duplicate: 去重前的块数 / 被 v7 dict.fromkeys 去掉的重复块数
+    - codes / codes_no_main_group: 分类号数 / 解析不出大组的分类号数
+    - codes_per_block: 每块分类号数的直方图 (精确值)
+      (以上三项按块的出现次数统计: 行内去重后的每个块都计入，分类号数取块库中缓存的逐块计数，
+      与块是否由本次处理首次解析无关)
+    - blocks_parsed: 本次处理中首次进入 BlockStore、实际被解析的块数 (其余的块直接查表)
+    - blocks_canonical_merged: 跨类型去重 (v8) 时，因行内已有规范形式相同的块而去掉的块数
+    - blocks_per_row: 每行 (去重后) 块数的直方图 (按 2 的幂分桶: 0, 1, 2, 4, 8, ...)
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.blocks_total = 0
+        self.blocks_duplicate = 0
+        self.blocks_parsed = 0
+        self.codes = 0
+        self.codes_no_main_group = 0
+        self.codes_per_block = Counter()
+        self.blocks_per_row = Counter()
+        self.blocks_canonical_merged = 0
+
+    def add_row(self, n_blocks):
+        self.rows += 1
+        self.blocks_per_row[1 << (n_blocks - 1).bit_length() if n_blocks else 0] += 1
+
+    def add_rows(self, n_blocks):
+        """按列处理时一次累计多行: 参数为各行 (去重后) 块数的数组。"""
+        n_blocks = np.asarray(n_blocks, dtype=np.int64)
+        self.rows += len(n_blocks)
+        # 与 add_row 相同的分桶: 1 << (n - 1).bit_length() (frexp 的指数即 bit_length)
+        buckets = np.where(n_blocks > 0, 1 << np.frexp(np.maximum(n_blocks - 1, 0))[1].astype(np.int64), 0)
+        values, counts = np.unique(buckets, return_counts=True)
+        self.blocks_per_row.update(dict(zip(values.tolist(), counts.tolist())))
+
+    def add_block_codes(self, block_ids, block_store):
+        """一行 (去重后) 的各个块: 累计分类号数 (逐行处理时使用)。"""
+        typed = block_store.typed_columns()
+        ids = np.asarray(block_ids, dtype=np.int64)
+        self.add_code_counts(typed['codes'][ids], typed['codes_no_main_group'][ids])
+
+    def add_code_counts(self, n_codes, n_no_main_group):
+        """按列处理时一次累计: 参数为逐个块出现的分类号数 / 无大组分类号数数组。"""
+        self.codes += int(n_codes.sum())
+        self.codes_no_main_group += int(n_no_main_group.sum())
+        values, counts = np.unique(n_codes, return_counts=True)
+        self.codes_per_block.update(dict(zip(values.tolist(), counts.tolist())))
+
+    def to_counts(self):
+        """转换为 RunReport 阶段记录中的计数字段 (直方图的键转为字符串以便写 JSON)。"""
+        return {
+            'blocks_total': self.blocks_total,
+            'blocks_duplicate': self.blocks_duplicate,
+            'blocks_parsed': self.blocks_parsed,
+            'codes': self.codes,
+            'codes_no_main_group': self.codes_no_main_group,
+            'blocks_canonical_merged': self.blocks_canonical_merged,
+            'codes_per_block_hist': {str(k): v for k, v in sorted(self.codes_per_block.items())},
+            'blocks_per_row_hist': {str(k): v for k, v in sorted(self.blocks_per_row.items())},
+        }
+
+    def summary(self):
+        dup_ratio = self.blocks_duplicate / self.blocks_total if self.blocks_total else 0
+        avg_codes = self.codes / sum(self.codes_per_block.values()) if self.codes_per_block else 0
+        return (f"{self.rows} 行, {self.blocks_total} 块 (重复 {self.blocks_duplicate}, {dup_ratio:.1%}), "
+                f"{self.codes} 个分类号 (无大组 {self.codes_no_main_group}), 平均每块 {avg_codes:.2f} 个分类号, "
+                f"新解析 {self.blocks_parsed} 个块")
+
+# --- 辅助类: 专利块库 (v8 新增) ---
+# 块库中逐块的值按列存放 (按块 id 下标的 numpy 数组)，类型如下; 输出列表列时质量值转为 float32、N / n 转为 uint16
+BLOCK_COLUMNS = {'valid': np.bool_, 'method1': np.float64, 'N': np.int32, 'n': np.int32,
+                 'method2': np.float64, 'codes': np.int32, 'codes_no_main_group': np.int32}
+RAGGED_LIST_COLS = {'方法1-专利质量列表': ('method1', np.float32), '方法2-小类数量列表': ('N', np.uint16),
+                    '方法2-大组数量列表': ('n', np.uint16), '方法2-专利质量列表': ('method2', np.float32)}
+
+def _reserve(arr, used, extra):
+    """保证 arr 的前 used 项之后还能写入 extra 项: 容量不足时按倍增复制 (memmap / 共享内存视图在此复制为私有数组)。"""
+    if used + extra <= len(arr):
+        return arr
+    grown = np.empty(max(used + extra, 2 * len(arr)), dtype=arr.dtype)
+    grown[:used] = arr[:used]
+    return grown
+
+def _csr_positions(offsets, block_ids):
+    """CSR 中若干块 (可重复) 的各项位置，按块的顺序拼接; 同时返回各块的项数。"""
+    starts = offsets[block_ids]
+    lengths = offsets[block_ids + 1] - starts
+    bounds = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=bounds[1:])
+    return np.repeat(starts - bounds[:-1], lengths) + np.arange(bounds[-1]), lengths
+
+class BlockStore:
+    """
+    专利块库: 每个不同的块内容分配一个整数 id，方法1/方法2/方法3 所需的值只计算一次。
+    同一个块出现在子公司行、分支1 合并行、发明&实用 合并行中时，后续出现只查表。
+    块库的生命周期是一次运行: 由 run_tasks_* (或子进程中的任务入口) 创建并传给 run_processing_task，
+    运行结束后随之释放，不会在进程中跨运行累积。
+    逐块的值按列存放 (typed_columns()，列见 BLOCK_COLUMNS): 块内没有可解析的分类号时 valid 为 False，
+    不参与计分 (与 v7 的 continue 一致); codes / codes_no_main_group 为分类号数、无大组分类号数，
+    供 ProcessingStats 按出现次数统计。方法3 所需的各块大组 (含重复，保持顺序) 按 CSR 存放，
+    大组 id 对应 main_groups。块有两个来源:
+    - intern(): 逐个解析的块 (文本 -> id 记在 ids 中)，先放入待并入列表，取数组时整批追加
+    - load_corpus(): 已编译语料中的块，整批向量化放入，语料内块号 -> 块库 id 记在 corpus_remaps 中
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.hits = 0
+        self.parsed = 0
+        self.canonical_ids = {} # 规范形式 (大组 id 的有序元组) -> 规范类 id
+        self.canonical_of = {}  # 块 id -> 规范类 id (每个块只规范化一次)
+        self.main_groups = []    # 大组 id -> 大组
+        self.main_group_ids = {} # 大组 -> 大组 id
+        self.corpus_remaps = {}  # 语料路径 -> 数组: 语料内块号 -> 块库 id (未安装 pyarrow 时为 None)
+        self._corpus_texts = []  # [(语料的块文本 (Arrow), 对应的块库 id)]: 按文本整批查找已载入的块
+        self._size = 0
+        self._columns = {name: np.zeros(0, dtype=dtype) for name, dtype in BLOCK_COLUMNS.items()}
+        self._mg_offsets = np.zeros(1, dtype=np.int64)
+        self._mg_codes = np.zeros(0, dtype=np.int32)
+        self._n_flushed = 0 # 已并入数组的块数
+        self._pending = []  # intern() 新增、尚未并入数组的块: (score_block 的结果, 分类号数, 大组 id 列表)
+
+    def __len__(self):
+        return self._size
+
+    def _main_group_id(self, main_group):
+        mg_id = self.main_group_ids.get(main_group)
+        if mg_id is None:
+            mg_id = self.main_group_ids[main_group] = len(self.main_groups)
+            self.main_groups.append(main_group)
+        return mg_id
+
+    def intern(self, block_content, stats=None):
+        """返回块的 id，首次出现时解析并计算。"""
+        block_id = self.ids.get(block_content)
+        if block_id is not None:
+            self.hits += 1
+            return block_id
+        block_id = self._size
+        self.ids[block_content] = block_id
+        parts_list = parse_block(block_content)
+        self._pending.append((score_block(parts_list), count_codes(block_content),
+                              [self._main_group_id(mg) for mg, sc in parts_list]))
+        self._size += 1
+        self.parsed += 1
+        if stats is not None:
+            stats.blocks_parsed += 1
+        return block_id
+
+    def _find(self, texts, include_interned=False):
+        """块文本 (Arrow 字符串数组) 中已在块库里的块的 id (不在块库中的为 -1)，用 index_in 整批对照。"""
+        ids = np.full(len(texts), -1, dtype=np.int64)
+        known = list(self._corpus_texts)
+        if include_interned and self.ids:
+            known.append((pa.array(list(self.ids), pa.large_string()),
+                          np.fromiter(self.ids.values(), dtype=np.int64, count=len(self.ids))))
+        for known_texts, known_ids in known:
+            found = pc.fill_null(pc.index_in(texts, value_set=known_texts), -1).to_numpy()
+            hit = (found >= 0) & (ids < 0)
+            ids[hit] = known_ids[found[hit]]
+        return ids
+
+    def lookup(self, texts, stats=None):
+        """
+        (v8) 一组不同的块文本 (Arrow 字符串数组) -> 块库 id 数组。
+        已载入语料中的块整批查找 (_find)，其余逐个 intern (新块在此解析)。
+        """
+        ids = self._find(texts)
+        self.hits += int((ids >= 0).sum())
+        rest = np.flatnonzero(ids < 0)
+        if len(rest):
+            ids[rest] = [self.intern(b, stats) for b in texts.take(pa.array(rest)).to_pylist()]
+        return ids
+
+    def _append(self, columns, mg_lengths, mg_codes):
+        """把若干块的列值、各块的大组数和大组 id 追加到数组末尾。"""
+        n, k = self._n_flushed, len(mg_lengths)
+        if k == 0:
+            return
+        m = int(self._mg_offsets[n])
+        for name, values in columns.items():
+            self._columns[name] = _reserve(self._columns[name], n, k)
+            self._columns[name][n:n + k] = values
+        self._mg_offsets = _reserve(self._mg_offsets, n + 1, k)
+        self._mg_offsets[n + 1:n + 1 + k] = m + np.cumsum(mg_lengths)
+        if len(mg_codes):
+            self._mg_codes = _reserve(self._mg_codes, m, len(mg_codes))
+            self._mg_codes[m:m + len(mg_codes)] = mg_codes
+        self._n_flushed = n + k
+
+    def _flush(self):
+        """把 intern() 待并入的块整批追加到数组。"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        columns = {'valid': [v is not None for v, _, _ in pending]}
+        for i, name in enumerate(('method1', 'N', 'n', 'method2')):
+            columns[name] = [0 if v is None else v[i] for v, _, _ in pending]
+        columns['codes'] = [n_codes for _, n_codes, _ in pending]
+        columns['codes_no_main_group'] = [n_codes - len(mg_ids) for _, n_codes, mg_ids in pending]
+        self._append({name: np.array(values, dtype=BLOCK_COLUMNS[name]) for name, values in columns.items()},
+                     np.array([len(mg_ids) for _, _, mg_ids in pending], dtype=np.int64),
+                     np.array([i for _, _, mg_ids in pending for i in mg_ids], dtype=np.int32))
+
+    def load_corpus(self, corpus, scores=None):
+        """
+        把已编译语料 (patent_corpus.PatentCorpus) 中的块放入块库，这些块之后不再解析。返回新增块数。
+        scores: (v8) 并行模式下已在共享内存中算好的逐块指标 (见 score_corpus_shared)，省略时在本进程计算。
+        整批向量化完成: 块文本与已有的块整批对照 (_find，已有的块沿用原 id)，新块的值取自 scores 或
+        score_blocks，大组 id 按语料的大组字典换成块库的大组 id。块库为空时各列直接引用 scores 和语料的 memmap，
+        不复制。未安装 pyarrow 时逐块放入。
+        """
+        if corpus.path in self.corpus_remaps:
+            return 0
+        if pa is None:
+            return self._load_corpus_blocks(corpus)
+        self._flush()
+        texts = corpus.block_texts_arrow()
+        remap = self._find(texts, include_interned=True)
+        new = np.flatnonzero(remap < 0)
+        remap[new] = self._size + np.arange(len(new))
+
+        if scores is None:
+            scores = score_blocks(corpus.block_code_offsets, corpus.code_main_group, corpus.code_sub_class)
+        offsets = corpus.block_code_offsets
+        n_codes = corpus.block_n_codes
+        vocab = np.array([self._main_group_id(mg) for mg in corpus.main_groups], dtype=np.int32)
+        if len(new) == len(texts) and self._n_flushed == 0 and np.array_equal(vocab, np.arange(len(vocab))):
+            # 空块库: 直接引用 (共享内存 / memmap)，追加新块时才复制
+            self._columns = {name: scores[name] for name in SCORE_ARRAYS}
+            self._columns['codes'] = n_codes
+            self._columns['codes_no_main_group'] = (n_codes - np.diff(offsets)).astype(np.int32)
+            self._mg_offsets, self._mg_codes = offsets, corpus.code_main_group
+            self._n_flushed = len(texts)
+        else:
+            positions, lengths = _csr_positions(np.asarray(offsets), new)
+            columns = {name: scores[name][new] for name in SCORE_ARRAYS}
+            columns['codes'] = n_codes[new]
+            columns['codes_no_main_group'] = n_codes[new] - lengths
+            self._append(columns, lengths, vocab[corpus.code_main_group[positions]])
+        self._size += len(new)
+        self.corpus_remaps[corpus.path] = remap
+        self._corpus_texts.append((texts, remap))
+        return len(new)
+
+    def _load_corpus_blocks(self, corpus):
+        """load_corpus 的逐块实现 (未安装 pyarrow 时): 文本不在块库中的块按语料中的解析结果放入。"""
+        added = 0
+        for block_content, parts_list, n_codes in zip(corpus.block_texts(), corpus.block_parts(),
+                                                      corpus.block_n_codes.tolist()):
+            if block_content not in self.ids:
+                self.ids[block_content] = self._size
+                self._pending.append((score_block(parts_list), n_codes,
+                                      [self._main_group_id(mg) for mg, sc in parts_list]))
+                self._size += 1
+                added += 1
+        self.corpus_remaps[corpus.path] = None
+        return added
+
+    def new_block_ratio(self):
+        """
+        (v8) 查找时遇到新块 (需要解析并存入块库) 的比例，用于估计块库在下一张表上的增长:
+        块库为空时为 1; 只有语料中预先载入的块、还没有查找过时为 0。
+        """
+        lookups = self.parsed + self.hits
+        if lookups:
+            return self.parsed / lookups
+        return 0.0 if self._size else 1.0
+
+    def typed_columns(self):
+        """(v8) 按块 id 下标的各列 (见 BLOCK_COLUMNS)。先把 intern() 新增的块并入。"""
+        self._flush()
+        return {name: values[:self._n_flushed] for name, values in self._columns.items()}
+
+    def main_group_entries(self, rows, block_ids):
+        """
+        (v8) 方法3: 若干行的块 (rows 为行号，与 block_ids 一一对应、按行排列) 中各大组的出现次数。
+        返回 (行号数组, 大组列表, 次数列表)，按行、行内首次出现的顺序排列 (与逐块 Counter.update 相同)。
+        """
+        self._flush()
+        positions, lengths = _csr_positions(self._mg_offsets, np.asarray(block_ids, dtype=np.int64))
+        n_main_groups = max(len(self.main_groups), 1)
+        keys = np.repeat(np.asarray(rows, dtype=np.int64), lengths) * n_main_groups + self._mg_codes[positions]
+        keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        keys, counts = keys[order], counts[order]
+        names = [self.main_groups[i] for i in (keys % n_main_groups).tolist()]
+        return keys // n_main_groups, names, counts.tolist()
+
+    def canonical_classes(self, block_ids):
+        """
+        (v8) 各块的规范类 id: 规范形式 (见 canonical_block) 相同的块属于同一类。
+        规范形式直接取块库中已解析的大组 (与 canonical_block 相同)，不再从文本解析;
+        没有可解析分类号的块各自成一类，不与其他块合并。
+        """
+        self._flush()
+        classes = np.empty(len(block_ids), dtype=np.int64)
+        for k, block_id in enumerate(np.asarray(block_ids, dtype=np.int64).tolist()):
+            canonical = self.canonical_of.get(block_id)
+            if canonical is None:
+                form = tuple(sorted(self._mg_codes[self._mg_offsets[block_id]:self._mg_offsets[block_id + 1]].tolist()))
+                canonical = self.canonical_ids.setdefault(form or ('块', block_id), len(self.canonical_ids))
+                self.canonical_of[block_id] = canonical
+            classes[k] = canonical
+        return classes
+
+def canonical_block(block_content):
+    """
+    专利块的规范形式: 解析出的 (大组, 小类) 排序后的元组 (即 parse_block 的结果，与分类号顺序无关)。
+    一案双申的发明/实用新型专利常因书写差异 (分类号顺序、版本注记、';' 两侧空白) 而块文本不同，规范形式相同。
+    大组内部的写法不同 (如 'A01B 1/00' 与 'A01B1/00') 解析出的大组不同，方法3 分别计数，规范形式也不同。
+    """
+    return tuple(sorted(parse_block(block_content)))
+
+# --- 核心函数1.5: 拆分专利块 (v8 从 process_row 中拆出，便于单独测量) ---
+def split_blocks(cell_contents, stats=None):
+    """
+    从若干单元格字符串中提取所有 {内容} 块，并保持顺序去重 (v7 逻辑)。
+    (例如, ['A', 'B', 'A'] 变为 ['A', 'B'])
+    """
+    all_blocks_content_list = []
+    for cell_content in cell_contents:
+        all_blocks_content_list.extend(re.findall(r'\{(.*?)\}', cell_content))
+    # 使用 dict.fromkeys 保持顺序并去重
+    unique_blocks_content = list(dict.fromkeys(all_blocks_content_list))
+    if stats is not None:
+        stats.blocks_total += len(all_blocks_content_list)
+        stats.blocks_duplicate += len(all_blocks_content_list) - len(unique_blocks_content)
+    return unique_blocks_content
+
+def parse_block(block_content):
+    """把一个专利块按 ';' 拆分并解析，返回 [(大组, 小类), ...] (跳过空项和无法解析的项)。"""
+    parts_list = []
+    for s in block_content.split(';'):
+        s_clean = s.strip()
+        if s_clean:
+            main_group, sub_class = extract_patent_parts(s_clean)
+            if main_group:
+                parts_list.append((main_group, sub_class))
+    return parts_list
+
+def count_codes(block_content):
+    """块内的分类号数 (按 ';' 拆分后非空的项，含解析不出大组的项)。"""
+    return sum(1 for s in block_content.split(';') if s.strip())
+
+def score_block(parts_list):
+    """由一个块的 [(大组, 小类), ...] 计算 (方法1质量, N, n, 方法2质量, 大组元组)，空块返回 None。"""
+    if not parts_list:
+        return None
+
+    # --- 方法1 ---
+    main_groups_in_block = [mg for mg, sc in parts_list]
+    p = len(main_groups_in_block)
+    group_counts = Counter(main_groups_in_block)
+    # 逐项顺序相加 (Python 3.12 起 sum() 对浮点数做补偿求和; 顺序相加在各版本上与 score_blocks 逐位相同)
+    sum_sq_ratio = 0
+    for t in group_counts.values():
+        sum_sq_ratio += (t / p) ** 2
+    method1_q = 1 - sum_sq_ratio
+
+    # --- 方法2 ---
+    sub_classes_in_block = [sc for mg, sc in parts_list]
+    N = len(set(sub_classes_in_block))
+    n = len(set(main_groups_in_block))
+    # v6 健壮性修复: 避免 n=0 导致的除零错误
+    if n > 0:
+        method2_q = N + 1 - (1 / n)
+    else:
+        method2_q = N + 1 # 或者 0, None, 取决于业务逻辑
+
+    # --- 方法3 (行内汇总时使用) ---
+    return method1_q, N, n, method2_q, tuple(main_groups_in_block)
+
+def score_blocks(block_code_offsets, code_main_group, code_sub_class):
+    """
+    (v8) score_block 的向量化版本: 由 CSR 数组 (各块中能解析出大组的分类号 -> 大组 id / 小类 id，
+    即语料中的 block_code_offsets / code_main_group / code_sub_class，可以是其中一段) 一次算出所有块的
+    valid / method1 / N / n / method2 (类型见 BLOCK_COLUMNS)。与逐块 score_block 的结果逐位相同:
+    方法1 的平方和按大组在块内首次出现的顺序逐项相加。
+    """
+    offsets = np.asarray(block_code_offsets, dtype=np.int64)
+    n_blocks = len(offsets) - 1
+    p = np.diff(offsets)
+    block_of = np.repeat(np.arange(n_blocks), p)
+    main_group = np.asarray(code_main_group[offsets[0]:offsets[-1]], dtype=np.int64)
+    sub_class = np.asarray(code_sub_class[offsets[0]:offsets[-1]], dtype=np.int64)
+
+    # 各块的不同大组 (按块、块内首次出现的顺序) 及其出现次数 t
+    n_mg = int(main_group.max()) + 1 if len(main_group) else 1
+    keys, first, t = np.unique(block_of * n_mg + main_group, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    group_block, t = keys[order] // n_mg, t[order]
+    n = np.bincount(group_block, minlength=n_blocks)
+    n_sc = int(sub_class.max()) + 1 if len(sub_class) else 1
+    N = np.bincount(np.unique(block_of * n_sc + sub_class) // n_sc, minlength=n_blocks)
+
+    # 方法1: 第 k 个大组的项依次加到各块的和上 (同一轮中每块至多一项)
+    terms = (t / p[group_block]) ** 2
+    rank = np.arange(len(group_block)) - np.repeat(np.cumsum(n) - n, n)
+    by_rank = np.argsort(rank, kind='stable')
+    rank_bounds = np.concatenate([[0], np.cumsum(np.bincount(rank, minlength=1))])
+    sum_sq_ratio = np.zeros(n_blocks)
+    for lo, hi in zip(rank_bounds[:-1], rank_bounds[1:]):
+        at = by_rank[lo:hi]
+        sum_sq_ratio[group_block[at]] += terms[at]
+
+    valid = p > 0
+    return {
+        'valid': valid,
+        'method1': np.where(valid, 1 - sum_sq_ratio, 0.0),
+        'N': N.astype(np.int32),
+        'n': n.astype(np.int32),
+        'method2': np.where(valid, N + 1 - 1 / np.maximum(n, 1), 0.0),
+    }
+
+# --- 核心函数2: 处理单行 (v7 更新: 增加专利块去重, v8 块值查全局块库) ---
+def process_row(row, patent_cols, summary_col_name, stats=None, block_store=None, dedup_canonical=False):
     """
     处理DataFrame的单行数据。
     (v6: 专利列 和 汇总列名 通过参数传入)
     (v7: 增加 {} 块级别去重)
+    (v8: stats 为 ProcessingStats 时累计块数/分类号数等数据形态计数)
+    (v8: 块先换成 BlockStore 中的整数 id，每个不同的块只解析、计分一次; 省略时使用只用于本行的临时块库)
+    (v8: dedup_canonical 为 True 时，规范形式相同的块 (一案双申) 在行内只计一次，保留行内第一个)
     """
+    if block_store is None:
+        block_store = BlockStore()
     
-    # v7 新逻辑:
-    all_blocks_content_list = []
     raw_full_string_for_summary = "" # 用于保存到汇总列的原始字符串
     
+    cell_contents = []
     for col in patent_cols:
         if col in row.index and pd.notna(row[col]):
             cell_content = str(row[col])
             # 1. 仍然保存原始的、未去重的字符串，用于汇总列（保持v6行为）
             raw_full_string_for_summary += cell_content
-            # 2. 提取所有 {内容} 并添加到总列表
-            all_blocks_content_list.extend(re.findall(r'\{(.*?)\}', cell_content))
+            cell_contents.append(cell_content)
 
     # 保存原始汇总字符串
     row[summary_col_name] = raw_full_string_for_summary
 
-    # --- 核心去重 ---
-    # 使用 dict.fromkeys 保持顺序并去重
-    # (例如, ['A', 'B', 'A'] 变为 ['A', 'B'])
-    unique_blocks_content = list(dict.fromkeys(all_blocks_content_list))
+    # 2. 提取所有 {内容} 并去重，换成块 id
+    unique_blocks_content = split_blocks(cell_contents, stats)
+    if stats is not None:
+        stats.add_row(len(unique_blocks_content))
+    block_ids = [block_store.intern(b, stats) for b in unique_blocks_content]
+    if stats is not None:
+        stats.add_block_codes(block_ids, block_store)
+    if dedup_canonical:
+        block_ids = _canonical_row_ids(block_ids, block_store, stats)
 
-    # v7 new check: 检查去重后的列表是否为空
-    if not unique_blocks_content:
-        row['方法1-专利质量列表'] = []
-        row['方法2-小类数量列表'] = []
-        row['方法2-大组数量列表'] = []
-        row['方法2-专利质量列表'] = []
-        row['方法3-专利大组分类计数'] = {}
-        return row
-
-    # v6 old logic (was error prone):
-    # patent_blocks_content = re.findall(r'\{(.*?)\}', full_patent_string)
-
-    method1_q_list = []
-    method2_N_list = []
-    method2_n_list = []
-    method2_q_list = []
-    all_main_groups_for_row = []
-
-    # v7 new loop: 
-    # *** 遍历去重后的专利块内容 ***
-    for block_content in unique_blocks_content:
-        patent_num_strings = block_content.split(';')
-        parts_list = []
-        
-        for s in patent_num_strings:
-            s_clean = s.strip()
-            if s_clean:
-                main_group, sub_class = extract_patent_parts(s_clean)
-                if main_group:
-                    parts_list.append((main_group, sub_class))
-
-        if not parts_list:
-            continue
+    (row['方法1-专利质量列表'], row['方法2-小类数量列表'], row['方法2-大组数量列表'],
+     row['方法2-专利质量列表'], row['方法3-专利大组分类计数']) = row_metrics(block_ids, block_store)
+    return row
 
-        # --- 方法1 ---
-        main_groups_in_block = [mg for mg, sc in parts_list]
-        p = len(main_groups_in_block)
-        if p > 0:
-            group_counts = Counter(main_groups_in_block)
-            sum_sq_ratio = sum([(t / p) ** 2 for t in group_counts.values()])
-            method1_q_list.append(1 - sum_sq_ratio)
-        # else:
-        #     method1_q_list.append(None) # 如果需要，可以取消注释
-
-        # --- 方法2 ---
-        sub_classes_in_block = [sc for mg, sc in parts_list]
-        N = len(set(sub_classes_in_block))
-        n = len(set(main_groups_in_block))
-        # v6 健壮性修复: 避免 n=0 导致的除零错误
-        if n > 0:
-            method2_q_list.append(N + 1 - (1 / n))
-        else:
-            method2_q_list.append(N + 1) # 或者 0, None, 取决于业务逻辑
-        
-        method2_N_list.append(N)
-        method2_n_list.append(n)
+def _canonical_row_ids(block_ids, block_store, stats=None):
+    """
+    (v8) 跨类型去重: 行内规范形式相同的块只保留第一个。
+    保留的是本行自己的块 (不换成其他行的代表块)，所以去重只会减少、不会增加本行的任何计数。
+    """
+    seen = set()
+    kept = [i for i, c in zip(block_ids, block_store.canonical_classes(block_ids).tolist())
+            if not (c in seen or seen.add(c))]
+    if stats is not None:
+        stats.blocks_canonical_merged += len(block_ids) - len(kept)
+    return kept
 
-        # --- 方法3 ---
-        all_main_groups_for_row.extend(main_groups_in_block)
+def row_metrics(block_ids, block_store):
+    """
+    (v8 从 process_row 中拆出) 由一行 (已去重的) 块 id 取出块库中预先算好的值 (没有可解析分类号的块不参与计分)，
+    返回 (方法1质量列表, 方法2小类数量列表, 方法2大组数量列表, 方法2质量列表, 方法3大组计数字典)。
+    """
+    typed = block_store.typed_columns()
+    ids = np.asarray(block_ids, dtype=np.int64)
+    ids = ids[typed['valid'][ids]]
+    _, main_groups, counts = block_store.main_group_entries(np.zeros(len(ids), dtype=np.int64), ids)
+    return (typed['method1'][ids].tolist(), typed['N'][ids].tolist(), typed['n'][ids].tolist(),
+            typed['method2'][ids].tolist(), dict(zip(main_groups, counts)))
 
-    row['方法1-专利质量列表'] = method1_q_list
-    row['方法2-小类数量列表'] = method2_N_list
-    row['方法2-大组数量列表'] = method2_n_list
-    row['方法2-专利质量列表'] = method2_q_list
-    row['方法3-专利大组分类计数'] = dict(Counter(all_main_groups_for_row))
+# --- 核心函数2.5: 按列处理整表 (v8 新增, 需要 pyarrow) ---
+# process_row 逐行 apply 时每行都被转成 object 的 Series，Arrow 字符串列在这里失去意义。
+# 按列处理时: 汇总列的拼接、{内容} 块的提取都由 Arrow 计算内核完成 (C++ 实现，执行时释放 GIL)，
+# 块文本整体字典编码后只把不同的块交给 BlockStore; 行内去重、按块取值、方法3 计数都是对整数 id 数组的
+# numpy 运算，Python 循环只剩每行构造一个方法3 字典。语料模式下块 id 直接来自块 id 列，连块的提取也省去。
+# 方法1/方法2 的四个列表列是 Arrow 的 list<float32> / list<uint16>，四列共用同一个偏移数组
+# (值与 process_row 相同，质量值为 float32 精度); 方法3 计数仍为 dict。
 
-    return row
+def is_arrow_string(series):
+    """列是否为 Arrow 存储的字符串 (pandas 3 默认的 str 类型即是)。"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.StringDtype):
+        return dtype.storage == 'pyarrow'
+    if isinstance(dtype, pd.ArrowDtype):
+        return pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype)
+    return False
+
+def to_arrow_strings(df):
+    """专利数据列转为 Arrow 字符串 (已是 Arrow 字符串的列不动; 未安装 pyarrow 时原样返回)。"""
+    if pa is None:
+        return df
+    for col in df.columns:
+        if PATENT_DATA_COL_RE.fullmatch(str(col)) and not is_arrow_string(df[col]):
+            df[col] = df[col].astype(pd.StringDtype('pyarrow'))
+    return df
+
+def _arrow_column(series):
+    """列 -> pyarrow large_string 数组 (Arrow 字符串列零拷贝)。"""
+    if not is_arrow_string(series):
+        series = series.astype(pd.StringDtype('pyarrow'))
+    arr = pa.array(series)
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    return arr.cast(pa.large_string())
+
+def extract_blocks_arrow(arr):
+    r"""
+    用 Arrow 内核提取各单元格中的 {内容} 块，与 re.findall(r'\{(.*?)\}', 单元格) 的结果相同:
+    按 '}' 切分后，最后一段 (最后一个 '}' 之后) 不构成块; 其余各段中，最后一个换行之后
+    (正则的 . 不匹配换行) 含 '{' 的部分，去掉第一个 '{' 及之前的内容即为块。
+    返回 (行号数组, 块文本数组)，按行、行内出现顺序排列。
+    """
+    pieces = pc.split_pattern(arr, '}')
+    values = pieces.flatten()
+    rows = pc.list_parent_indices(pieces).to_numpy()
+    offsets = pieces.offsets.to_numpy()
+    starts, ends = offsets[:-1] - offsets[0], offsets[1:] - offsets[0]
+    is_last = np.zeros(len(values), dtype=bool)
+    is_last[ends[ends > starts] - 1] = True
+    values = pc.replace_substring_regex(values, r'(?s)^.*\n', '', max_replacements=1)
+    keep = ~is_last & pc.match_substring(values, '{').to_numpy(zero_copy_only=False)
+    blocks = pc.replace_substring_regex(values.filter(pa.array(keep)), r'^[^{]*\{', '', max_replacements=1)
+    return rows[keep], blocks
+
+def _first_in_row(rows, block_ids):
+    """按行排列的 (行号, 块 id) 中每行每个块第一次出现的位置 (布尔掩码)，即逐行 dict.fromkeys 保留的项。"""
+    keep = np.zeros(len(block_ids), dtype=bool)
+    if len(block_ids):
+        keys = rows * (int(block_ids.max()) + 1) + block_ids
+        keep[np.unique(keys, return_index=True)[1]] = True
+    return keep
+
+def _block_ids_from_text(arrays, block_store, stats=None):
+    """从文本列中提取块，按 (行, 列顺序, 列内位置) 排列，整体字典编码后换成块库 id。返回 (行号, 块 id)。"""
+    extracted = [extract_blocks_arrow(arr) for arr in arrays]
+    rows = np.concatenate([r for r, _ in extracted]) if extracted else np.zeros(0, dtype=np.int64)
+    order = np.argsort(rows, kind='stable')
+    blocks = pa.chunked_array([b for _, b in extracted], pa.large_string()).combine_chunks().take(pa.array(order))
+    encoded = pc.dictionary_encode(blocks)
+    id_of_text = block_store.lookup(encoded.dictionary, stats)
+    block_store.hits += len(blocks) - len(encoded.dictionary) # 重复出现的块也算作查表命中 (与逐行处理一致，按出现次数计)
+    block_ids = id_of_text[encoded.indices.to_numpy(zero_copy_only=False)]
+    return rows[order], block_ids
+
+def _block_ids_from_lists(df, id_cols, block_id_remaps, block_store):
+    """(v8) 语料模式: 直接取块 id 列 (语料内块号) 并换成块库 id，按 (行, 列顺序, 列内位置) 排列。返回 (行号, 块 id)。"""
+    rows, block_ids = [], []
+    for id_col in id_cols:
+        lists = pa.array(df[id_col].array)
+        if isinstance(lists, pa.ChunkedArray):
+            lists = lists.combine_chunks()
+        rows.append(pc.list_parent_indices(lists).to_numpy())
+        block_ids.append(block_id_remaps[id_col][lists.flatten().to_numpy()])
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    block_ids = np.concatenate(block_ids) if block_ids else np.zeros(0, dtype=np.int64)
+    block_store.hits += len(block_ids)
+    order = np.argsort(rows, kind='stable')
+    return rows[order], block_ids[order]
+
+def process_frame_arrow(df, patent_cols, summary_col_name, stats=None, block_store=None, dedup_canonical=False,
+                        desc=None, block_id_remaps=None):
+    """
+    与 df.apply(process_row, axis=1, ...) 结果相同的按列实现，返回新表 (原表不修改)。
+    block_id_remaps: (v8) {块 id 列: 语料内块号 -> 块库 id 的数组}。各专利列的块 id 列都在其中时 (语料模式)，
+    直接使用块 id，不再从文本中提取块。
+    """
+    if block_store is None:
+        block_store = BlockStore()
+    cols = [col for col in patent_cols if col in df.columns]
+    arrays = [_arrow_column(df[col]) for col in cols]
+    n_rows = len(df)
+
+    # 汇总列: 各列非空单元格按列顺序拼接
+    if arrays:
+        summary = pc.binary_join_element_wise(*arrays, pa.scalar('', pa.large_string()),
+                                              null_handling='replace', null_replacement='')
+    else:
+        summary = pa.array([''] * n_rows, pa.large_string())
+
+    # 块: (行号, 块 id)，按行、列顺序、列内位置排列
+    id_cols = [block_id_col(col) for col in cols]
+    remaps = block_id_remaps or {}
+    if cols and all(id_col in df.columns and id_col in remaps for id_col in id_cols):
+        rows, block_ids = _block_ids_from_lists(df, id_cols, remaps, block_store)
+    else:
+        rows, block_ids = _block_ids_from_text(arrays, block_store, stats)
+
+    # 行内去重 (v7 的 dict.fromkeys: 保留首次出现)
+    keep = _first_in_row(rows, block_ids)
+    if stats is not None:
+        stats.blocks_total += len(block_ids)
+        stats.blocks_duplicate += len(block_ids) - int(keep.sum())
+        stats.add_rows(np.bincount(rows[keep], minlength=n_rows))
+    rows, block_ids = rows[keep], block_ids[keep]
+    counted = block_ids # 跨类型去重前的块 (按出现次数统计分类号)
+    if dedup_canonical and len(block_ids):
+        # 行内规范类相同的块只保留第一个 (仍是本行自己的块 id，见 _canonical_row_ids)
+        distinct, inverse = np.unique(block_ids, return_inverse=True)
+        keep = _first_in_row(rows, block_store.canonical_classes(distinct)[inverse])
+        if stats is not None:
+            stats.blocks_canonical_merged += len(block_ids) - int(keep.sum())
+        rows, block_ids = rows[keep], block_ids[keep]
+
+    # 按块 id 取值 (没有可解析分类号的块不参与计分)，四个列表列共用偏移
+    typed = block_store.typed_columns()
+    if stats is not None:
+        stats.add_code_counts(typed['codes'][counted], typed['codes_no_main_group'][counted])
+    valid = typed['valid'][block_ids]
+    rows, block_ids = rows[valid], block_ids[valid]
+    offsets = pa.array(np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_rows))]).astype(np.int32))
+
+    # 方法3: 各行的大组计数 (每行一个 dict)
+    entry_rows, main_groups, counts = block_store.main_group_entries(rows, block_ids)
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(entry_rows, minlength=n_rows))]).tolist()
+    main_group_counts = [dict(zip(main_groups[bounds[r]:bounds[r + 1]], counts[bounds[r]:bounds[r + 1]]))
+                         for r in tqdm(range(n_rows), desc=desc, total=n_rows)]
+
+    df_out = df.copy(deep=False)
+    df_out[summary_col_name] = pd.Series(pd.arrays.ArrowStringArray(summary), index=df.index)
+    for col, (name, dtype) in RAGGED_LIST_COLS.items():
+        ragged = pa.ListArray.from_arrays(offsets, pa.array(typed[name][block_ids].astype(dtype)))
+        df_out[col] = pd.Series(pd.arrays.ArrowExtensionArray(ragged), index=df.index)
+    df_out['方法3-专利大组分类计数'] = pd.Series(main_group_counts, index=df.index, dtype=object)
+    return df_out
 
 # --- 辅助函数: 加载数据 (v6 新增) ---
-def load_data(file_path):
+def load_data(file_path, report=None, corpus_dir=None, checkpoint=None):
     """
     加载 Excel 或 CSV 文件，带错误处理。
+    (v8) report: 可选的 RunReport，记录加载阶段的耗时和内存。
+    (v8) corpus_dir: 已编译语料目录。语料存在且未过期时直接用 memmap 打开，不再读取原文件；
+         否则读取原文件后编译一次。返回的 DataFrame 在 attrs['patent_corpora'] 中记录语料路径，
+         run_processing_task 据此把已解析的块放入块库。安装了 pyarrow 时每个专利数据列附带块 id 列
+         (见 block_id_col，attrs['block_id_corpora'] 记录各块 id 列所属的语料)，处理时不再从文本中提取块。
+    (v8) checkpoint: 检查点 (CheckpointStore)。规范化后的输入保存为检查点，--resume 时源文件未变则直接恢复。
+         语料模式下语料本身就是持久化的加载结果，不再另存检查点。
     """
     print(f"\n开始加载文件: {file_path}")
     if not os.path.exists(file_path):
@@ -142,23 +731,238 @@ def load_data(file_path):
         
     start_time = time.time()
     df = None
-    try:
-        df = pd.read_excel(file_path)
-    except Exception as e_excel:
-        print(f"读取Excel失败: {e_excel}")
-        try:
-            df = pd.read_csv(file_path)
-            print("...检测到CSV，成功加载CSV文件。")
-        except Exception as e_csv:
-            print(f"读取CSV也失败: {e_csv}")
-            print("请检查文件格式是否正确。")
+    checkpoint_unit = f"load-{os.path.basename(file_path)}"
+    checkpoint_fp = None
+    if checkpoint is not None and not corpus_dir:
+        checkpoint_fp = fingerprint_of({'source': source_signature(file_path), 'version': PROCESSING_VERSION})
+        df = checkpoint.load(checkpoint_unit, checkpoint_fp)
+        if df is not None:
+            print(f"♻️ 检查点: 恢复已加载的输入 ({len(df)} 行)，跳过读取。")
+            return df
+    corpus_file = corpus_path(file_path, corpus_dir) if corpus_dir else None
+    if corpus_file:
+        with stage(report, 'corpus_open', file=os.path.basename(file_path)) as timer:
+            corpus = open_corpus(corpus_file, file_path, PROCESSING_VERSION)
+            if corpus is not None:
+                df = corpus.to_frame()
+                timer.counts['rows'] = len(df)
+                timer.counts['blocks'] = corpus.n_blocks
+        if df is not None:
+            print(f"⚡ 从已编译语料加载: {corpus_file}")
+
+    if df is None:
+        with stage(report, 'load', file=os.path.basename(file_path)) as timer:
+            try:
+                df = pd.read_excel(file_path)
+            except Exception as e_excel:
+                print(f"读取Excel失败: {e_excel}")
+                try:
+                    df = pd.read_csv(file_path)
+                    print("...检测到CSV，成功加载CSV文件。")
+                except Exception as e_csv:
+                    print(f"读取CSV也失败: {e_csv}")
+                    print("请检查文件格式是否正确。")
+            if df is not None:
+                timer.counts['rows'] = len(df)
+                timer.counts['columns'] = len(df.columns)
+        if df is None:
             return None
 
+        if corpus_file:
+            with stage(report, 'corpus_compile', file=os.path.basename(file_path)) as timer:
+                data_cols = [c for c in df.columns if PATENT_DATA_COL_RE.fullmatch(str(c))]
+                info = compile_corpus(df, data_cols, corpus_file, extract_patent_parts, PROCESSING_VERSION,
+                                      source_path=file_path)
+                timer.counts.update(info)
+            print(f"🗜️ 已编译语料: {corpus_file} ({info['blocks']} 个不同的块, {info['codes']} 个分类号)")
+
     load_time = time.time()
     print(f"文件加载完毕，耗时: {load_time - start_time:.2f} 秒。共 {len(df)} 行数据。")
+
+    # v8: 键列规范化 (分组/筛选/合并都在紧凑的类型上进行)
+    with stage(report, 'normalize_keys', file=os.path.basename(file_path)) as timer:
+        memory_before = df.memory_usage(deep=True).sum()
+        df = to_arrow_strings(normalize_keys(df)) # v8: 专利文本列为 Arrow 字符串
+        memory_after = df.memory_usage(deep=True).sum()
+        timer.counts['rows'] = len(df)
+        timer.counts['memory_before_mb'] = round(memory_before / 1024 ** 2, 2)
+        timer.counts['memory_after_mb'] = round(memory_after / 1024 ** 2, 2)
+    print(f"键列规范化完成，内存占用 {memory_before / 1024 ** 2:.1f} MB -> {memory_after / 1024 ** 2:.1f} MB。")
+    if corpus_file:
+        df.attrs['patent_corpora'] = [corpus_file]
+        df.attrs['block_id_corpora'] = _add_block_id_columns(df, corpus_file)
+    if checkpoint_fp is not None:
+        with stage(report, 'checkpoint_save', file=os.path.basename(file_path)) as timer:
+            checkpoint.save(checkpoint_unit, checkpoint_fp, df)
+            timer.counts['rows'] = len(df)
+    return df
+
+def _add_block_id_columns(df, corpus_file):
+    """
+    (v8) 语料模式: 给 df 的各专利数据列添加块 id 列 (由语料的 cell_block_offsets/ids 构造，不读取文本)。
+    返回 {块 id 列: 语料路径}。未安装 pyarrow、语料打不开，或有单元格的块跨越行边界时
+    (见 patent_corpus._has_dangling_brace，分组拼接后的文本与逐单元格的块不一致) 不添加，照常从文本中提取块。
+    """
+    corpus = open_corpus(corpus_file) if pa is not None else None
+    if corpus is None or not corpus.block_ids_exact:
+        return {}
+    block_id_corpora = {}
+    for col in corpus.meta['data_cols']:
+        if col in df.columns:
+            lists = corpus.block_id_lists(col)
+            df[block_id_col(col)] = pd.Series(pd.arrays.ArrowExtensionArray(lists), index=df.index)
+            block_id_corpora[block_id_col(col)] = corpus_file
+    return block_id_corpora
+
+# --- 辅助函数: 键列规范化 (v8 新增) ---
+def normalize_keys(df):
+    """
+    规范化 股票代码 / 会计年度 / 公司类型 三个键列 (缺少的列跳过):
+    - 股票代码: 6 位补零的字符串 (Excel 读入为整数时丢失的前导零补回，
+      '600000.0' 之类的浮点写法还原; 非纯数字的代码只去掉首尾空白)
+    - 会计年度: 整数 (有缺失值时为可空整数 Int64; 含非数字内容时保持原样)
+    - 公司类型: 分类类型 (categorical)，== 筛选只比较整数编码
+    """
+    df = df.copy()
+    if '股票代码' in df.columns:
+        raw = df['股票代码']
+        missing = raw.isna()
+        if pd.api.types.is_numeric_dtype(raw):
+            text = raw.fillna(0).astype('int64').astype(str)
+        else:
+            text = raw.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+        is_digits = text.str.fullmatch(r'\d{1,6}')
+        text = text.where(~is_digits, text.str.zfill(6))
+        df['股票代码'] = text.where(~missing, None)
+
+    if '会计年度' in df.columns and not pd.api.types.is_integer_dtype(df['会计年度']):
+        years = pd.to_numeric(df['会计年度'], errors='coerce')
+        if years.isna().sum() > df['会计年度'].isna().sum():
+            print("⚠️ 警告: '会计年度' 列含有非数字内容，保持原样。")
+        elif years.isna().any():
+            df['会计年度'] = years.astype('Int64')
+        else:
+            df['会计年度'] = years.astype('int64')
+
+    if '公司类型' in df.columns:
+        df['公司类型'] = df['公司类型'].astype('category')
     return df
 
-# --- 核心函数3: 专利处理流水线 (v6 重构, v7 无需修改) ---
+# --- 辅助函数: 统计已计分的专利块数 (v8 新增, 用于运行报告) ---
+def _count_scored_blocks(df_processed):
+    """各行 '方法2-专利质量列表' 的长度之和，即实际参与计分的专利块数。"""
+    if '方法2-专利质量列表' not in df_processed.columns:
+        return 0
+    column = df_processed['方法2-专利质量列表']
+    if isinstance(column.dtype, pd.ArrowDtype): # v8 紧凑存储: 直接取偏移数组计算
+        return int(pc.sum(pc.list_value_length(pa.array(column.array))).as_py() or 0)
+    return int(column.map(len).sum())
+
+# --- 辅助函数: 内存预算与自动分块 (v8 新增) ---
+# 逐行处理 (apply axis=1) 的结果是由逐行 Series 拼成的全宽 object 表，再加上新增的列表/字典/汇总列，
+# 峰值是输入行的数倍。设置内存预算时，按每行的块数、分类号数和文本长度估计处理峰值，
+# 把行切成若干连续块依次处理，每块处理完立即删除原始专利列，只保留窄的结果。
+# 块库 (BlockStore) 在整个任务期间保留: 已有的块在进程内存中，处理本表时新增的块按块数 × 新块比例估计。
+# 以下常数是 CPython 上的粗略估计，宁可偏大 (多切几块) 也不要超出预算。
+BYTES_PER_CELL = 64           # object 单元格: 指针 + 小对象
+BYTES_PER_BLOCK = 4 * 40 + 16 # 4 个结果列表各一个数值 (指针 + float/int 对象) + 块库 id
+BYTES_PER_BLOCK_TYPED = 4 + 2 + 2 + 4 + 16 # 紧凑存储 (float32/uint16/uint16/float32) + 块库 id
+BYTES_PER_CODE = 120          # 方法3 计数字典的一项
+BYTES_PER_STORED_BLOCK = 640  # 块库中的一个块: 文本键 + 值元组 + 分类号计数 + 紧凑数组 (实测约 610 字节)
+APPLY_BLOWUP = 3              # apply 逐行 Series 与结果表相对输入行的放大倍数
+
+def estimate_row_bytes(df, patent_cols, drop_cols, new_block_ratio=0.0):
+    """
+    估计每行的内存 (字节)，返回两个与 df 行对齐的 Series:
+    - 处理峰值: 逐行处理该行时的临时占用
+    - 保留: 去掉 drop_cols 之后留在结果表中的占用，加上该行的新块在块库中的占用
+      (块数 × new_block_ratio，见 BlockStore.new_block_ratio)
+    """
+    text_bytes = pd.Series(0, index=df.index)
+    blocks = pd.Series(0, index=df.index)
+    codes = pd.Series(0, index=df.index)
+    for col in patent_cols:
+        text = df[col].fillna('').astype(str)
+        text_bytes += text.str.len() * 3 # UTF-8 中文约 3 字节
+        n_blocks = text.str.count(r'\{')
+        blocks += n_blocks
+        codes += text.str.count(';') + n_blocks
+    n_kept = len(df.columns) - len([c for c in drop_cols if c in df.columns]) + 7 # 新增 7 列
+    bytes_per_block = BYTES_PER_BLOCK if pa is None else BYTES_PER_BLOCK_TYPED
+    results = blocks * bytes_per_block + codes * BYTES_PER_CODE + text_bytes # 列表、计数字典、汇总字符串
+    peak = APPLY_BLOWUP * (len(df.columns) * BYTES_PER_CELL + text_bytes) + results
+    kept = n_kept * BYTES_PER_CELL + results + blocks * (new_block_ratio * BYTES_PER_STORED_BLOCK)
+    return peak, kept
+
+def plan_row_chunks(df, patent_cols, drop_cols, memory_budget, label="", block_store=None):
+    """
+    按内存预算把 df 的行切成连续块，返回 [(起始行, 结束行), ...]。
+    可用于处理的内存 = 预算 - 当前占用 - 全部结果的保留占用 (含块库的增长); 每块的处理峰值之和不超过它。
+    当前占用 = 进程基础内存 (BASE_RSS_MB) + df 的内存 + 块库块数 × 每块字节数，即本任务实际占用的内存。
+    块最小可以只有 1 行; 连 1 行都放不下时打印警告并按每块 1 行处理 (内存占用最低，但可能超出预算)。
+    """
+    if len(df) == 0:
+        return []
+    store_blocks = len(block_store) if block_store is not None else 0
+    new_block_ratio = block_store.new_block_ratio() if block_store is not None else 1.0
+    peak, kept = estimate_row_bytes(df, patent_cols, drop_cols, new_block_ratio)
+    store_bytes = store_blocks * BYTES_PER_STORED_BLOCK
+    current = (BASE_RSS_MB or 0) * 1024 ** 2 + df.memory_usage(deep=True).sum() + store_bytes
+    available = memory_budget - current - kept.sum()
+    if available < peak.max():
+        print(f"⚠️ [{label}] 内存预算不足: 当前 {current / 1024 ** 2:.0f} MB (其中块库 {store_blocks} 个块约 "
+              f"{store_bytes / 1024 ** 2:.0f} MB) + 结果约 {kept.sum() / 1024 ** 2:.0f} MB，"
+              f"单行处理峰值至多 {peak.max() / 1024 ** 2:.1f} MB，超出预算 {memory_budget / 1024 ** 2:.0f} MB。"
+              f"改为每块 1 行处理 ({len(df)} 块)，实际内存可能超出预算。")
+        return [(i, i + 1) for i in range(len(df))]
+    cumulative = peak.cumsum().to_numpy()
+    chunks = []
+    lo = 0
+    while lo < len(df):
+        base = cumulative[lo - 1] if lo > 0 else 0
+        hi = int(cumulative.searchsorted(base + available, side='right'))
+        hi = min(max(hi, lo + 1), len(df))
+        chunks.append((lo, hi))
+        lo = hi
+    print(f"🧮 [{label}] 内存预算 {memory_budget / 1024 ** 2:.0f} MB: 当前 {current / 1024 ** 2:.0f} MB "
+          f"(块库 {store_blocks} 个块约 {store_bytes / 1024 ** 2:.0f} MB, 新块比例 {new_block_ratio:.0%}), "
+          f"估计每行峰值 {peak.mean() / 1024:.1f} KB / 保留 {kept.mean() / 1024:.1f} KB -> "
+          f"分 {len(chunks)} 块处理 (每块至多 {max(end - start for start, end in chunks)} 行)")
+    return chunks
+
+def process_rows(df_in, patent_cols, summary_col_name, stats=None, block_store=None, dedup_canonical=False,
+                 memory_budget=None, drop_cols=(), label="", block_id_remaps=None):
+    """
+    (v8) 对 df_in 逐行执行 process_row (安装了 pyarrow 时用等价的按列实现 process_frame_arrow)。
+    memory_budget 为 None 时整表一次 apply (原行为); 否则按 plan_row_chunks 分块处理，
+    每块处理完立即去掉 drop_cols (原始专利列和计数列)，最后拼接。返回 (结果表, 块数)。
+    block_id_remaps: 语料模式下块 id 列的映射 (见 process_frame_arrow)，逐行处理时不使用。
+    """
+    if block_store is None:
+        block_store = BlockStore() # 各块共用
+    row_kwargs = dict(patent_cols=patent_cols, summary_col_name=summary_col_name, stats=stats,
+                      block_store=block_store, dedup_canonical=dedup_canonical)
+
+    def process(df_part):
+        # (v8) 安装了 pyarrow 时按列处理 (见 process_frame_arrow)，否则逐行 apply
+        if pa is not None:
+            return process_frame_arrow(df_part, desc=label, block_id_remaps=block_id_remaps, **row_kwargs)
+        return df_part.progress_apply(process_row, axis=1, **row_kwargs)
+
+    chunks = plan_row_chunks(df_in, patent_cols, drop_cols, memory_budget, label, block_store) if memory_budget else []
+    if len(chunks) <= 1:
+        df_out = process(df_in)
+        if memory_budget:
+            df_out = df_out.drop(columns=list(drop_cols), errors='ignore')
+        return df_out, 1
+    parts = []
+    for lo, hi in chunks:
+        part = process(df_in.iloc[lo:hi])
+        parts.append(part.drop(columns=list(drop_cols), errors='ignore'))
+        del part
+    return pd.concat(parts), len(chunks)
+
+# --- 核心函数3: 专利处理流水线 (v6 重构, v8 后台导出) ---
 def run_processing_task(
     input_df, 
     data_prefixes, 
@@ -166,7 +970,16 @@ def run_processing_task(
     summary_col_name, 
     output_merged_excel, 
     output_listed_excel,
-    task_name=""):
+    task_name="",
+    exporter=None,
+    long_format=False,
+    cache=None,
+    report=None,
+    metrics=None,
+    dedup_cross_kind=False,
+    checkpoint=None,
+    memory_budget=None,
+    block_store=None):
     """
     (v6 重构): 这是一个通用的处理函数，取代了 v5 的 main 函数。
     
@@ -178,6 +991,22 @@ def run_processing_task(
     - output_merged_excel (str): 分支1 (合并) 的输出路径
     - output_listed_excel (str): 分支2 (仅上市公司) 的输出路径
     - task_name (str): 用于打印日志的任务名称
+    - exporter (ExcelExportQueue): (v8) 后台导出队列。传入时结果表交给队列后立即返回，
+      由调用方统一等待写入完成；为 None 时在本任务内部创建队列，并在任务结束前等待写完。
+    - long_format (bool): (v8) 长表输出模式。方法3计数另存为长表 csv，
+      汇总列替换为指向压缩存储 (sqlite) 的引用，主结果表只保留标量和列表列。
+    - cache (StageCache): (v8) 阶段结果缓存。输入数据与参数完全相同时直接复用
+      已有结果 (可跨快照共享)，跳过对应分支的计算。
+    - report (RunReport): (v8) 运行报告，记录分组合并、逐行处理、列清理、导出等阶段
+    - metrics (LiveMetrics): (v8) 实时指标，逐行处理期间定期写出进度、速度、ETA 和内存
+    - dedup_cross_kind (bool): (v8) 跨类型去重。规范形式 (解析出的大组) 相同的块 (一案双申的发明/实用新型) 在行内只计一次，
+      用于 发明&实用 任务
+    - checkpoint (CheckpointStore): (v8) 运行检查点。每个分支算完后保存结果、导出成功后标记完成;
+      --resume 时已导出的分支直接跳过，已算完但未导出的分支从检查点恢复后重新导出
+    - memory_budget (int): (v8) 本进程的内存预算 (字节)。逐行处理按估计的每行内存自动分块，
+      不再复制整份输入，中间表用完即释放，每个分支导出完成后才开始下一个分支
+    - block_store (BlockStore): (v8) 本次运行的专利块库，同一运行中的各任务传入同一个以复用已计分的块;
+      为 None 时使用只属于本任务的块库，任务结束即释放
     """
     
     print("\n" + "#"*60)
@@ -199,15 +1028,109 @@ def run_processing_task(
     # 确保列存在，忽略不存在的列
     existing_patent_data_cols = [col for col in patent_data_cols if col in input_df.columns]
     existing_patent_count_cols = [col for col in patent_count_cols if col in input_df.columns]
-    cols_to_drop = existing_patent_data_cols + existing_patent_count_cols
+    # v8: 语料模式下专利数据列附带的块 id 列 (见 load_data)，与专利数据列一起合并、清理
+    existing_block_id_cols = [block_id_col(col) for col in existing_patent_data_cols
+                              if block_id_col(col) in input_df.columns]
+    cols_to_drop = existing_patent_data_cols + existing_patent_count_cols + existing_block_id_cols
     
     print(f"将处理 {len(existing_patent_data_cols)} 个专利数据列 (前缀: {data_prefixes})")
     print(f"将聚合/移除 {len(existing_patent_count_cols)} 个专利计数列 (前缀: {count_prefixes})")
 
-    df = input_df.copy() # 确保操作的是副本
+    # 确保操作的是副本 (v8: 内存预算模式下不复制 —— 下面只读取输入，不修改)
+    df = input_df if memory_budget else input_df.copy()
+
+    # v8: 结果表交给后台写入，写入期间继续下一个分支的计算
+    own_exporter = exporter is None
+    if own_exporter:
+        exporter = ExcelExportQueue(report=report)
+
+    # v8: 按 (输入数据, 参数, 分支) 查询阶段缓存，命中的分支直接恢复结果; 检查点使用同样的指纹
+    cache_keys = {}
+    cache_hits = {}
+    checkpoint_keys = {}
+    if cache is not None or checkpoint is not None:
+        with stage(report, 'cache_fingerprint', task=task_name) as timer:
+            data_fingerprint = fingerprint_frame(without_block_ids(input_df)) # 与非语料模式的键相同
+            timer.counts['rows'] = len(input_df)
+        for branch, output_path in (('分支1', output_merged_excel), ('分支2', output_listed_excel)):
+            params = {
+                'version': PROCESSING_VERSION,
+                'data_prefixes': data_prefixes,
+                'count_prefixes': count_prefixes,
+                'summary_col_name': summary_col_name,
+                'long_format': long_format,
+                # 长表模式下主表中的引用包含文件名，不同文件名不能共用结果
+                'output_name': os.path.basename(output_path) if long_format else None,
+                # 有 pyarrow 时按列处理，列表列的质量值为 float32; 否则逐行 apply，质量值为 float64。两者结果不能混用
+                'engine': 'arrow' if pa is not None else 'pandas',
+                'value_dtype': 'float32' if pa is not None else 'float64',
+            }
+            if dedup_cross_kind:
+                # 只在开启时加入，已有缓存的键保持不变; 'v2': 按解析出的大组判断 (与最初按文本判断的结果不同)
+                params['dedup_cross_kind'] = 'v2'
+            if checkpoint is not None:
+                checkpoint_keys[branch] = fingerprint_of(
+                    {'params': params, 'data': data_fingerprint, 'output_path': output_path})
+            if cache is None:
+                continue
+            cache_keys[branch] = cache.make_key(f'01-{branch}', params, data_fingerprint)
+            cache_hits[branch] = cache.restore(cache_keys[branch], output_path)
+            if cache_hits[branch]:
+                print(f"♻️ [{task_name}-{branch}] 命中缓存，已恢复结果到: {output_path}")
+
+    def on_exported(branch, output_path):
+        """返回写入成功后的回调: 结果存入缓存、检查点标记为已导出 (都未启用时返回 None)。"""
+        callbacks = []
+        if cache is not None:
+            callbacks.append(lambda: cache.store(cache_keys[branch], output_path, stage=f'01-{branch}'))
+        if checkpoint is not None:
+            callbacks.append(lambda: checkpoint.mark(f"{task_name}-{branch}", checkpoint_keys[branch], exported=True))
+        if not callbacks:
+            return None
+        return lambda: [callback() for callback in callbacks]
+
+    def resume_branch(branch, output_path):
+        """
+        (v8) 检查点恢复: 分支已导出且输出文件还在时跳过; 已算完但未导出时把检查点中的结果重新交给导出队列。
+        返回该分支是否已处理 (False 时照常计算)。
+        """
+        if checkpoint is None:
+            return False
+        unit = f"{task_name}-{branch}"
+        state = checkpoint.status(unit, checkpoint_keys[branch])
+        if state is None:
+            return False
+        if state.get('exported') and os.path.exists(output_path):
+            print(f"♻️ [{unit}] 检查点: 已导出到 {output_path}")
+            return True
+        df_done = checkpoint.load(unit, checkpoint_keys[branch])
+        if df_done is None:
+            return False
+        print(f"♻️ [{unit}] 检查点: 恢复已计算的结果 ({len(df_done)} 行)，重新导出。")
+        exporter.submit(df_done, output_path, label=unit, on_success=on_exported(branch, output_path))
+        return True
+
+    def save_checkpoint(branch, df_processed):
+        if checkpoint is None:
+            return
+        with stage(report, 'checkpoint_save', task=task_name, branch=branch) as timer:
+            checkpoint.save(f"{task_name}-{branch}", checkpoint_keys[branch], df_processed)
+            timer.counts['rows'] = len(df_processed)
 
     # --- 定义列组 ---
     group_keys = ['股票代码', '会计年度']
+    # v8: 两个分支 (以及同一运行中传入同一块库的其他任务) 共用一个块库，同一块只计分一次
+    if block_store is None:
+        block_store = BlockStore()
+    for path in input_df.attrs.get('patent_corpora', []):
+        corpus = open_corpus(path)
+        if corpus is not None:
+            with stage(report, 'corpus_blocks', task=task_name) as timer:
+                timer.counts['blocks'] = block_store.load_corpus(corpus)
+    # 块 id 列 -> 语料内块号到块库 id 的映射 (语料未能载入的列不在其中，照常从文本中提取块)
+    block_id_remaps = {col: block_store.corpus_remaps[path]
+                       for col, path in input_df.attrs.get('block_id_corpora', {}).items()
+                       if col in existing_block_id_cols and block_store.corpus_remaps.get(path) is not None}
     
     # 辅助函数：用于合并专利字符串
     def join_strings(series):
@@ -220,46 +1143,82 @@ def run_processing_task(
     print(f"[{task_name}] --- 开始处理: 1. 上市公司 & 子公司 (合并) ---")
     print("="*50)
 
-    # 找到所有其他需要保留的列（例如 '申请时间'），并取第一个值
-    agg_cols = existing_patent_data_cols + existing_patent_count_cols
-    other_cols = [col for col in df.columns if col not in group_keys and col not in agg_cols]
-
-    # 定义聚合规则
-    agg_funcs = {}
-    for col in existing_patent_data_cols:
-        agg_funcs[col] = join_strings  # 合并专利字符串
-    for col in existing_patent_count_cols:
-        agg_funcs[col] = 'sum'       # 合计专利数量
-    for col in other_cols:
-        if col in df.columns:
-            agg_funcs[col] = 'first' # 其他列取第一个值
+    if cache_hits.get('分支1'):
+        print("分支1 已从缓存恢复，跳过计算。")
+    elif resume_branch('分支1', output_merged_excel):
+        print("分支1 已从检查点恢复，跳过计算。")
+    else:
+        # 找到所有其他需要保留的列（例如 '申请时间'），并取第一个值
+        agg_cols = existing_patent_data_cols + existing_patent_count_cols + existing_block_id_cols
+        other_cols = [col for col in df.columns if col not in group_keys and col not in agg_cols]
+
+        # 定义聚合规则
+        agg_funcs = {}
+        for col in existing_patent_data_cols:
+            # 合并专利字符串 (v8: Arrow 字符串列用内置的 sum 在 Arrow 内核中拼接，结果与 join_strings 相同)
+            agg_funcs[col] = 'sum' if pa is not None and is_arrow_string(df[col]) else join_strings
+        for col in existing_patent_count_cols:
+            agg_funcs[col] = 'sum'       # 合计专利数量
+        for col in other_cols:
+            if col in df.columns:
+                agg_funcs[col] = 'first' # 其他列取第一个值
     
-    print("正在按 '股票代码' 和 '会计年度' 合并数据...")
-    df_merged = df.groupby(group_keys, as_index=False).agg(agg_funcs)
+        print("正在按 '股票代码' 和 '会计年度' 合并数据...")
+        with stage(report, 'groupby_merge', task=task_name, branch='分支1') as timer:
+            # observed=True: 键列为分类类型时只保留实际出现的组合
+            df_merged = df.groupby(group_keys, as_index=False, observed=True).agg(agg_funcs)
+            for col, lists in merge_block_id_lists(df, group_keys, existing_block_id_cols).items():
+                df_merged[col] = pd.Series(pd.arrays.ArrowExtensionArray(lists), index=df_merged.index)
+            timer.counts['rows_in'] = len(df)
+            timer.counts['rows'] = len(df_merged)
     
-    # 手动设置 '公司类型' 为新值
-    df_merged['公司类型'] = '上市公司及其子公司'
-    print(f"合并完成，共 {len(df_merged)} 行。")
-
-    # 对合并后的数据运行处理
-    tqdm.pandas(desc=f"[{task_name}-分支1] 处理合并数据")
-    df_merged_processed = df_merged.progress_apply(
-        process_row, 
-        axis=1, 
-        patent_cols=existing_patent_data_cols, # 传入参数
-        summary_col_name=summary_col_name       # 传入参数
-    )
+        # 手动设置 '公司类型' 为新值
+        df_merged['公司类型'] = '上市公司及其子公司'
+        print(f"合并完成，共 {len(df_merged)} 行。")
 
-    # 清理合并后的数据
-    print("清理 [分支1] 的原始列...")
-    df_merged_processed = df_merged_processed.drop(columns=cols_to_drop, errors='ignore')
+        # 对合并后的数据运行处理
+        tqdm.pandas(desc=f"[{task_name}-分支1] 处理合并数据")
+        stats = ProcessingStats()
+        with stage(report, 'process_rows', task=task_name, branch='分支1') as timer, \
+                track(metrics, 'process_rows', len(df_merged), stats, task=task_name, branch='分支1'):
+            df_merged_processed, n_chunks = process_rows(
+                df_merged,
+                patent_cols=existing_patent_data_cols, # 传入参数
+                summary_col_name=summary_col_name,      # 传入参数
+                stats=stats,
+                block_store=block_store,
+                dedup_canonical=dedup_cross_kind,
+                memory_budget=memory_budget,
+                drop_cols=cols_to_drop,
+                label=f"{task_name}-分支1",
+                block_id_remaps=block_id_remaps
+            )
+            timer.counts['rows'] = len(df_merged_processed)
+            timer.counts['chunks'] = n_chunks
+            timer.counts['blocks'] = _count_scored_blocks(df_merged_processed)
+            timer.counts.update(stats.to_counts())
+            timer.counts['block_store_size'] = len(block_store)
+        print(f"📊 [{task_name}-分支1] 数据形态: {stats.summary()}; 块库累计 {len(block_store)} 个不同的块")
+        if dedup_cross_kind:
+            print(f"🔗 [{task_name}-分支1] 跨类型去重: 合并了 {stats.blocks_canonical_merged} 个规范形式相同的块")
+        del df_merged # 合并后的全宽表不再需要
 
-    # 保存合并后的数据
-    try:
-        df_merged_processed.to_excel(output_merged_excel, index=False)
-        print(f"✅ [{task_name}-分支1] 已保存合并后结果到: {output_merged_excel}")
-    except Exception as e_save_merged:
-        print(f"❌ [{task_name}-分支1] 保存合并后文件失败: {e_save_merged}")
+        # 清理合并后的数据
+        print("清理 [分支1] 的原始列...")
+        with stage(report, 'drop_columns', task=task_name, branch='分支1') as timer:
+            df_merged_processed = df_merged_processed.drop(columns=cols_to_drop, errors='ignore')
+            if long_format:
+                print("长表模式: 拆分 [分支1] 的方法3计数和汇总列...")
+                df_merged_processed = split_long_format(df_merged_processed, summary_col_name, output_merged_excel)
+            timer.counts['rows'] = len(df_merged_processed)
+
+        # 保存合并后的数据 (v8: 先存检查点; 后台写入，不阻塞分支2)
+        save_checkpoint('分支1', df_merged_processed)
+        exporter.submit(df_merged_processed, output_merged_excel, label=f"{task_name}-分支1",
+                        on_success=on_exported('分支1', output_merged_excel))
+        del df_merged_processed
+        if memory_budget:
+            exporter.flush() # 内存预算模式: 结果表写完释放后再开始分支2
 
     # --------------------------------------------------
     # --- 分支 2: 仅 "上市公司本身" ---
@@ -269,41 +1228,298 @@ def run_processing_task(
     print("="*50)
     
     # 筛选数据
-    df_listed_only = df[df['公司类型'] == '上市公司本身'].copy()
+    with stage(report, 'filter_listed', task=task_name, branch='分支2') as timer:
+        df_listed_only = df[df['公司类型'] == '上市公司本身'] # 布尔筛选已是新表，无需再 copy
+        timer.counts['rows_in'] = len(df)
+        timer.counts['rows'] = len(df_listed_only)
     
-    if len(df_listed_only) == 0:
+    if cache_hits.get('分支2'):
+        print("分支2 已从缓存恢复，跳过计算。")
+    elif len(df_listed_only) > 0 and resume_branch('分支2', output_listed_excel):
+        print("分支2 已从检查点恢复，跳过计算。")
+    elif len(df_listed_only) == 0:
         print("⚠️ 警告: 未在数据中找到 '公司类型' == '上市公司本身' 的行。跳过 [分支2]。")
     else:
         print(f"已筛选 '上市公司本身' 数据，共 {len(df_listed_only)} 行。")
 
         # 对筛选后的数据运行处理
         tqdm.pandas(desc=f"[{task_name}-分支2] 处理'上市公司本身'数据")
-        df_listed_processed = df_listed_only.progress_apply(
-            process_row, 
-            axis=1, 
-            patent_cols=existing_patent_data_cols, # 传入参数
-            summary_col_name=summary_col_name       # 传入参数
-        )
+        stats = ProcessingStats()
+        with stage(report, 'process_rows', task=task_name, branch='分支2') as timer, \
+                track(metrics, 'process_rows', len(df_listed_only), stats, task=task_name, branch='分支2'):
+            df_listed_processed, n_chunks = process_rows(
+                df_listed_only,
+                patent_cols=existing_patent_data_cols, # 传入参数
+                summary_col_name=summary_col_name,      # 传入参数
+                stats=stats,
+                block_store=block_store,
+                dedup_canonical=dedup_cross_kind,
+                memory_budget=memory_budget,
+                drop_cols=cols_to_drop,
+                label=f"{task_name}-分支2",
+                block_id_remaps=block_id_remaps
+            )
+            timer.counts['rows'] = len(df_listed_processed)
+            timer.counts['chunks'] = n_chunks
+            timer.counts['blocks'] = _count_scored_blocks(df_listed_processed)
+            timer.counts.update(stats.to_counts())
+            timer.counts['block_store_size'] = len(block_store)
+        print(f"📊 [{task_name}-分支2] 数据形态: {stats.summary()}; 块库累计 {len(block_store)} 个不同的块")
+        if dedup_cross_kind:
+            print(f"🔗 [{task_name}-分支2] 跨类型去重: 合并了 {stats.blocks_canonical_merged} 个规范形式相同的块")
+        del df_listed_only
 
         # 清理筛选后的数据
         print("清理 [分支2] 的原始列...")
-        df_listed_processed = df_listed_processed.drop(columns=cols_to_drop, errors='ignore')
+        with stage(report, 'drop_columns', task=task_name, branch='分支2') as timer:
+            df_listed_processed = df_listed_processed.drop(columns=cols_to_drop, errors='ignore')
+            if long_format:
+                print("长表模式: 拆分 [分支2] 的方法3计数和汇总列...")
+                df_listed_processed = split_long_format(df_listed_processed, summary_col_name, output_listed_excel)
+            timer.counts['rows'] = len(df_listed_processed)
 
-        # 保存筛选后的数据
-        try:
-            df_listed_processed.to_excel(output_listed_excel, index=False)
-            print(f"✅ [{task_name}-分支2] 已保存 '上市公司本身' 结果到: {output_listed_excel}")
-        except Exception as e_save_listed:
-            print(f"❌ [{task_name}-分支2] 保存 '上市公司本身' 文件失败: {e_save_listed}")
+        # 保存筛选后的数据 (v8: 先存检查点; 后台写入，不阻塞下一个任务)
+        save_checkpoint('分支2', df_listed_processed)
+        exporter.submit(df_listed_processed, output_listed_excel, label=f"{task_name}-分支2",
+                        on_success=on_exported('分支2', output_listed_excel))
+        del df_listed_processed
+        if memory_budget:
+            exporter.flush() # 内存预算模式: 结果表写完释放后再开始下一个任务
+
+    if own_exporter:
+        exporter.close()
+
+# --- 辅助函数: 分支1 合并块 id 列 (v8 新增) ---
+def merge_block_id_lists(df, group_keys, id_cols):
+    """
+    分支1 的分组合并中块 id 列的聚合: 同组各行的块 id 列表按行顺序拼接 (与专利字符串的拼接对应)。
+    组的顺序与 df.groupby(group_keys, observed=True).agg(...) 的结果相同，键含缺失值的行与 groupby 一样丢弃。
+    返回 {列: Arrow 列表数组}。
+    """
+    if not id_cols:
+        return {}
+    group = df.groupby(group_keys, observed=True).ngroup().to_numpy(dtype=np.float64, na_value=np.nan)
+    n_groups = int(np.nanmax(group)) + 1 if np.isfinite(group).any() else 0
+    merged = {}
+    for col in id_cols:
+        lists = pa.array(df[col].array)
+        if isinstance(lists, pa.ChunkedArray):
+            lists = lists.combine_chunks()
+        values = lists.flatten().to_numpy()
+        value_group = group[pc.list_parent_indices(lists).to_numpy()]
+        keep = ~np.isnan(value_group)
+        value_group = value_group[keep].astype(np.int64)
+        order = np.argsort(value_group, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(value_group, minlength=n_groups))]).astype(np.int32)
+        merged[col] = pa.ListArray.from_arrays(pa.array(offsets), pa.array(values[keep][order]))
+    return merged
+
+# --- 辅助函数: 构造 "发明&实用" 合并输入 (v8 从 main 中拆出, v8 改为按键列索引对齐) ---
+# 公司名称 也作为键列 (两边都有时): 同一股票代码下的不同子公司只与同名的一方对齐
+COMBINE_KEYS = ['股票代码', '会计年度', '公司类型', '公司名称']
+ORDINAL_COL = '_键内序号'
+
+def _unify_categories(df_invention, df_utility, keys):
+    """两边都是分类类型的键列使用同一组 (排序后的) 类别，索引对齐时才能按编码匹配。"""
+    for col in keys:
+        left, right = df_invention[col], df_utility[col]
+        if isinstance(left.dtype, pd.CategoricalDtype) and isinstance(right.dtype, pd.CategoricalDtype):
+            categories = union_categoricals([left, right], sort_categories=True).categories
+            df_invention[col] = left.cat.set_categories(categories)
+            df_utility[col] = right.cat.set_categories(categories)
+
+def _keyed(df, keys):
+    """以 键列 + 键内序号 为索引 (同一键出现多行时按出现顺序一一对应，不做笛卡尔积)。"""
+    df = df.copy()
+    df[ORDINAL_COL] = df.groupby(keys, observed=True, dropna=False, sort=False).cumcount()
+    return df.set_index(keys + [ORDINAL_COL])
+
+def build_combined_input(df_invention, df_utility):
+    """
+    将 "发明" 和 "实用新型" 两份数据按 (股票代码, 会计年度, 公司类型, 公司名称) 中两边都有的列索引对齐 (outer join)，
+    供 任务3 (发明&实用) 使用。两边共有的其他描述列取 "发明" 一侧的值，缺失时用 "实用新型" 一侧补齐。
+    结果按键列排序，列顺序为 "发明" 的列在前、"实用新型" 独有的列在后。无法合并时返回 None。
+    """
+    print("\n" + "#"*60)
+    print("--- 任务: 发明&实用 (合并数据准备) ---")
+    print("#"*60)
+    
+    merge_keys = [c for c in COMBINE_KEYS if c in df_invention.columns and c in df_utility.columns]
+    if not merge_keys:
+        print("❌ 错误: 无法合并 '发明' 和 '实用新型' 数据，因为它们没有共同的键列 (如 '股票代码', '会计年度' 等)。")
+        return None
+    print(f"将按键列 {merge_keys} 索引对齐 (outer join)。")
+
+    df_invention, df_utility = df_invention.copy(), df_utility.copy()
+    _unify_categories(df_invention, df_utility, merge_keys)
+    left, right = _keyed(df_invention, merge_keys), _keyed(df_utility, merge_keys)
+
+    # 共有的其他描述列不参与对齐，join 后合并为一列
+    shared_cols = [c for c in left.columns if c in right.columns]
+    df_combined = left.join(right.drop(columns=shared_cols), how='outer')
+    for col in shared_cols:
+        df_combined[col] = df_combined[col].combine_first(right[col])
+
+    column_order = list(df_invention.columns) + [c for c in df_utility.columns if c not in df_invention.columns]
+    df_combined = df_combined.sort_index().reset_index()[column_order]
+    df_combined.attrs['patent_corpora'] = (df_invention.attrs.get('patent_corpora', [])
+                                           + df_utility.attrs.get('patent_corpora', []))
+    df_combined.attrs['block_id_corpora'] = {**df_invention.attrs.get('block_id_corpora', {}),
+                                             **df_utility.attrs.get('block_id_corpora', {})}
+    print(f"合并后的数据共 {len(df_combined)} 行 (发明 {len(df_invention)} 行, 实用新型 {len(df_utility)} 行)。")
+    return df_combined
+
+# --- 辅助函数: 并行模式下的语料引用与共享内存计分 (v8 新增) ---
+# 语料模式下进程间不再传递 DataFrame: 加载进程返回 InputRef，任务进程自己 memmap 打开语料;
+# 逐块指标由若干子进程分片计算，写入主进程创建的共享内存，任务进程挂接后直接使用。
+InputRef = namedtuple('InputRef', ['file_path', 'corpus_dir'])
+
+# 放入共享内存的逐块指标 (块库的前 5 列，类型相同，块库为空时可直接引用)
+SCORE_ARRAYS = {name: BLOCK_COLUMNS[name] for name in ('valid', 'method1', 'N', 'n', 'method2')}
+
+def _score_block_slice(corpus_file, descriptor, lo, hi):
+    """子进程中计算语料第 lo~hi 个块的方法1/方法2 指标 (score_blocks)，写入共享内存。返回块数。"""
+    corpus = open_corpus(corpus_file)
+    columns = score_blocks(corpus.block_code_offsets[lo:hi + 1], corpus.code_main_group, corpus.code_sub_class)
+    out = SharedArrays.attach(descriptor)
+    try:
+        for name, values in columns.items():
+            out[name][lo:hi] = values
+    finally:
+        out.close()
+    return hi - lo
+
+def score_corpus_shared(executor, corpus_file, n_slices):
+    """
+    把语料的逐块指标分成至多 n_slices 片交给 executor 的子进程计算。
+    (v8) 按估计代价 (分类号数) 而不是块数切片，代价大的片先提交 (最长处理时间优先)，
+    集团公司的巨型行 (上万个块) 被拆到多个片中并行计分，各行汇总时再从块库取回。
+    子进程只收到 (语料路径, 共享内存描述, 切片范围)，结果直接写入共享内存。
+    返回 (SharedArrays, 切片列表)，SharedArrays 由调用方在所有任务结束后 close。
+    """
+    corpus = open_corpus(corpus_file)
+    scores = SharedArrays.create({name: (dtype, corpus.n_blocks) for name, dtype in SCORE_ARRAYS.items()})
+    slices = sorted(corpus.cost_slices(n_slices), key=lambda sl: sl[2], reverse=True)
+    try:
+        futures = [executor.submit(_score_block_slice, corpus_file, scores.descriptor(), lo, hi)
+                   for lo, hi, _ in slices]
+        for future in futures:
+            future.result()
+    except Exception:
+        scores.close()
+        raise
+    return scores, slices
+
+def _attach_block_scores(block_scores, block_store, report=None):
+    """
+    任务进程中: 挂接共享内存中的逐块指标，整批放入该任务的块库 (块库为空时各列直接引用共享内存，不复制;
+    分类号、大组数组引用语料的 memmap)。返回挂接的 SharedArrays 列表，由调用方在块库不再使用后 close。
+    """
+    attached = []
+    for corpus_file, descriptor in (block_scores or {}).items():
+        corpus = open_corpus(corpus_file)
+        if corpus is None:
+            continue
+        with stage(report, 'corpus_blocks_shared', file=os.path.basename(corpus_file)) as timer:
+            scores = SharedArrays.attach(descriptor)
+            attached.append(scores)
+            timer.counts['blocks'] = block_store.load_corpus(corpus, scores)
+    return attached
+
+def _resolve_input(loaded, report=None):
+    """任务进程中: InputRef 在本进程从语料打开，DataFrame 原样返回。"""
+    if isinstance(loaded, InputRef):
+        return load_data(loaded.file_path, report=report, corpus_dir=loaded.corpus_dir)
+    return loaded
+
+def _load_data_with_report(file_path, profiler=None, corpus_dir=None, checkpoint=None):
+    """
+    (v8 新增): 子进程中加载数据，返回 (数据, 阶段记录)。
+    语料模式下只返回 InputRef (语料已编译好，任务进程自己打开)，不把 DataFrame 传回主进程。
+    """
+    report = RunReport('load', profiler=profiler)
+    df = load_data(file_path, report=report, corpus_dir=corpus_dir, checkpoint=checkpoint)
+    if corpus_dir and df is not None:
+        return InputRef(file_path, corpus_dir), report.stages
+    return df, report.stages
 
-# --- 核心函数4: 主调度函数 (v6 新增, v7 无需修改) ---
-def main():
+def _run_task_with_own_exporter(input_df, export_options, task_kwargs, profiler=None, block_scores=None):
+    """
+    (v8 新增): 子进程中运行一个任务，使用本进程自己的导出队列，
+    返回前等待写入完成。
+    input_df 可以是 InputRef; block_scores 为 {语料路径: 共享内存描述} (见 score_corpus_shared)。
+    返回: {'export_errors': 写入失败的列表, 'stages': 本进程的阶段记录}
+    """
+    report = RunReport(task_kwargs.get('task_name', ''), profiler=profiler)
+    block_store = BlockStore() # 本任务的块库，随子进程中的这次调用结束而释放
+    attached = _attach_block_scores(block_scores, block_store, report)
+    try:
+        input_df = _resolve_input(input_df, report)
+        exporter = ExcelExportQueue(report=report, **export_options)
+        run_processing_task(input_df=input_df, exporter=exporter, report=report, block_store=block_store,
+                            **task_kwargs)
+        export_errors = exporter.close()
+    finally:
+        del block_store # 块库的列可能是共享内存的视图，先释放再解除映射
+        for scores in attached:
+            with contextlib.suppress(BufferError): # 出错时 traceback 仍引用视图: 映射留到进程回收
+                scores.close()
+    return {'export_errors': export_errors, 'stages': report.stages}
+
+def _build_and_run_combined_task(df_invention, df_utility, export_options, task_kwargs, profiler=None,
+                                 block_scores=None):
+    """(v8 新增): 子进程中先构造合并输入，再运行 任务3。"""
+    report = RunReport('combined-input', profiler=profiler)
+    df_invention = _resolve_input(df_invention, report)
+    df_utility = _resolve_input(df_utility, report)
+    with stage(report, 'build_combined_input', task=task_kwargs.get('task_name', '')) as timer:
+        df_combined = build_combined_input(df_invention, df_utility)
+        timer.counts['rows'] = 0 if df_combined is None else len(df_combined)
+    if df_combined is None:
+        return {'export_errors': [], 'stages': report.stages}
+    result = _run_task_with_own_exporter(df_combined, export_options, task_kwargs, profiler, block_scores)
+    result['stages'] = report.stages + result['stages']
+    return result
+
+# --- 核心函数4: 主调度函数 (v6 新增, v8 增加并行模式) ---
+def main(parallel=False, max_workers=None, export_mode='thread', writer='openpyxl', long_format=False,
+         use_cache=False, cache_dir=None, cache_max_gb=20, trace_memory=False, root_dir=None, profile=False,
+         metrics_dir=None, metrics_port=None, metrics_interval=5.0, dedup_cross_kind=False,
+         use_corpus=False, corpus_dir=None, shards=None, use_checkpoint=False, resume=False, checkpoint_dir=None,
+         max_memory_gb=None):
     """
     (v6 新增): 主执行函数 - 调度中心
     负责定义路径、加载数据、并调用3次处理流水线
+    
+    参数:
+    - parallel (bool): (v8) 是否并行执行。两个输入文件同时加载，
+      发明/实用新型任务在各自输入加载完成后立即在子进程中运行，
+      发明&实用任务在两个输入都就绪后立即运行。
+    - max_workers (int): (v8) 并行模式下的进程数，默认 min(3, CPU核数)
+    - export_mode (str): (v8) 结果表的导出方式: 'thread' / 'process' 后台写入, 'sync' 同步写入
+    - writer (str): (v8) 'openpyxl' (to_excel) 或 'streaming' (constant_memory 流式写入, 自动按行数上限拆分)
+    - long_format (bool): (v8) 长表输出模式 (方法3计数 -> 长表 csv, 汇总列 -> 压缩存储引用)
+    - use_cache (bool): (v8) 启用阶段结果缓存 (各快照共用, 默认目录见 default_cache_dir)
+    - cache_dir (str): (v8) 缓存目录; cache_max_gb: 缓存大小上限 (GB), 超过时按 LRU 淘汰
+    - trace_memory (bool): (v8) 运行报告中额外用 tracemalloc 记录每个阶段的 Python 内存峰值
+    - root_dir (str): (v8) 根目录 (其下的 res/ 为输入, result/ 为输出)，默认使用下面写死的路径
+    - profile (bool): (v8) 对每个阶段做采样分析，分析文件写到 根目录/profile_01_<时间戳>/
+    - metrics_dir (str): (v8) 实时指标目录，每个进程定期写一个 Prometheus 文本文件 (01_<pid>.prom)
+    - metrics_port (int): (v8) 在本机该端口提供 /metrics HTTP 端点 (未指定 metrics_dir 时使用 根目录/metrics)
+    - metrics_interval (float): (v8) 实时指标的写入间隔 (秒)
+    - dedup_cross_kind (bool): (v8) 发明&实用 任务中，规范形式相同的发明/实用新型块 (一案双申) 只计一次
+    - use_corpus (bool): (v8) 输入首次加载时编译为二进制语料 (见 patent_corpus.py)，之后的运行直接 memmap 打开
+    - corpus_dir (str): (v8) 语料目录，默认 根目录/corpus
+    - shards (int): (v8) 分片执行: 输入按 股票代码 哈希分成该数量的磁盘分片，各分片在子进程中独立处理，
+      最后拼接结果 (进程数见 max_workers)。不能与 long_format 同时使用
+    - use_checkpoint (bool): (v8) 把已完成的单元 (加载的输入、各任务各分支的结果、分片) 写入检查点目录
+    - resume (bool): (v8) 从上次运行留下的检查点继续 (隐含 use_checkpoint)，指纹不符的单元重新计算
+    - checkpoint_dir (str): (v8) 检查点目录，默认 根目录/checkpoints
+    - max_memory_gb (float): (v8) 内存预算 (GB)。逐行处理自动分块、中间表及时释放;
+      并行/分片模式下按进程数平分
     """
     # 1. --- 定义路径 ---
-    root_dir = '/Users/bl/git/patent/251123' # <<< 已更新路径
+    root_dir = root_dir or '/Users/bl/git/patent/251123' # <<< 已更新路径
     res_dir = os.path.join(root_dir, 'res')
     result_dir = os.path.join(root_dir, 'result')
     
@@ -324,91 +1540,529 @@ def main():
     out_comb_merged = os.path.join(result_dir, '上市公司&子公司绿色发明&实用申请专利分类号_proce.xlsx')
     out_comb_listed = os.path.join(result_dir, '上市公司本身绿色发明&实用申请专利分类号_proce.xlsx')
 
-    print(f"--- 专利处理 v7 启动 (已修复专利块重复计算问题) ---")
+    # 阶段结果缓存 (v8)
+    cache = None
+    if use_cache:
+        cache = StageCache(cache_dir or default_cache_dir(), max_bytes=int(cache_max_gb * 1024 ** 3))
+
+    # 运行检查点 (v8): 不带 --resume 时清空上一次的检查点
+    checkpoint = None
+    if use_checkpoint or resume:
+        checkpoint = CheckpointStore(checkpoint_dir or os.path.join(root_dir, 'checkpoints'), resume=resume)
+        print(f"检查点: {checkpoint.checkpoint_dir}" + (" (从上次运行继续)" if resume else ""))
+
+    # 实时指标 (v8)
+    metrics = None
+    metrics_server = None
+    if metrics_dir or metrics_port:
+        metrics = LiveMetrics(metrics_dir or os.path.join(root_dir, 'metrics'), '01', interval=metrics_interval)
+        metrics.clear_previous()
+        print(f"实时指标: {metrics.metrics_dir}")
+        if metrics_port:
+            metrics_server = serve_metrics(metrics.metrics_dir, metrics_port)
+            print(f"实时指标 HTTP 端点: http://127.0.0.1:{metrics_port}/metrics")
+
+    # 内存预算 (v8): 并行/分片模式下各子进程平分
+    memory_budget = None
+    if max_memory_gb:
+        n_procs = (max_workers or min(3, os.cpu_count() or 1)) if (parallel or shards) else 1
+        memory_budget = int(max_memory_gb * 1024 ** 3 / n_procs)
+        print(f"内存预算: {max_memory_gb} GB" + (f" (每个进程 {memory_budget / 1024 ** 3:.2f} GB)" if n_procs > 1 else ""))
+
+    # 3个任务的参数 (串行/并行两种模式共用)
+    task_inv = dict(
+        data_prefixes = ['发明申请'],
+        count_prefixes = ['发明申请'],
+        summary_col_name = '发明专利汇总',
+        output_merged_excel = out_inv_merged,
+        output_listed_excel = out_inv_listed,
+        task_name = "发明专利",
+        long_format = long_format,
+        cache = cache,
+        metrics = metrics,
+        checkpoint = checkpoint,
+        memory_budget = memory_budget
+    )
+    task_util = dict(
+        data_prefixes = ['实用新型申请'],
+        count_prefixes = ['实用新型申请'],
+        summary_col_name = '实用新型专利汇总',
+        output_merged_excel = out_util_merged,
+        output_listed_excel = out_util_listed,
+        task_name = "实用新型专利",
+        long_format = long_format,
+        cache = cache,
+        metrics = metrics,
+        checkpoint = checkpoint,
+        memory_budget = memory_budget
+    )
+    task_comb = dict(
+        data_prefixes = ['发明申请', '实用新型申请'], # < 关键
+        count_prefixes = ['发明申请', '实用新型申请'], # < 关键
+        summary_col_name = '发明&实用专利汇总',
+        output_merged_excel = out_comb_merged,
+        output_listed_excel = out_comb_listed,
+        task_name = "发明&实用专利",
+        long_format = long_format,
+        cache = cache,
+        metrics = metrics,
+        dedup_cross_kind = dedup_cross_kind,
+        checkpoint = checkpoint,
+        memory_budget = memory_budget
+    )
+
+    print(f"--- 专利处理 v8 启动 (已修复专利块重复计算问题) ---")
     print(f"根目录: {root_dir}")
     print(f"结果目录: {result_dir}")
+    if shards and long_format:
+        print("⚠️ 警告: 长表输出模式的附属文件无法按分片拼接，忽略 --shards。")
+        shards = None
+    print(f"执行模式: {'分片' if shards else '并行' if parallel else '串行'}")
     start_time_all = time.time()
 
+    # v8: 分阶段运行报告 (JSON, 写在 result/ 目录旁)
+    profiler = None
+    if profile:
+        profiler = StageProfiler(os.path.join(root_dir, f"profile_01_{time.strftime('%Y%m%d_%H%M%S')}"))
+        print(f"采样分析: 开启 (输出目录 {profiler.profile_dir})")
+    report = RunReport('01数据处理', trace_python_memory=trace_memory, profiler=profiler, meta={
+        'mode': 'sharded' if shards else 'parallel' if parallel else 'serial', 'shards': shards,
+        'export_mode': export_mode, 'writer': writer, 'long_format': long_format,
+        'cache': use_cache, 'processing_version': PROCESSING_VERSION,
+        'dedup_cross_kind': dedup_cross_kind, 'corpus': use_corpus,
+        'checkpoint': checkpoint is not None, 'resume': resume, 'max_memory_gb': max_memory_gb,
+    })
+    corpus_dir = (corpus_dir or os.path.join(root_dir, 'corpus')) if use_corpus else None
+
+    export_options = dict(mode=export_mode, writer=writer)
+    if shards:
+        # 分片模式: 各分片在子进程中独立处理，结果在主进程拼接后导出
+        export_errors = run_tasks_sharded(
+            file_invention, file_utility, task_inv, task_util, task_comb, shards, max_workers, export_options,
+            report, corpus_dir=corpus_dir, shard_root=os.path.join(root_dir, 'shards'), checkpoint=checkpoint)
+    elif parallel:
+        # 并行模式: 每个子进程内的任务各自创建导出队列，并在任务结束前写完
+        export_errors = run_tasks_parallel(
+            file_invention, file_utility, task_inv, task_util, task_comb, max_workers, export_options, report,
+            corpus_dir=corpus_dir, checkpoint=checkpoint)
+    else:
+        export_errors = run_tasks_serial(
+            file_invention, file_utility, task_inv, task_util, task_comb, export_options, report,
+            corpus_dir=corpus_dir, checkpoint=checkpoint)
+
+    if export_errors:
+        print(f"\n❌ 共有 {len(export_errors)} 个结果文件保存失败:")
+        for label, output_path, error in export_errors:
+            print(f"  - [{label}] {output_path}: {error}")
+
+    report.print_summary()
+    report_path = report.write(root_dir, prefix='run_report_01')
+    print(f"运行报告已保存到: {report_path}")
+    if profiler is not None and os.path.isdir(profiler.profile_dir):
+        print(f"采样分析折叠栈 (全部阶段): {merge_collapsed(profiler.profile_dir)}")
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+    end_time_all = time.time()
+    print(f"\n--- 所有任务处理完毕，总耗时: {end_time_all - start_time_all:.2f} 秒。 ---")
+
+def run_tasks_serial(file_invention, file_utility, task_inv, task_util, task_comb, export_options, report=None,
+                     corpus_dir=None, checkpoint=None):
+    """
+    (v6 逻辑): 依次加载两个输入文件，再依次执行3个任务。
+    (v8): 所有任务共用一个后台导出队列，上一个任务的写入与下一个任务的计算重叠。
+    (v8): 3个任务共用本次运行的块库 (任务3 的块大多已在任务1/2 中计分)，函数返回时释放。
+    设置了内存预算时不共用: 每个任务使用自己的块库，任务的分支导出完成后即释放。
+    返回写入失败的列表。
+    """
+    exporter = ExcelExportQueue(report=report, **export_options)
+    block_store = None if task_inv.get('memory_budget') else BlockStore()
+
     # 2. --- 加载数据 ---
-    df_invention = load_data(file_invention)
-    df_utility = load_data(file_utility)
+    df_invention = load_data(file_invention, report=report, corpus_dir=corpus_dir, checkpoint=checkpoint)
+    df_utility = load_data(file_utility, report=report, corpus_dir=corpus_dir, checkpoint=checkpoint)
 
     # 3. --- 执行任务 ---
 
     # --- 任务1: 仅 "发明" ---
     if df_invention is not None:
-        run_processing_task(
-            input_df = df_invention,
-            data_prefixes = ['发明申请'],
-            count_prefixes = ['发明申请'],
-            summary_col_name = '发明专利汇总',
-            output_merged_excel = out_inv_merged,
-            output_listed_excel = out_inv_listed,
-            task_name = "发明专利"
-        )
+        run_processing_task(input_df = df_invention, exporter = exporter, report = report, block_store = block_store,
+                            **task_inv)
     else:
         print("\n--- 跳过 任务1 (发明专利)，因为输入文件加载失败 ---")
 
     # --- 任务2: 仅 "实用新型" ---
     if df_utility is not None:
-        run_processing_task(
-            input_df = df_utility,
-            data_prefixes = ['实用新型申请'],
-            count_prefixes = ['实用新型申请'],
-            summary_col_name = '实用新型专利汇总',
-            output_merged_excel = out_util_merged,
-            output_listed_excel = out_util_listed,
-            task_name = "实用新型专利"
-        )
+        run_processing_task(input_df = df_utility, exporter = exporter, report = report, block_store = block_store,
+                            **task_util)
     else:
         print("\n--- 跳过 任务2 (实用新型专利)，因为输入文件加载失败 ---")
 
     # --- 任务3: "发明" & "实用新型" 合并 ---
     if df_invention is not None and df_utility is not None:
-        print("\n" + "#"*60)
-        print("--- 任务: 发明&实用 (合并数据准备) ---")
-        print("#"*60)
-        
-        # 识别基础列 (非专利列) 用于合并
-        inv_data_cols = [f'发明申请{c}类' for c in 'ABCDEFGH']
-        inv_count_cols = [f'发明申请{c}类数量' for c in 'ABCDEFGH']
-        util_data_cols = [f'实用新型申请{c}类' for c in 'ABCDEFGH']
-        util_count_cols = [f'实用新型申请{c}类数量' for c in 'ABCDEFGH']
-
-        base_cols_inv = [c for c in df_invention.columns if c not in inv_data_cols + inv_count_cols]
-        base_cols_util = [c for c in df_utility.columns if c not in util_data_cols + util_count_cols]
-        
-        # 找到两边共有的基础列作为合并键
-        merge_keys = list(set(base_cols_inv) & set(base_cols_util))
-        
-        if not merge_keys:
-            print("❌ 错误: 无法合并 '发明' 和 '实用新型' 数据，因为它们没有共同的基准列 (如 '股票代码', '会计年度' 等)。")
-        else:
-            print(f"将使用 {len(merge_keys)} 个共同列进行 outer merge。")
-            print(f"合并键 (示例): {merge_keys[:5]}...")
-            
-            # 使用 outer merge 来保留所有公司的所有年份记录
-            df_combined = pd.merge(df_invention, df_utility, on=merge_keys, how='outer')
-            print(f"合并后的数据共 {len(df_combined)} 行。")
-            
-            # 为合并后的任务设置参数
-            run_processing_task(
-                input_df = df_combined,
-                data_prefixes = ['发明申请', '实用新型申请'], # < 关键
-                count_prefixes = ['发明申请', '实用新型申请'], # < 关键
-                summary_col_name = '发明&实用专利汇总',
-                output_merged_excel = out_comb_merged,
-                output_listed_excel = out_comb_listed,
-                task_name = "发明&实用专利"
-            )
-            
+        with stage(report, 'build_combined_input', task=task_comb['task_name']) as timer:
+            df_combined = build_combined_input(df_invention, df_utility)
+            timer.counts['rows'] = 0 if df_combined is None else len(df_combined)
+        if df_combined is not None:
+            run_processing_task(input_df = df_combined, exporter = exporter, report = report,
+                                block_store = block_store, **task_comb)
     else:
         print("\n--- 跳过 任务3 (发明&实用)，因为一个或两个输入文件加载失败 ---")
 
-    end_time_all = time.time()
-    print(f"\n--- 所有任务处理完毕，总耗时: {end_time_all - start_time_all:.2f} 秒。 ---")
+    # 等待所有后台写入完成
+    print("\n--- 等待后台导出完成 ---")
+    return exporter.close()
+
+def run_tasks_parallel(file_invention, file_utility, task_inv, task_util, task_comb, max_workers, export_options,
+                       report=None, corpus_dir=None, checkpoint=None):
+    """
+    (v8 新增): 并行调度。
+    - 两个输入文件在子进程中同时加载；
+    - 某个输入加载完成后，立即提交对应的单类任务；
+    - 两个输入都加载完成后，立即提交 发明&实用 任务。
+    各子进程的日志被捕获，最后按 (加载发明, 加载实用新型, 任务1, 任务2, 任务3)
+    的固定顺序打印，保证日志与串行模式一样可读、可复现。
+    (v8) 语料模式 (corpus_dir) 下: 加载进程只返回语料引用，主进程把各语料的逐块计分分片交给子进程、
+    结果写入共享内存，任务进程收到的只是语料路径和共享内存描述。
+    返回写入失败的列表。
+    """
+    if max_workers is None:
+        max_workers = min(3, os.cpu_count() or 1)
+    print(f"并行进程数: {max_workers}")
+    profiler = report.profiler if report is not None else None
+
+    # 固定顺序的日志槽位: 名称 -> future (跳过的任务记录为字符串)
+    log_order = ['加载发明', '加载实用新型', '任务1', '任务2', '任务3']
+    slots = {}
+
+    shared_scores = [] # 主进程创建的共享内存，所有任务结束后释放
+    block_scores = {}  # 输入名 -> {语料路径: 共享内存描述}
+
+    def score_shared(executor, name):
+        """语料模式: 计分结果放入共享内存 (失败时任务进程自己计分)。"""
+        corpus_file = corpus_path(loaded[name].file_path, loaded[name].corpus_dir)
+        try:
+            with stage(report, 'score_blocks_shared', file=os.path.basename(corpus_file)) as timer:
+                # 切片数多于进程数，先完成的进程继续领取剩余的片，直到最后都不空闲
+                scores, slices = score_corpus_shared(executor, corpus_file, n_slices=max_workers * 4)
+                timer.counts['blocks'] = len(scores['valid'])
+                timer.counts['slices'] = len(slices)
+                if slices:
+                    costs = [cost for _, _, cost in slices]
+                    timer.counts['slice_cost_max'] = max(costs)
+                    timer.counts['slice_cost_mean'] = round(sum(costs) / len(costs), 1)
+                timer.counts['shared_mb'] = round(scores.nbytes / 1024 ** 2, 2)
+        except Exception as e:
+            print(f"⚠️ 共享内存计分失败 ({os.path.basename(corpus_file)})，由任务进程自行计分: {e}")
+            return {}
+        shared_scores.append(scores)
+        return {corpus_file: scores.descriptor()}
+
+    with contextlib.ExitStack() as cleanup, ProcessPoolExecutor(max_workers=max_workers) as executor:
+        cleanup.callback(lambda: [scores.close() for scores in shared_scores])
+        load_futures = {
+            executor.submit(call_with_captured_output, _load_data_with_report, file_invention, profiler,
+                            corpus_dir, checkpoint): '加载发明',
+            executor.submit(call_with_captured_output, _load_data_with_report, file_utility, profiler,
+                            corpus_dir, checkpoint): '加载实用新型',
+        }
+        loaded = {}
+        pending = set(load_futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = load_futures[future]
+                slots[name] = future
+                result, _, error = future.result()
+                loaded[name] = result[0] if error is None else None
+                if isinstance(loaded[name], InputRef):
+                    block_scores[name] = score_shared(executor, name)
+
+                # 单类任务: 对应输入一就绪就开始
+                if name == '加载发明':
+                    if loaded[name] is not None:
+                        slots['任务1'] = executor.submit(
+                            call_with_captured_output, _run_task_with_own_exporter,
+                            loaded[name], export_options, task_inv, profiler, block_scores.get(name))
+                    else:
+                        slots['任务1'] = "\n--- 跳过 任务1 (发明专利)，因为输入文件加载失败 ---"
+                else:
+                    if loaded[name] is not None:
+                        slots['任务2'] = executor.submit(
+                            call_with_captured_output, _run_task_with_own_exporter,
+                            loaded[name], export_options, task_util, profiler, block_scores.get(name))
+                    else:
+                        slots['任务2'] = "\n--- 跳过 任务2 (实用新型专利)，因为输入文件加载失败 ---"
+
+        # 合并任务: 两个输入都就绪后开始
+        if loaded['加载发明'] is not None and loaded['加载实用新型'] is not None:
+            slots['任务3'] = executor.submit(
+                call_with_captured_output, _build_and_run_combined_task,
+                loaded['加载发明'], loaded['加载实用新型'], export_options, task_comb, profiler,
+                {**block_scores.get('加载发明', {}), **block_scores.get('加载实用新型', {})})
+        else:
+            slots['任务3'] = "\n--- 跳过 任务3 (发明&实用)，因为一个或两个输入文件加载失败 ---"
+        del loaded # 主进程不再需要输入数据
+
+        # 按固定顺序输出日志 (前面的任务未结束时会在此等待)
+        export_errors = []
+        for name in log_order:
+            slot = slots[name]
+            if isinstance(slot, str):
+                print(slot)
+                continue
+            result, log_text, error = slot.result()
+            print(log_text, end='')
+            if error is not None:
+                print(f"❌ [{name}] 执行失败:\n{error}")
+            elif name.startswith('任务'):
+                export_errors.extend(result['export_errors'])
+                if report is not None:
+                    report.extend(result['stages'])
+            elif report is not None:
+                report.extend(result[1])
+    return export_errors
+
+
+# --- 核心函数6: 按股票代码分片执行 (v8 新增) ---
+# 多快照的历史数据合并后放不进内存时使用: 输入按 股票代码 的哈希写成磁盘上的分片，
+# 每个分片在子进程中独立跑完3个任务 (同一公司的所有行都在同一分片，分支1 的分组合并无需全局重排)，
+# 最后把各分片的结果按非分片模式的行顺序拼接、导出。
+SHARD_INPUTS = ('发明', '实用新型')
+
+def shard_of(df, n_shards):
+    """每行的分片号: 股票代码 的哈希 (与进程、运行无关) 对分片数取模。"""
+    hashes = pd.util.hash_pandas_object(df['股票代码'].astype(str), index=False).to_numpy()
+    return hashes % n_shards
+
+def partition_input(df, n_shards, shard_root, name):
+    """把输入写成 <shard_root>/shard_<k>/<name>.pkl (保留原索引，即原始行号)，返回各分片行数。"""
+    shard_ids = shard_of(df, n_shards)
+    counts = []
+    for k in range(n_shards):
+        part = df[shard_ids == k]
+        part.to_pickle(os.path.join(shard_root, f"shard_{k:03d}", f"{name}.pkl"))
+        counts.append(len(part))
+    return counts
+
+class ShardResultSink:
+    """分片模式下代替 ExcelExportQueue 传给 run_processing_task: 结果表连同索引写成分片目录中的 pickle。"""
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+
+    def submit(self, df, output_path, label="", on_success=None):
+        df.to_pickle(os.path.join(self.shard_path, os.path.basename(output_path) + '.pkl'))
+        if on_success is not None:
+            on_success()
+
+    def flush(self):
+        pass # submit 时已同步写完
+
+    def close(self):
+        return []
+
+def _run_shard(shard_path, task_inv, task_util, task_comb, profiler=None):
+    """(v8 新增): 子进程中对一个分片依次执行3个任务。返回 (各输入行数, 阶段记录)。"""
+    report = RunReport(os.path.basename(shard_path), profiler=profiler)
+    sink = ShardResultSink(shard_path)
+    block_store = None if task_inv.get('memory_budget') else BlockStore() # 本分片3个任务共用 (内存预算模式下各任务自用)
+    frames = {}
+    for name in SHARD_INPUTS:
+        path = os.path.join(shard_path, f"{name}.pkl")
+        frames[name] = pd.read_pickle(path) if os.path.exists(path) else None
+    df_invention, df_utility = frames['发明'], frames['实用新型']
+
+    for df, task_kwargs in ((df_invention, task_inv), (df_utility, task_util)):
+        if df is not None and len(df) > 0:
+            run_processing_task(input_df=df, exporter=sink, report=report, block_store=block_store, **task_kwargs)
+    if df_invention is not None and df_utility is not None and len(df_invention) + len(df_utility) > 0:
+        with stage(report, 'build_combined_input', task=task_comb['task_name']) as timer:
+            df_combined = build_combined_input(df_invention, df_utility)
+            timer.counts['rows'] = 0 if df_combined is None else len(df_combined)
+        if df_combined is not None and len(df_combined) > 0:
+            run_processing_task(input_df=df_combined, exporter=sink, report=report, block_store=block_store,
+                                **task_comb)
+    return {name: (0 if df is None else len(df)) for name, df in frames.items()}, report.stages
+
+def merge_shard_results(shard_paths, output_path, by_index, exporter, label):
+    """
+    拼接各分片的同一结果表并交给导出队列，返回行数 (没有任何分片产出时返回 None)。
+    by_index: 按原始行号排序 (单类任务的分支2，保持输入顺序); 否则按 股票代码、会计年度 稳定排序
+    (分支1 的 groupby 结果、发明&实用 的合并输入本来就按键排序)。
+    """
+    parts = []
+    for shard_path in shard_paths:
+        path = os.path.join(shard_path, os.path.basename(output_path) + '.pkl')
+        if os.path.exists(path):
+            parts.append(pd.read_pickle(path))
+    if not parts:
+        return None
+    df = pd.concat(parts)
+    if by_index:
+        df = df.sort_index(kind='stable')
+    else:
+        df = df.sort_values(['股票代码', '会计年度'], kind='stable')
+    exporter.submit(df.reset_index(drop=True), output_path, label=label)
+    return len(df)
+
+def run_tasks_sharded(file_invention, file_utility, task_inv, task_util, task_comb, n_shards, max_workers,
+                      export_options, report=None, corpus_dir=None, shard_root=None, checkpoint=None):
+    """
+    (v8 新增): 分片调度。
+    - 主进程依次加载两个输入，按 股票代码 哈希写成 n_shards 个分片后立即释放;
+    - 各分片在子进程中独立执行3个任务 (不使用阶段缓存)，结果写回分片目录;
+    - 主进程按非分片模式的行顺序拼接各分片的结果并导出，最后删除分片目录。
+    (v8) checkpoint: 分片完成、已完成的分片、全部导出都记入检查点。--resume 时分片目录与输入、分片数、任务参数一致则
+    不再加载和分片，已完成的分片不再执行; 导出失败时保留分片目录，下次只需重新拼接; 已全部导出且输出文件都在时
+    整个分片运行跳过 (导出后分片目录已删除)。
+    返回写入失败的列表。
+    """
+    if max_workers is None:
+        max_workers = min(3, os.cpu_count() or 1)
+    print(f"分片数: {n_shards}, 并行进程数: {max_workers}, 分片目录: {shard_root}")
+    profiler = report.profiler if report is not None else None
+    shard_paths = [os.path.join(shard_root, f"shard_{k:03d}") for k in range(n_shards)]
+    # 分片 (阶段缓存按整份输入计算键，分支检查点按任务命名，分片模式下都不使用)
+    shard_tasks = [dict(t, cache=None, checkpoint=None) for t in (task_inv, task_util, task_comb)]
+
+    manifest = None
+    partitioned = False
+    if checkpoint is not None:
+        manifest = fingerprint_of({
+            'n_shards': n_shards,
+            'inputs': [source_signature(p) if os.path.exists(p) else None for p in (file_invention, file_utility)],
+            'tasks': [{k: v for k, v in t.items() if k not in ('metrics', 'memory_budget')} for t in shard_tasks],
+        })
+        output_paths = [t[key] for t in (task_inv, task_util, task_comb)
+                        for key in ('output_merged_excel', 'output_listed_excel')]
+        if checkpoint.status('shards-exported', manifest) is not None and all(map(os.path.exists, output_paths)):
+            print("♻️ 检查点: 分片结果已全部导出，跳过。")
+            return []
+        partitioned = os.path.isdir(shard_root) and checkpoint.status('shards-partitioned', manifest) is not None
+    if partitioned:
+        print("♻️ 检查点: 分片目录与输入一致，跳过加载和分片。")
+    else:
+        shutil.rmtree(shard_root, ignore_errors=True)
+        for shard_path in shard_paths:
+            os.makedirs(shard_path)
+
+        # 1. 加载并分片 (一次只在内存中保留一个输入)
+        for name, file_path in zip(SHARD_INPUTS, (file_invention, file_utility)):
+            df = load_data(file_path, report=report, corpus_dir=corpus_dir, checkpoint=checkpoint)
+            if df is None:
+                continue
+            with stage(report, 'partition', file=os.path.basename(file_path)) as timer:
+                counts = partition_input(df, n_shards, shard_root, name)
+                timer.counts['rows'] = len(df)
+                timer.counts['largest_shard_rows'] = max(counts)
+            print(f"已分片 [{name}]: {len(df)} 行 -> 每片 {min(counts)} ~ {max(counts)} 行")
+            del df
+        if checkpoint is not None:
+            checkpoint.mark('shards-partitioned', manifest)
+
+    # 2. 各分片独立执行 (分片之间互不依赖)
+    todo = shard_paths
+    if partitioned:
+        todo = [p for p in shard_paths if checkpoint.status(os.path.basename(p), manifest) is None]
+        if len(todo) < len(shard_paths):
+            print(f"♻️ 检查点: {len(shard_paths) - len(todo)} 个分片已完成，跳过。")
+    failed = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(call_with_captured_output, _run_shard, shard_path, *shard_tasks, profiler)
+                   for shard_path in todo]
+        for shard_path, future in zip(todo, futures):
+            result, log_text, error = future.result()
+            if error is not None:
+                print(log_text, end='')
+                print(f"❌ [{os.path.basename(shard_path)}] 执行失败:\n{error}")
+                failed.append(shard_path)
+                continue
+            rows, stages = result
+            if report is not None:
+                report.extend(stages)
+            if checkpoint is not None:
+                checkpoint.mark(os.path.basename(shard_path), manifest, rows=rows)
+            print(f"✅ [{os.path.basename(shard_path)}] 完成: " + ", ".join(f"{k} {v} 行" for k, v in rows.items()))
+
+    # 3. 拼接结果
+    print("\n--- 拼接各分片结果 ---")
+    exporter = ExcelExportQueue(report=report, **export_options)
+    if failed:
+        print(f"❌ {len(failed)} 个分片执行失败，不导出结果 (分片目录保留以便排查: {shard_root})")
+        return exporter.close()
+    for task_kwargs in (task_inv, task_util, task_comb):
+        is_combined = task_kwargs is task_comb
+        for branch, output_key in (('分支1', 'output_merged_excel'), ('分支2', 'output_listed_excel')):
+            output_path = task_kwargs[output_key]
+            label = f"{task_kwargs['task_name']}-{branch}"
+            with stage(report, 'merge_shards', task=task_kwargs['task_name'], branch=branch) as timer:
+                n_rows = merge_shard_results(shard_paths, output_path, branch == '分支2' and not is_combined,
+                                             exporter, label)
+                timer.counts['rows'] = n_rows or 0
+            if n_rows is None:
+                print(f"⚠️ [{label}] 没有任何分片产出结果，跳过。")
+            else:
+                print(f"[{label}] 拼接 {n_rows} 行 -> {os.path.basename(output_path)}")
+    export_errors = exporter.close()
+    if export_errors and checkpoint is not None:
+        print(f"分片目录保留以便 --resume 重新拼接: {shard_root}")
+        return export_errors
+    if checkpoint is not None:
+        checkpoint.mark('shards-exported', manifest)
+    shutil.rmtree(shard_root, ignore_errors=True)
+    return export_errors
 
 
 # --- 程序入口 ---
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="专利分类号处理 (任务1~3)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="并行加载输入并并行执行3个任务 (日志按固定顺序输出)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="并行模式下的进程数 (默认: min(3, CPU核数))")
+    parser.add_argument('--export-mode', choices=['thread', 'process', 'sync'], default='thread',
+                        help="结果表导出方式: 后台线程(默认) / 后台进程 / 同步写入")
+    parser.add_argument('--writer', choices=['openpyxl', 'streaming'], default='openpyxl',
+                        help="xlsx 写入方式: openpyxl(默认) / streaming (xlsxwriter 流式写入, 内存占用恒定)")
+    parser.add_argument('--long-format', action='store_true',
+                        help="长表输出: 方法3计数另存为长表 csv, 汇总列改为压缩存储中的引用")
+    parser.add_argument('--cache', action='store_true',
+                        help="启用阶段结果缓存: 输入与参数相同时直接复用结果 (各快照共用)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="缓存目录 (默认: 环境变量 PATENT_STAGE_CACHE，未设置时为 ~/.cache/patent_stage_cache)")
+    parser.add_argument('--cache-max-gb', type=float, default=20, help="缓存大小上限 (GB)，默认 20")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="运行报告中用 tracemalloc 额外记录每个阶段的 Python 内存峰值 (较慢)")
+    parser.add_argument('--root-dir', default=None,
+                        help="根目录 (其下的 res/ 为输入, result/ 为输出)，默认使用脚本中写死的路径")
+    parser.add_argument('--profile', action='store_true',
+                        help="对每个阶段做采样分析: 输出热点函数和折叠栈 (可生成火焰图) 到 根目录/profile_01_<时间戳>/")
+    parser.add_argument('--metrics-dir', default=None,
+                        help="实时指标目录: 定期写 Prometheus 文本文件 (可作为 node_exporter 的 textfile 目录)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="在本机该端口提供 /metrics HTTP 端点 (默认目录: 根目录/metrics)")
+    parser.add_argument('--metrics-interval', type=float, default=5.0, help="实时指标写入间隔 (秒)，默认 5")
+    parser.add_argument('--dedup-cross-kind', action='store_true',
+                        help="发明&实用 任务中，解析出的大组相同 (与分类号顺序、版本注记无关) 的发明/实用新型块在行内只计一次")
+    parser.add_argument('--corpus', action='store_true',
+                        help="首次加载时把输入编译为二进制语料，之后的运行用 memmap 直接打开 (源文件变化时自动重新编译)")
+    parser.add_argument('--corpus-dir', default=None, help="语料目录 (默认: 根目录/corpus)")
+    parser.add_argument('--shards', type=int, default=None,
+                        help="分片执行: 按股票代码哈希分成 N 个磁盘分片，各分片独立处理后拼接 (进程数见 --workers)")
+    parser.add_argument('--checkpoint', action='store_true',
+                        help="把已完成的输入加载、任务分支和分片写入检查点目录 (原子写入)，中断后可用 --resume 继续")
+    parser.add_argument('--resume', action='store_true',
+                        help="从上次运行的检查点继续: 核对输入指纹，已完成的单元跳过 (隐含 --checkpoint)")
+    parser.add_argument('--checkpoint-dir', default=None, help="检查点目录 (默认: 根目录/checkpoints)")
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help="内存预算 (GB): 按估计的每行内存自动分块处理、中间表及时释放 (并行/分片时各进程平分)")
+    args = parser.parse_args()
+    main(parallel=args.parallel, max_workers=args.workers, export_mode=args.export_mode,
+         writer=args.writer, long_format=args.long_format,
+         use_cache=args.cache, cache_dir=args.cache_dir, cache_max_gb=args.cache_max_gb,
+         trace_memory=args.trace_memory, root_dir=args.root_dir, profile=args.profile,
+         metrics_dir=args.metrics_dir, metrics_port=args.metrics_port, metrics_interval=args.metrics_interval,
+         dedup_cross_kind=args.dedup_cross_kind, use_corpus=args.corpus, corpus_dir=args.corpus_dir,
+         shards=args.shards, use_checkpoint=args.checkpoint, resume=args.resume,
+         checkpoint_dir=args.checkpoint_dir, max_memory_gb=args.max_memory)
\ No newline at end of file
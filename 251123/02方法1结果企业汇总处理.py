@@ -3,6 +3,15 @@ import numpy as np
 import ast  # 用于安全地将字符串转为列表 (AST = Abstract Syntax Tree)
 import os
 from tqdm import tqdm
+import argparse
+from pipeline_io import read_result_excel, list_result_files, write_excel_streaming, xlsxwriter
+from stage_cache import fingerprint_files
+from run_report import RunReport, stage
+from live_metrics import track
+from stage_runner import StageRun, add_stage_arguments
+
+# 本阶段的计算版本: 改变计算结果时必须更新，阶段缓存以此区分新旧结果
+STAGE_VERSION = 'task1-v1'
 
 def calculate_median(list_str):
     """
@@ -26,58 +35,99 @@ def calculate_median(list_str):
         # 如果字符串格式不正确 (例如 None, NaN, 或 "abc")，返回 0
         return 0
 
-def process_file_for_median(input_path, output_path):
+def process_file_for_median(input_path, output_path, cache=None, report=None, metrics=None):
     """
     读取一个处理后的Excel文件，计算中位数，并保存到新路径。
     (来自您的脚本，保持不变)
+    cache: 可选的 StageCache，输入文件内容与本阶段版本相同时直接复用结果。
+    report: 可选的 RunReport，记录读取、计算、导出各阶段的耗时和内存。
+    metrics: 可选的 LiveMetrics，逐行计算期间定期写出进度、速度、ETA 和内存。
     """
     if not os.path.exists(input_path):
         print(f"❌ 错误：找不到输入文件: {input_path}")
-        return
+        return False
+
+    # 按输入文件内容查询阶段缓存 (与文件名、快照目录无关)
+    cache_key = None
+    if cache is not None:
+        input_files = [path for _, path in list_result_files(input_path) if path.endswith('.xlsx')]
+        cache_key = cache.make_key('task1', {'version': STAGE_VERSION}, fingerprint_files(input_files))
+        if cache.restore(cache_key, output_path):
+            print(f"♻️ 命中缓存，已恢复结果到: {output_path}")
+            return True
 
     print(f"\n--- 正在处理文件 ---")
     print(f"读取中: {os.path.basename(input_path)}")
-    try:
-        df = pd.read_excel(input_path)
-    except Exception as e:
-        print(f"❌ 读取Excel文件时出错: {e}")
-        return
+    file_name = os.path.basename(input_path)
+    with stage(report, 'load', file=file_name) as timer:
+        try:
+            # 兼容 01 流式写入时按行数上限拆分出的多个工作表/分片文件
+            df = read_result_excel(input_path)
+        except Exception as e:
+            print(f"❌ 读取Excel文件时出错: {e}")
+            return False
+        timer.counts['rows'] = len(df)
         
     print(f"共 {len(df)} 行数据。开始计算 '方法1-专利质量列表' 的中位数...")
     
     # 检查目标列是否存在
     if '方法1-专利质量列表' not in df.columns:
         print(f"❌ 错误：在文件中未找到列 '方法1-专利质量列表'。")
-        return
+        return False
 
     # 初始化 tqdm
     tqdm.pandas(desc="计算中位数")
     
     # 4. 将函数应用到列，创建新列
-    df['方法1-专利质量中位数'] = df['方法1-专利质量列表'].progress_apply(calculate_median)
+    with stage(report, 'median', file=file_name) as timer, \
+            track(metrics, 'median', len(df), file=file_name) as progress:
+        df['方法1-专利质量中位数'] = df['方法1-专利质量列表'].progress_apply(progress.counting(calculate_median))
+        timer.counts['rows'] = len(df)
 
     print("计算完成。")
     
-    # 5. 确保输出目录存在
+    # 5. 确保输出目录存在 (exist_ok: 多进程并行时避免竞争报错)
     output_dir = os.path.dirname(output_path)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        print(f"已创建新目录: {output_dir}")
+    os.makedirs(output_dir, exist_ok=True)
         
     # 6. 保存到新的Excel文件
-    try:
-        df.to_excel(output_path, index=False)
-        print(f"✅ 成功保存结果到: {output_path}")
-    except Exception as e:
-        print(f"❌ 保存Excel文件时出错: {e}")
+    with stage(report, 'export', file=file_name) as timer:
+        try:
+            # 流式写入: 超过 Excel 行数上限时自动拆分工作表 (read_result_excel 可完整读回)
+            if xlsxwriter is not None:
+                write_excel_streaming(df, output_path)
+            else:
+                df.to_excel(output_path, index=False)
+            print(f"✅ 成功保存结果到: {output_path}")
+        except Exception as e:
+            print(f"❌ 保存Excel文件时出错: {e}")
+            return False
+        timer.counts['rows'] = len(df)
+    if cache is not None:
+        cache.store(cache_key, output_path, stage='task1')
+    return True
 
-def main():
+def run_file_job(input_path, output_path, cache=None, profiler=None, metrics=None):
     """
-    主执行函数 - (v2 更新)
-    自动循环处理所有6个文件。
+    单个文件的处理入口 (串行或在子进程中调用)。
+    返回: (是否成功, 本文件的阶段记录)
+    """
+    report = RunReport(os.path.basename(input_path), profiler=profiler)
+    ok = process_file_for_median(input_path, output_path, cache, report, metrics)
+    return ok, report.stages
+
+def main(max_workers=None, use_cache=False, cache_dir=None, cache_max_gb=20, root_dir=None, profile=False,
+         metrics_dir=None, metrics_port=None, metrics_interval=5.0):
+    """
+    主执行函数 - (v3 更新)
+    自动处理所有6个文件 (进程池并行, 单个文件出错不影响其他文件)。
+
+    参数:
+    - root_dir (str): 根目录 (其下的 result/ 为输入)，默认使用下面写死的路径
+    - 其余参数 (进程池、阶段缓存、采样分析、实时指标) 见 stage_runner.StageRun
     """
     # 1. 定义根路径和目录
-    root_dir = '/Users/bl/git/patent/251123' # <<< 已更新
+    root_dir = root_dir or '/Users/bl/git/patent/251123' # <<< 已更新
     
     # 输入目录 (不带 task1- 前缀的源文件)
     input_base_dir = os.path.join(root_dir, 'result')
@@ -99,7 +149,8 @@ def main():
         '上市公司本身绿色发明&实用申请专利分类号_proce.xlsx'
     ]
     
-    # 3. 循环处理所有文件
+    # 3. 构造所有文件的 (输入, 输出) 路径
+    jobs = []
     for basename in base_filenames:
         # 构造输入路径
         # e.g., .../result/上市公司&子公司...
@@ -112,12 +163,28 @@ def main():
         # 构造输出路径
         # e.g., .../result/task1/task1-上市公司&子公司...
         output_path = os.path.join(output_base_dir, output_filename)
-        
-        # 执行处理
-        process_file_for_median(input_path, output_path)
+        jobs.append((basename, input_path, output_path))
+
+    # 输出目录在主进程中预先创建，避免多个子进程同时创建
+    os.makedirs(output_base_dir, exist_ok=True)
+
+    # 4. 执行处理 (每个文件的 读取→计算→保存 互不依赖，交给进程池并行)
+    run = StageRun('task1', '02方法1结果企业汇总处理', root_dir, len(jobs), max_workers, use_cache, cache_dir, cache_max_gb,
+                   profile, metrics_dir, metrics_port, metrics_interval, meta={'stage_version': STAGE_VERSION})
+    failed_files = run.run_jobs(jobs, run_file_job)
+
+    if failed_files:
+        print(f"\n⚠️ 以下 {len(failed_files)} 个文件处理失败:")
+        for basename in base_filenames:
+            if basename in failed_files:
+                print(f"  - {basename}")
+    
+    run.finish()
 
     print("\n--- 所有6个文件的中位数计算任务已完成。 ---")
 
 # --- 程序入口 ---
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="task1 批量计算")
+    add_stage_arguments(parser, 'task1')
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import socket
+import hashlib
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+
+# --- 基准测试历史与回归检测 (v8 新增) ---
+#
+# 每次 run_benchmarks.py 运行后，把结果追加到本地历史文件 (JSON Lines，每行一次运行)，
+# 以 提交 (git commit) + 机器 为键。compare 命令把最新一次运行与基线对比，
+# 吞吐下降或 RSS 峰值上升超过阈值的阶段标记为回归 (退出码 1，便于脚本调用)。
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORK_DIR = os.path.join(BENCH_DIR, 'work')
+
+def history_path_for(work_dir):
+    """工作目录对应的历史文件: <工作目录>/bench_history.jsonl (与该目录下的合成数据、结果放在一起)。"""
+    return os.path.join(work_dir, 'bench_history.jsonl')
+
+DEFAULT_HISTORY = history_path_for(DEFAULT_WORK_DIR)
+
+def current_commit():
+    """当前 git 提交 (工作区有改动时加 '-dirty')，不在 git 仓库中时返回 'unknown'。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short=12', 'HEAD'], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCH_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+def machine_info():
+    """机器标识: 主机名 + 平台 + CPU 数 + Python 版本，取其哈希作为机器键。"""
+    info = {
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+    info['machine_id'] = hashlib.sha1(json.dumps(info, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return info
+
+def record_run(results, history_path=DEFAULT_HISTORY, meta=None):
+    """把一次基准测试的结果 (run_benchmarks.main 的返回值) 追加到历史文件，返回该条记录。"""
+    entry = {
+        'run_id': datetime.now().strftime('%Y%m%d_%H%M%S'),
+        'commit': current_commit(),
+        'machine': machine_info(),
+        'meta': dict(meta or {}),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+    with open(history_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+def load_history(history_path=DEFAULT_HISTORY):
+    if not os.path.exists(history_path):
+        return []
+    entries = []
+    with open(history_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+def _metrics(entry):
+    """
+    把一次运行展开成 {(规模, 阶段, 子阶段): {'throughput': ..., 'peak_rss_mb': ...}}。
+    子阶段为 '' 时表示整个脚本; 其余为 run_report 中的阶段名 (按墙钟时间折算吞吐)。
+    """
+    metrics = {}
+    for r in entry['results']:
+        if r.get('returncode', 0) != 0:
+            continue
+        key = (r['scale'], r['stage'], '')
+        metrics[key] = {'throughput': r.get('patents_per_second'), 'peak_rss_mb': r.get('peak_rss_mb'),
+                        'wall_seconds': r.get('wall_seconds')}
+        for sub_stage, wall in (r.get('stages') or {}).items():
+            if wall and wall > 0:
+                metrics[(r['scale'], r['stage'], sub_stage)] = {
+                    'throughput': round(r['patents'] / wall, 1), 'peak_rss_mb': None, 'wall_seconds': wall}
+    return metrics
+
+def select_runs(entries, machine_id=None, baseline=None, latest=None):
+    """
+    在同一台机器的历史中选出 (基线, 最新) 两次运行。
+    latest / baseline 可以是 run_id 或提交号前缀; baseline 省略时取最新运行之前的一次。
+    """
+    machine_id = machine_id or machine_info()['machine_id']
+    runs = [e for e in entries if e['machine']['machine_id'] == machine_id]
+    if not runs:
+        raise ValueError(f"历史中没有本机 ({machine_id}) 的记录")
+
+    def find(ref, candidates):
+        matches = [e for e in candidates if e['run_id'] == ref or e['commit'].startswith(ref)]
+        if not matches:
+            raise ValueError(f"历史中找不到运行或提交: {ref}")
+        return matches[-1]
+
+    latest_entry = find(latest, runs) if latest else runs[-1]
+    earlier = runs[:runs.index(latest_entry)]
+    if baseline:
+        baseline_entry = find(baseline, earlier or runs)
+    elif earlier:
+        baseline_entry = earlier[-1]
+    else:
+        raise ValueError("本机只有一次运行记录，无法对比")
+    return baseline_entry, latest_entry
+
+def compare_runs(baseline_entry, latest_entry, threshold=0.10, rss_threshold=None, min_seconds=0.5):
+    """
+    对比两次运行，返回逐项结果列表。
+    吞吐下降超过 threshold (比例) 或 RSS 峰值上升超过 rss_threshold (默认同 threshold) 记为回归。
+    基线墙钟时间不足 min_seconds 的子阶段计时噪声太大，不参与对比。
+    """
+    rss_threshold = threshold if rss_threshold is None else rss_threshold
+    base, new = _metrics(baseline_entry), _metrics(latest_entry)
+    rows = []
+    for key in sorted(set(base) & set(new), key=lambda k: (k[0], k[1], k[2])):
+        b, n = base[key], new[key]
+        if key[2] and (b['wall_seconds'] or 0) < min_seconds:
+            continue
+        row = {'scale': key[0], 'stage': key[1], 'sub_stage': key[2], 'regressions': []}
+        if b['throughput'] and n['throughput']:
+            change = n['throughput'] / b['throughput'] - 1
+            row['throughput'] = (b['throughput'], n['throughput'], round(change, 4))
+            if change < -threshold:
+                row['regressions'].append('throughput')
+        if b['peak_rss_mb'] and n['peak_rss_mb']:
+            change = n['peak_rss_mb'] / b['peak_rss_mb'] - 1
+            row['peak_rss_mb'] = (b['peak_rss_mb'], n['peak_rss_mb'], round(change, 4))
+            if change > rss_threshold:
+                row['regressions'].append('peak_rss')
+        rows.append(row)
+    return rows
+
+def print_comparison(baseline_entry, latest_entry, rows, show_all=False):
+    print(f"基线: {baseline_entry['run_id']} (提交 {baseline_entry['commit']})")
+    print(f"最新: {latest_entry['run_id']} (提交 {latest_entry['commit']})")
+    print(f"机器: {latest_entry['machine']['host']} / {latest_entry['machine']['machine_id']}\n")
+    n_regressed = 0
+    for row in rows:
+        if row['regressions']:
+            n_regressed += 1
+        elif not show_all:
+            continue
+        label = f"{row['scale']:>10} {row['stage']:>3} {row['sub_stage'] or '(全部)':<16}"
+        parts = []
+        if 'throughput' in row:
+            b, n, c = row['throughput']
+            parts.append(f"吞吐 {b} -> {n} 专利/秒 ({c:+.1%})")
+        if 'peak_rss_mb' in row:
+            b, n, c = row['peak_rss_mb']
+            parts.append(f"RSS峰值 {b} -> {n} MB ({c:+.1%})")
+        mark = "❌" if row['regressions'] else "  "
+        print(f"{mark} {label} " + ", ".join(parts))
+    if n_regressed:
+        print(f"\n❌ {n_regressed} 项超过阈值 (共对比 {len(rows)} 项)")
+    else:
+        print(f"\n✅ 没有超过阈值的回归 (共对比 {len(rows)} 项)")
+    return n_regressed
+
+def list_runs(entries):
+    for e in entries:
+        scales = sorted({r['scale'] for r in e['results']})
+        print(f"{e['run_id']}  提交 {e['commit']:<18} 机器 {e['machine']['host']}/{e['machine']['machine_id']}  "
+              f"规模 {scales}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基准测试历史: 记录、列出、对比 (回归检测)")
+    parser.add_argument('--history', default=None, help="历史文件 (默认 <工作目录>/bench_history.jsonl)")
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                        help="run_benchmarks.py 的工作目录，用于推导默认历史文件 (默认 bench/work)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_record = sub.add_parser('record', help="把 bench_results_*.json 追加到历史")
+    p_record.add_argument('results_file')
+
+    sub.add_parser('list', help="列出历史中的运行")
+
+    p_compare = sub.add_parser('compare', help="对比最新运行与基线")
+    p_compare.add_argument('--baseline', default=None, help="基线的 run_id 或提交号前缀 (默认: 上一次运行)")
+    p_compare.add_argument('--latest', default=None, help="要检查的 run_id 或提交号前缀 (默认: 最新运行)")
+    p_compare.add_argument('--threshold', type=float, default=0.10, help="吞吐下降阈值 (比例)，默认 0.10")
+    p_compare.add_argument('--rss-threshold', type=float, default=None, help="RSS 峰值上升阈值 (比例)，默认同 --threshold")
+    p_compare.add_argument('--min-seconds', type=float, default=0.5,
+                           help="基线耗时不足该秒数的子阶段不参与对比，默认 0.5")
+    p_compare.add_argument('--machine', default=None, help="机器键 (默认: 本机)")
+    p_compare.add_argument('--all', action='store_true', help="同时显示未回归的项")
+    args = parser.parse_args()
+    args.history = args.history or history_path_for(os.path.abspath(args.work_dir))
+
+    if args.command == 'record':
+        with open(args.results_file, encoding='utf-8') as f:
+            data = json.load(f)
+        entry = record_run(data['results'], args.history, meta={k: v for k, v in data.items() if k != 'results'})
+        print(f"✅ 已记录运行 {entry['run_id']} (提交 {entry['commit']})")
+    elif args.command == 'list':
+        list_runs(load_history(args.history))
+    else:
+        try:
+            baseline_entry, latest_entry = select_runs(load_history(args.history), args.machine,
+                                                       args.baseline, args.latest)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(2)
+        rows = compare_runs(baseline_entry, latest_entry, args.threshold, args.rss_threshold, args.min_seconds)
+        sys.exit(1 if print_comparison(baseline_entry, latest_entry, rows, show_all=args.all) else 0)
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# 让 bench/ 下的脚本可以导入上级目录中的 pipeline_io 等模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline_io import xlsxwriter, write_excel_streaming
+
+# --- 合成专利数据生成器 (v8 新增) ---
+#
+# 生成与 res/ 下真实输入格式相同的两个文件:
+#   res/上市公司绿色发明申请专利分类号.xlsx
+#   res/上市公司绿色实用新型申请专利分类号.xlsx
+# 特点:
+# - 宽表: 发明申请A类..H类 / 实用新型申请A类..H类 (每个单元格为若干 {...;...} 块) 及对应的 数量 列
+# - 分类号覆盖 extract_patent_parts 处理的四种形态:
+#   'H01M10/0525', 'H01M10/0525(2006.01)', '(A61K31/546,31:43)', 'H01M'
+# - 公司规模呈长尾分布，大公司有更多子公司，多个会计年度
+# - 同一专利块会出现在多个分类列中 (v7 块去重的对象)，
+#   部分实用新型与同一公司同年的发明专利分类完全相同 (一案双申)
+# - 一案双申的块中有一部分换了写法 (分类号顺序、空格、版本注记不同)，
+#   文本不同但规范形式相同 (跨类型去重 --dedup-cross-kind 合并的对象)
+
+INVENTION_FILE = '上市公司绿色发明申请专利分类号.xlsx'
+UTILITY_FILE = '上市公司绿色实用新型申请专利分类号.xlsx'
+SECTIONS = 'ABCDEFGH'
+MAX_BLOCKS_PER_ENTITY = 600 # 单个公司单年单类的专利上限，超出的部分分给更多子公司 (避免单元格超长)
+
+def _build_main_group_pool(rng, size):
+    """生成 size 个大组 (如 'H01M10')，并给出按 Zipf 分布的使用频率。"""
+    sections = rng.choice(list(SECTIONS), size=size)
+    classes = rng.integers(1, 100, size=size)
+    letters = rng.choice(list('ABCDEFGHJKLMNPQ'), size=size)
+    groups = rng.integers(1, 100, size=size)
+    pool = np.array([f"{s}{c:02d}{l}{g}" for s, c, l, g in zip(sections, classes, letters, groups)])
+    weights = 1.0 / np.arange(1, size + 1) ** 1.1
+    return pool, weights / weights.sum()
+
+def _format_code(rng, main_group):
+    """按四种形态之一格式化一个分类号。"""
+    shape = rng.random()
+    if shape < 0.55:
+        return f"{main_group}/{rng.integers(0, 100):02d}"
+    if shape < 0.80:
+        return f"{main_group}/{rng.integers(0, 1000)}(2006.01)"
+    if shape < 0.92:
+        return f"({main_group}/{rng.integers(0, 1000)},{rng.integers(1, 99)}:{rng.integers(1, 99)})"
+    return main_group[:4]
+
+def _make_block(rng, pool, weights, related):
+    """
+    生成一个专利块的内容 (不含花括号)。
+    第一个分类号决定所在的分类列，其余分类号多数与之同小类 (related 中抽取)。
+    """
+    n_codes = min(1 + rng.geometric(0.45), 12)
+    first = pool[rng.choice(len(pool), p=weights)]
+    codes = [first]
+    for _ in range(n_codes - 1):
+        if rng.random() < 0.6:
+            codes.append(related[first[:4]][rng.integers(len(related[first[:4]]))])
+        else:
+            codes.append(pool[rng.choice(len(pool), p=weights)])
+    parts = [_format_code(rng, mg) for mg in codes]
+    if rng.random() < 0.03:
+        parts.append(' ') # 偶见空项 / 多余空白
+    return first[0], ';'.join(parts)
+
+def _rewrite_block(rng, block):
+    """
+    一案双申的另一种写法: 打乱分类号顺序，随机在分类号前后加空格、加/去版本注记。
+    只改动 canonical_block 会忽略的部分 (解析出的大组不变)，规范形式不变。
+    """
+    parts = [s for s in block.split(';') if s.strip()]
+    rng.shuffle(parts)
+    rewritten = []
+    for s in parts:
+        if s.endswith('(2006.01)') and rng.random() < 0.5:
+            s = s[:-len('(2006.01)')]
+        elif '/' in s and not s.startswith('(') and not s.endswith(')') and rng.random() < 0.3:
+            s += '(2006.01)'
+        if rng.random() < 0.5:
+            s = ' ' + s + ' ' # extract_patent_parts 去掉首尾空白
+        rewritten.append(s)
+    return ('; ' if rng.random() < 0.5 else ';').join(rewritten)
+
+def generate_corpus(n_patents, out_dir, seed=0, years=(2018, 2019, 2020, 2021, 2022, 2023),
+                    utility_share=0.45, multi_column_rate=0.08, dual_filing_rate=0.25, rewrite_rate=0.3,
+                    fmt='xlsx'):
+    """
+    生成约 n_patents 个专利 (两个文件合计) 的合成数据，写到 out_dir/res/。
+    一案双申的块中约 rewrite_rate 的比例换一种写法 (见 _rewrite_block)。
+    返回数据概况 (同时写入 out_dir/corpus_meta.json)。
+    """
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    # 改写用独立的随机数流，不影响其余数据 (同一 seed 下与旧版本生成的其余内容一致)
+    rewrite_rng = np.random.default_rng([seed, 1])
+    pool, weights = _build_main_group_pool(rng, max(200, min(20000, n_patents // 20)))
+    related = {}
+    for mg in pool:
+        related.setdefault(mg[:4], []).append(mg)
+
+    # 公司数与规模: Pareto 长尾
+    n_firms = max(5, n_patents // (60 * len(years)))
+    firm_weights = rng.pareto(1.2, size=n_firms) + 1
+    firm_weights /= firm_weights.sum()
+    per_firm_year = rng.multinomial(n_patents, np.repeat(firm_weights / len(years), len(years)))
+    per_firm_year = per_firm_year.reshape(n_firms, len(years))
+
+    # 子公司数与公司规模相关，上限几百家
+    firm_totals = per_firm_year.sum(axis=1)
+    n_subsidiaries = np.minimum((np.sqrt(firm_totals) / 3).astype(int) + rng.integers(0, 3, size=n_firms), 400)
+    # 股票代码: 与真实 Excel 一样为整数 (前导零丢失)
+    stock_codes = rng.choice(np.arange(1, 700000), size=n_firms, replace=False)
+
+    rows = {'发明申请': [], '实用新型申请': []}
+    counts = {'发明申请': 0, '实用新型申请': 0, 'codes': 0, 'dual_filed': 0, 'dual_filed_rewritten': 0,
+              'multi_column': 0}
+    for firm in range(n_firms):
+        code = int(stock_codes[firm])
+        for y, year in enumerate(years):
+            total = int(per_firm_year[firm, y])
+            if total == 0:
+                continue
+            n_util = rng.binomial(total, utility_share)
+            n_inv = total - n_util
+            n_entities = max(1 + int(n_subsidiaries[firm]), -(-max(n_inv, n_util) // MAX_BLOCKS_PER_ENTITY))
+            # 上市公司本身约占 40%，其余分给子公司
+            entity_weights = np.concatenate([[0.4], np.full(n_entities - 1, 0.6 / max(1, n_entities - 1))])
+            entity_weights /= entity_weights.sum()
+
+            inv_blocks_by_entity = []
+            for prefix, n_kind in (('发明申请', n_inv), ('实用新型申请', n_util)):
+                per_entity = rng.multinomial(n_kind, entity_weights)
+                for e, n_e in enumerate(per_entity):
+                    if n_e == 0 and e > 0:
+                        continue
+                    cells = {c: [] for c in SECTIONS}
+                    for _ in range(n_e):
+                        if (prefix == '实用新型申请' and inv_blocks_by_entity
+                                and rng.random() < dual_filing_rate):
+                            # 一案双申: 复用同一公司同年的某个发明专利块
+                            section, block = inv_blocks_by_entity[rng.integers(len(inv_blocks_by_entity))]
+                            counts['dual_filed'] += 1
+                            if rewrite_rng.random() < rewrite_rate:
+                                block = _rewrite_block(rewrite_rng, block)
+                                counts['dual_filed_rewritten'] += 1
+                        else:
+                            section, block = _make_block(rng, pool, weights, related)
+                            if prefix == '发明申请':
+                                inv_blocks_by_entity.append((section, block))
+                        counts['codes'] += block.count(';') + 1
+                        cells[section].append('{' + block + '}')
+                        if rng.random() < multi_column_rate:
+                            # 同一专利同时出现在另一个分类列中
+                            other = SECTIONS[rng.integers(len(SECTIONS))]
+                            cells[other].append('{' + block + '}')
+                            counts['multi_column'] += 1
+                    counts[prefix] += int(n_e)
+                    row = {
+                        '股票代码': code,
+                        '会计年度': year,
+                        '公司类型': '上市公司本身' if e == 0 else '子公司',
+                        '公司名称': f"公司{code:06d}" + ("" if e == 0 else f"-子公司{e}"),
+                    }
+                    for c in SECTIONS:
+                        row[f'{prefix}{c}类'] = ''.join(cells[c]) if cells[c] else None
+                    for c in SECTIONS:
+                        row[f'{prefix}{c}类数量'] = len(cells[c])
+                    rows[prefix].append(row)
+
+    res_dir = os.path.join(out_dir, 'res')
+    os.makedirs(res_dir, exist_ok=True)
+    for prefix, file_name in (('发明申请', INVENTION_FILE), ('实用新型申请', UTILITY_FILE)):
+        df = pd.DataFrame(rows[prefix])
+        path = os.path.join(res_dir, file_name)
+        if fmt == 'csv':
+            # load_data 读取 Excel 失败时会回退到 CSV，因此沿用 .xlsx 文件名
+            df.to_csv(path, index=False)
+        elif xlsxwriter is not None:
+            write_excel_streaming(df, path)
+        else:
+            df.to_excel(path, index=False)
+        rows[prefix] = len(df)
+
+    meta = {
+        'seed': seed,
+        'requested_patents': n_patents,
+        'patents': counts['发明申请'] + counts['实用新型申请'],
+        'invention_patents': counts['发明申请'],
+        'utility_patents': counts['实用新型申请'],
+        'codes': counts['codes'],
+        'dual_filed': counts['dual_filed'],
+        'dual_filed_rewritten': counts['dual_filed_rewritten'],
+        'multi_column_copies': counts['multi_column'],
+        'firms': n_firms,
+        'years': list(years),
+        'invention_rows': rows['发明申请'],
+        'utility_rows': rows['实用新型申请'],
+        'format': fmt,
+        'generate_seconds': round(time.time() - start_time, 2),
+    }
+    with open(os.path.join(out_dir, 'corpus_meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成专利数据 (格式同 res/ 下的真实输入)")
+    parser.add_argument('--patents', type=int, default=10000, help="专利总数 (发明+实用新型)，默认 10000")
+    parser.add_argument('--out', required=True, help="输出根目录 (数据写到 <out>/res/)")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子，默认 0")
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx',
+                        help="xlsx (默认) 或 csv (仍使用 .xlsx 文件名, 由 load_data 回退读取, 生成和加载都更快)")
+    args = parser.parse_args()
+    meta = generate_corpus(args.patents, args.out, seed=args.seed, fmt=args.format)
+    print(json.dumps(meta, ensure_ascii=False, indent=2))
@@ -0,0 +1,234 @@
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import importlib
+import importlib.util
+import tracemalloc
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+# --- IPC 解析热点的微基准 (v8 新增) ---
+#
+# 单独测量 01数据处理.py 中最内层的逻辑:
+# - parse: extract_patent_parts(单个分类号) -> (大组, 小类)
+# - block: split_blocks(单元格列表) + parse_block(每个块) -> [[(大组, 小类), ...], ...]
+#   (没有 pyarrow 时逐行 apply 的路径; 有 pyarrow 时 01 不走这里)
+# - frame: process_frame_arrow(整表)，有 pyarrow 时 01 实际执行的按列路径 (每次调用使用新的块库，含块的解析)
+# 对当前实现或候选实现 (--candidate 模块:函数，仅 parse/block) 报告 纳秒/分类号、分配/分类号，
+# 并在固定语料上逐项对比候选实现与当前实现的结果是否一致。
+
+# 固定语料: 真实数据中出现过的分类号形态，以及畸形/边界情况
+FIXED_CODES = [
+    'H01M10/0525', 'H01M10/0525(2006.01)', 'H01M 10/0525', 'B01D53/86',
+    '(A61K31/546,31:43)', 'A61K31/546,31:43', 'A61K31/546,31∶43', '(A61K31/546,31∶43)',
+    'A61K31/546（2006.01）', '（A61K31/546，31：43）', '(2006.01)H01M10/05',
+    'H01M', 'C02F', 'C02F1', 'C02F1(2023.01)', '()', '(/)', '(2006.01)', '/', '/05',
+    '  G06F16/00  ', '　G06F16/00　', 'g06f16/00', 'H01M10/05/12', 'H01M10//05',
+    '(H01M10/05;H01M4/36)', '(C08L23/06,(C08L23/12))', 'C08L23/06(C08L23/12', 'C08L23/06)',
+    'A', 'Y02E10/50', 'F24S 20/40', 'B09B3/00(2022.01)I', 'E04B1/76;', 'H01L31/18,31/042',
+]
+
+# 固定语料: 块拆分的单元格形态
+FIXED_CELLS = [
+    ['{H01M10/0525;H01M4/36}{B01D53/86}'],
+    ['{H01M10/0525;H01M4/36}', '{H01M10/0525;H01M4/36}{C02F1/00}'],  # 跨列重复块
+    ['{A61K31/546,31∶43;(A61K31/546,31:43)}'],
+    ['{}{;}{ ; ;}'],
+    ['{H01M10/05', 'H01M4/36}'],                                       # 花括号跨单元格 (不匹配)
+    ['{H01M10/05{H01M4/36}}'],
+    ['H01M10/05;H01M4/36'],                                           # 没有花括号
+    ['{G06F16/00}' * 50],
+    ['{' + ';'.join(f'C0{i % 9 + 1}F{i}/{i:02d}' for i in range(40)) + '}'],
+]
+
+def load_pipeline_module():
+    """按文件路径导入 01数据处理.py (文件名以数字开头，不能直接 import)。"""
+    path = os.path.join(SCRIPT_DIR, '01数据处理.py')
+    spec = importlib.util.spec_from_file_location('patent_processing_01', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_candidate(spec):
+    """'模块:函数' 或 '文件.py:函数' -> 函数对象。"""
+    target, _, func_name = spec.rpartition(':')
+    if target.endswith('.py'):
+        module_spec = importlib.util.spec_from_file_location('candidate_module', os.path.abspath(target))
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    return getattr(module, func_name)
+
+def synthetic_codes(n, seed=0):
+    """用 generate_corpus 的分类号分布生成 n 个分类号，补充固定语料。"""
+    from generate_corpus import _build_main_group_pool, _format_code
+    rng = np.random.default_rng(seed)
+    pool, weights = _build_main_group_pool(rng, 2000)
+    picks = rng.choice(len(pool), size=n, p=weights)
+    return [_format_code(rng, pool[i]) for i in picks]
+
+def _time_per_item(func, inputs, n_items, repeat):
+    """重复 repeat 轮，取最快一轮，返回 纳秒/项。"""
+    best = None
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter_ns()
+            for x in inputs:
+                func(x)
+            elapsed = time.perf_counter_ns() - t0
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    return best / n_items
+
+def _allocations_per_item(func, inputs, n_items):
+    """
+    CPython 不提供累计分配次数，这里报告两个近似量:
+    - retained_blocks: 保留全部结果时新增的内存块数 (结果对象本身的分配)
+    - transient_bytes: 每次调用期间 tracemalloc 观测到的峰值增量之和 (含临时对象)
+    """
+    gc.collect()
+    before = sys.getallocatedblocks()
+    results = [func(x) for x in inputs]
+    retained = sys.getallocatedblocks() - before
+    del results
+
+    transient = 0
+    tracemalloc.start()
+    try:
+        for x in inputs:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            func(x)
+            transient += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return {
+        'retained_blocks_per_code': round(retained / n_items, 3),
+        'transient_bytes_per_code': round(transient / n_items, 1),
+    }
+
+def _short(value, width=120):
+    text = repr(value)
+    return text if len(text) <= width else text[:width] + '...'
+
+def check_equivalence(reference, candidate, inputs, limit=10):
+    """逐项对比两个实现的输出 (异常也作为结果对比)，返回不一致的条目。"""
+    def call(func, x):
+        try:
+            return ('ok', func(x))
+        except Exception as e:
+            return ('error', type(e).__name__)
+
+    mismatches = []
+    for x in inputs:
+        expected, actual = call(reference, x), call(candidate, x)
+        if expected != actual:
+            mismatches.append({'input': _short(x), 'expected': _short(expected), 'actual': _short(actual)})
+    return {'checked': len(inputs), 'mismatched': len(mismatches), 'examples': mismatches[:limit]}
+
+def bench_target(name, func, inputs, n_codes, repeat):
+    per_code_ns = _time_per_item(func, inputs, n_codes, repeat)
+    result = {'target': name, 'inputs': len(inputs), 'codes': n_codes, 'ns_per_code': round(per_code_ns, 1)}
+    result.update(_allocations_per_item(func, inputs, n_codes))
+    return result
+
+FRAME_COLS = ['发明申请A类', '实用新型申请A类']
+FRAME_ROWS = 1000 # frame 目标每次调用处理的行数
+
+def synthetic_frames(codes):
+    """把合成分类号写成两列专利数据 (每行每列 1~2 个块)，按 FRAME_ROWS 行切成若干表。"""
+    import pandas as pd
+    cells = ['{' + ';'.join(codes[i:i + 3]) + '}' + '{' + ';'.join(codes[i + 3:i + 5]) + '}'
+             for i in range(0, len(codes), 5)]
+    n_rows = (len(cells) + 1) // 2
+    df = pd.DataFrame({
+        '股票代码': [f"{i:06d}" for i in range(n_rows)],
+        FRAME_COLS[0]: cells[0::2],
+        FRAME_COLS[1]: cells[1::2] + [None] * (n_rows - len(cells[1::2])),
+    })
+    return [df.iloc[lo:lo + FRAME_ROWS].reset_index(drop=True) for lo in range(0, n_rows, FRAME_ROWS)]
+
+def main(candidate=None, target='parse', synthetic=20000, repeat=5, seed=0, output=None):
+    module = load_pipeline_module()
+    if target == 'frame' and module.pa is None:
+        raise SystemExit("--target frame 需要 pyarrow (没有 pyarrow 时 01 走逐行路径，请用 --target block)")
+    if target == 'frame' and candidate:
+        raise SystemExit("--candidate 只支持 --target parse/block")
+    if target == 'block' and module.pa is not None:
+        print("注意: 已安装 pyarrow，01 实际执行的是按列路径 process_frame_arrow (--target frame); "
+              "block 测的是没有 pyarrow 时的逐行路径。")
+
+    def block_reference(cells):
+        return [module.parse_block(b) for b in module.split_blocks(cells)]
+
+    if target == 'parse':
+        reference = lambda s: module.extract_patent_parts(s)
+        inputs = FIXED_CODES + synthetic_codes(synthetic, seed)
+        # 与 parse_block 一致: 只有 strip 后非空的项会被解析
+        inputs = [s.strip() for s in inputs if s.strip()]
+        fixed_inputs = [s.strip() for s in FIXED_CODES if s.strip()]
+        n_codes = len(inputs)
+    elif target == 'frame':
+        reference = lambda df: module.process_frame_arrow(df, FRAME_COLS, '汇总', block_store=module.BlockStore())
+        inputs = synthetic_frames(synthetic_codes(synthetic, seed))
+        n_codes = sum(len(b.split(';')) for df in inputs for col in FRAME_COLS
+                      for b in module.split_blocks(df[col].dropna().tolist()))
+    else:
+        reference = block_reference
+        codes = synthetic_codes(synthetic, seed)
+        synthetic_cells = [['{' + ';'.join(codes[i:i + 3]) + '}' + '{' + ';'.join(codes[i + 3:i + 5]) + '}']
+                           for i in range(0, len(codes), 5)]
+        inputs = FIXED_CELLS + synthetic_cells
+        fixed_inputs = FIXED_CELLS
+        n_codes = sum(len(b.split(';')) for cells in inputs for b in module.split_blocks(cells))
+
+    results = {'target': target, 'runs': [bench_target('current', reference, inputs, n_codes, repeat)]}
+    if candidate:
+        func = load_candidate(candidate)
+        results['runs'].append(bench_target(candidate, func, inputs, n_codes, repeat))
+        results['equivalence_fixed'] = check_equivalence(reference, func, fixed_inputs)
+        results['equivalence_all'] = check_equivalence(reference, func, inputs)
+
+    print(f"\n--- 微基准: {target} ({n_codes} 个分类号, 取 {repeat} 轮最快) ---")
+    for r in results['runs']:
+        print(f"{r['target']}: {r['ns_per_code']} ns/分类号, "
+              f"保留块 {r['retained_blocks_per_code']}/分类号, 临时分配 {r['transient_bytes_per_code']} 字节/分类号")
+    if candidate:
+        speedup = results['runs'][0]['ns_per_code'] / results['runs'][1]['ns_per_code']
+        print(f"候选实现加速比: {speedup:.2f}x")
+        for key in ('equivalence_fixed', 'equivalence_all'):
+            eq = results[key]
+            status = "✅ 一致" if eq['mismatched'] == 0 else f"❌ {eq['mismatched']} 项不一致"
+            print(f"{'固定语料' if key == 'equivalence_fixed' else '全部语料'}: {status} (共 {eq['checked']} 项)")
+            for m in eq['examples']:
+                print(f"   输入 {m['input']}: 当前 {m['expected']} / 候选 {m['actual']}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入: {output}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IPC 分类号解析与块拆分的微基准")
+    parser.add_argument('--target', choices=['parse', 'block', 'frame'], default='parse',
+                        help="parse: extract_patent_parts; block: split_blocks + parse_block (无 pyarrow 时的逐行路径); "
+                             "frame: process_frame_arrow (有 pyarrow 时的按列路径)")
+    parser.add_argument('--candidate', default=None,
+                        help="候选实现 '模块:函数' 或 '文件.py:函数'，签名与 --target 对应的当前实现相同")
+    parser.add_argument('--synthetic', type=int, default=20000, help="追加的合成分类号数量，默认 20000")
+    parser.add_argument('--repeat', type=int, default=5, help="计时轮数 (取最快一轮)，默认 5")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="把结果写成 JSON 文件")
+    args = parser.parse_args()
+    main(candidate=args.candidate, target=args.target, synthetic=args.synthetic,
+         repeat=args.repeat, seed=args.seed, output=args.output)
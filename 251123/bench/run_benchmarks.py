@@ -0,0 +1,157 @@
+import os
+import sys
+import glob
+import json
+import time
+import shlex
+import shutil
+import argparse
+import subprocess
+from datetime import datetime
+
+from generate_corpus import generate_corpus
+from bench_history import DEFAULT_WORK_DIR, history_path_for, record_run
+
+# --- 端到端基准测试 (v8 新增) ---
+#
+# 对每个规模: 生成 (或复用) 合成数据 -> 依次以子进程运行 01/02/03/05 (--root-dir 指向合成数据目录)
+# -> 读取各脚本写出的 run_report_*.json，汇总墙钟时间、吞吐 (专利/秒)、RSS 峰值和分阶段耗时。
+# 结果写到 <工作目录>/bench_results_<时间戳>.json
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = {
+    '01': ('01数据处理.py', 'run_report_01_'),
+    '02': ('02方法1结果企业汇总处理.py', 'run_report_task1_'),
+    '03': ('03方法2结果企业汇总处理.py', 'run_report_task2_'),
+    '05': ('05方法4结果企业汇总处理.py', 'run_report_task4_'),
+}
+
+def _parse_scale(text):
+    """'10k' / '1m' / '250000' -> 整数"""
+    text = text.strip().lower()
+    factor = {'k': 1000, 'm': 1000 ** 2}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * factor)
+
+def _latest_report(root_dir, prefix, started):
+    """本次运行写出的最新报告 (修改时间晚于 started)，没有则返回 None。"""
+    candidates = [p for p in glob.glob(os.path.join(root_dir, f"{prefix}*.json"))
+                  if os.path.getmtime(p) >= started]
+    if not candidates:
+        return None
+    with open(max(candidates, key=os.path.getmtime), encoding='utf-8') as f:
+        return json.load(f)
+
+def _stage_breakdown(report):
+    """按阶段名汇总墙钟时间 (多个文件/分支的同名阶段相加)。"""
+    totals = {}
+    for r in report.get('stages', []):
+        totals[r['stage']] = round(totals.get(r['stage'], 0) + r.get('wall_seconds', 0), 4)
+    return totals
+
+def run_stage(stage_id, root_dir, extra_args, log_dir):
+    """以子进程运行一个阶段脚本，返回计时与报告摘要。"""
+    script, report_prefix = STAGES[stage_id]
+    cmd = [sys.executable, os.path.join(SCRIPT_DIR, script), '--root-dir', root_dir] + extra_args
+    env = dict(os.environ, TQDM_DISABLE='1')
+    log_path = os.path.join(log_dir, f"{stage_id}.log")
+    started = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        proc = subprocess.run(cmd, cwd=SCRIPT_DIR, stdout=log, stderr=subprocess.STDOUT, env=env)
+    wall = time.time() - started
+
+    result = {
+        'stage': stage_id,
+        'command': ' '.join(shlex.quote(c) for c in cmd),
+        'returncode': proc.returncode,
+        'wall_seconds': round(wall, 3),
+        'log': log_path,
+    }
+    report = _latest_report(root_dir, report_prefix, started)
+    if report is not None:
+        result['peak_rss_mb'] = report.get('peak_rss_mb')
+        result['report_wall_seconds'] = report.get('wall_seconds')
+        result['stages'] = _stage_breakdown(report)
+    return result
+
+def main(scales, stage_ids, work_dir, seed=0, fmt='xlsx', stage_args=None, keep_results=False,
+         history_path=None, record_history=True):
+    """
+    history_path: 基准历史文件，默认 <工作目录>/bench_history.jsonl; record_history=False 时不记录。
+    """
+    stage_args = stage_args or {}
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for n in scales:
+        corpus_dir = os.path.join(work_dir, f"corpus_{n}_seed{seed}_{fmt}")
+        meta_path = os.path.join(corpus_dir, 'corpus_meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            print(f"\n♻️ 复用已有合成数据: {corpus_dir}")
+        else:
+            print(f"\n🧪 生成合成数据: {n} 个专利 -> {corpus_dir}")
+            meta = generate_corpus(n, corpus_dir, seed=seed, fmt=fmt)
+            print(f"   生成完毕，耗时 {meta['generate_seconds']:.1f} 秒 "
+                  f"(发明 {meta['invention_rows']} 行, 实用新型 {meta['utility_rows']} 行)")
+
+        # 每次都从空的 result/ 开始，避免上一次的输出影响计时
+        shutil.rmtree(os.path.join(corpus_dir, 'result'), ignore_errors=True)
+        log_dir = os.path.join(work_dir, 'logs', f"{n}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(log_dir, exist_ok=True)
+
+        for stage_id in stage_ids:
+            print(f"▶️ 规模 {n}: 运行 {STAGES[stage_id][0]} ...")
+            r = run_stage(stage_id, corpus_dir, stage_args.get(stage_id, []), log_dir)
+            r['scale'] = n
+            r['patents'] = meta['patents']
+            r['patents_per_second'] = round(meta['patents'] / r['wall_seconds'], 1) if r['wall_seconds'] > 0 else None
+            results.append(r)
+            status = "✅" if r['returncode'] == 0 else f"❌ (退出码 {r['returncode']}, 日志: {r['log']})"
+            print(f"   {status} 墙钟 {r['wall_seconds']:.2f} 秒, {r['patents_per_second']} 专利/秒, "
+                  f"RSS 峰值 {r.get('peak_rss_mb')} MB")
+
+        if not keep_results:
+            shutil.rmtree(os.path.join(corpus_dir, 'result'), ignore_errors=True)
+
+    out_path = os.path.join(work_dir, f"bench_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'format': fmt, 'results': results}, f, ensure_ascii=False, indent=2)
+
+    print("\n--- 基准测试汇总 ---")
+    print(f"{'规模':>10} {'阶段':>4} {'墙钟(秒)':>10} {'专利/秒':>12} {'RSS峰值(MB)':>12}")
+    for r in results:
+        print(f"{r['scale']:>10} {r['stage']:>4} {r['wall_seconds']:>10.2f} "
+              f"{str(r['patents_per_second']):>12} {str(r.get('peak_rss_mb')):>12}")
+    print(f"\n📄 结果已写入: {out_path}")
+    if record_history:
+        history_path = history_path or history_path_for(work_dir)
+        entry = record_run(results, history_path, meta={'seed': seed, 'format': fmt, 'stage_args': stage_args})
+        print(f"🗂️ 已追加到历史: {history_path} (提交 {entry['commit']})")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在合成数据上运行 01/02/03/05 的端到端基准测试")
+    parser.add_argument('--scales', nargs='+', default=['10k', '100k', '1m'],
+                        help="专利规模列表，如 10k 100k 1m 10m (默认 10k 100k 1m)")
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), default=sorted(STAGES),
+                        help="要运行的阶段 (默认全部)")
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                        help="合成数据、日志和结果的存放目录 (默认 bench/work)")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子，默认 0")
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx', help="合成数据格式 (见 generate_corpus.py)")
+    parser.add_argument('--stage-args', action='append', default=[], metavar='阶段=参数',
+                        help="传给某个阶段的额外参数，如 --stage-args \"01=--parallel --writer streaming\" (可重复)")
+    parser.add_argument('--keep-results', action='store_true', help="保留各阶段的 result/ 输出 (默认运行后删除)")
+    parser.add_argument('--history', default=None,
+                        help="基准历史文件 (默认 <工作目录>/bench_history.jsonl)，对比见 bench_history.py compare")
+    parser.add_argument('--no-history', action='store_true', help="不记录到历史文件")
+    args = parser.parse_args()
+
+    stage_args = {}
+    for item in args.stage_args:
+        stage_id, _, extra = item.partition('=')
+        stage_args[stage_id.strip()] = shlex.split(extra)
+
+    main([_parse_scale(s) for s in args.scales], args.stages, os.path.abspath(args.work_dir),
+         seed=args.seed, fmt=args.format, stage_args=stage_args, keep_results=args.keep_results,
+         history_path=args.history, record_history=not args.no_history)
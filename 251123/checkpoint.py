@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+
+import pandas as pd
+
+# --- 运行检查点 (v8 新增) ---
+#
+# 长时间运行中途失败 (内存不足、Ctrl-C、导出 Excel 出错) 时，已完成的单元不必重算:
+# 加载后的输入、各任务各分支的处理结果、分片模式下已完成的分片都写到检查点目录，
+# 以 --resume 重跑时逐个核对输入指纹，一致的单元直接恢复，不一致的重新计算。
+# 每个单元两个文件:
+#   <检查点目录>/<单元名>.pkl   数据 (可选)
+#   <检查点目录>/<单元名>.json  指纹和状态 (最后写入; 存在即表示该单元已完成)
+# 两者都先写临时文件再 os.replace，中途被打断不会留下半个检查点。
+
+def fingerprint_of(payload):
+    """任意可 JSON 序列化对象的哈希 (用作检查点指纹)。"""
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class CheckpointStore:
+    """
+    检查点目录。只保存目录路径，可以 pickle 传给子进程。
+
+    参数:
+    - checkpoint_dir (str): 检查点目录
+    - resume (bool): False 时清空目录 (新的一次运行); True 时保留已有检查点以便恢复
+    """
+
+    def __init__(self, checkpoint_dir, resume=False):
+        self.checkpoint_dir = checkpoint_dir
+        if not resume:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _path(self, unit, suffix):
+        name = re.sub(r'[\\/:*?"<>|\s]+', '_', unit)
+        return os.path.join(self.checkpoint_dir, name + suffix)
+
+    def _write_atomic(self, path, write):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def status(self, unit, fingerprint):
+        """单元已完成且指纹一致时返回其状态字典，否则返回 None (指纹不一致时给出提示)。"""
+        try:
+            with open(self._path(unit, '.json'), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('fingerprint') != fingerprint:
+            print(f"⚠️ 检查点 [{unit}] 与当前输入/参数不符，重新计算。")
+            return None
+        return state
+
+    def mark(self, unit, fingerprint, **info):
+        """记录单元完成 (可附带状态信息，如 exported=True)。已有的状态字段保留。"""
+        path = self._path(unit, '.json')
+        state = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if state.get('fingerprint') != fingerprint:
+            state = {}
+        state.update(info, fingerprint=fingerprint, unit=unit, updated=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+        self._write_atomic(path, write)
+
+    def save(self, unit, fingerprint, df, **info):
+        """保存单元的数据 (DataFrame)，然后记录完成。"""
+        self._write_atomic(self._path(unit, '.pkl'), df.to_pickle)
+        self.mark(unit, fingerprint, has_data=True, rows=len(df), **info)
+
+    def load(self, unit, fingerprint):
+        """指纹一致时返回单元的数据，否则返回 None。"""
+        state = self.status(unit, fingerprint)
+        if not state or not state.get('has_data'):
+            return None
+        try:
+            return pd.read_pickle(self._path(unit, '.pkl'))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def clear(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
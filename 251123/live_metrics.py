@@ -0,0 +1,236 @@
+import os
+import glob
+import time
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from run_report import current_rss_mb
+
+# --- 实时运行指标 (v8 新增) ---
+#
+# 长时间运行时，把当前进度定期写成 Prometheus 文本格式 (textfile collector 可直接采集):
+#   <指标目录>/<作业名>_<pid>.prom   每个进程一个文件 (并行模式下的子进程各写各的)
+# 可选地在主进程开一个本地 HTTP 端点 (/metrics)，返回目录下所有 .prom 文件的内容。
+# 进度来自热循环中的计数对象 (01 为 ProcessingStats，02/03/05 为 Progress)，
+# 写文件的后台线程只读取计数，不影响循环本身。
+
+DEFAULT_INTERVAL = 5.0 # 默认每 5 秒写一次
+
+METRIC_HELP = [
+    ('patent_pipeline_active', 'gauge', "是否有正在进行的阶段 (1/0)"),
+    ('patent_pipeline_rows_processed', 'gauge', "当前阶段已处理的行数"),
+    ('patent_pipeline_rows_total', 'gauge', "当前阶段的总行数"),
+    ('patent_pipeline_blocks_processed', 'gauge', "当前阶段已处理的专利块数 (仅 01)"),
+    ('patent_pipeline_rows_per_second', 'gauge', "当前阶段的行处理速度"),
+    ('patent_pipeline_blocks_per_second', 'gauge', "当前阶段的专利块处理速度 (仅 01)"),
+    ('patent_pipeline_eta_seconds', 'gauge', "当前阶段按当前速度估计的剩余时间"),
+    ('patent_pipeline_stage_elapsed_seconds', 'gauge', "当前阶段已运行的时间"),
+    ('patent_pipeline_stages_completed', 'counter', "本进程已完成的阶段数"),
+    ('patent_pipeline_rss_bytes', 'gauge', "进程常驻内存"),
+    ('patent_pipeline_last_update_timestamp_seconds', 'gauge', "本文件最后写入的时间"),
+]
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Progress:
+    """热循环中的进度计数 (与 ProcessingStats 一样提供 rows / blocks_total 属性)。"""
+
+    def __init__(self):
+        self.rows = 0
+        self.blocks_total = 0
+
+    def counting(self, func):
+        """包装逐行调用的函数，每调用一次 rows 加一。"""
+        def wrapper(*args, **kwargs):
+            self.rows += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+class _NullProgress(Progress):
+    """未启用实时指标时使用: 不包装函数，没有额外开销。"""
+
+    def counting(self, func):
+        return func
+
+class LiveMetrics:
+    """
+    实时指标的配置和本进程的写入线程。
+    只有配置 (目录、作业名、间隔) 会被 pickle 传给子进程，
+    子进程在第一次 track 时启动自己的写入线程。
+
+    参数:
+    - metrics_dir (str): .prom 文件目录 (可配置为 node_exporter 的 textfile 目录)
+    - job (str): 作业名 (如 '01'、'task1')，用作文件名前缀和 job 标签
+    - interval (float): 写入间隔 (秒)
+    """
+
+    def __init__(self, metrics_dir, job, interval=DEFAULT_INTERVAL):
+        self.metrics_dir = metrics_dir
+        self.job = job
+        self.interval = interval
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._lock = threading.Lock()
+        self._current = None # (阶段名, 标签, 总行数, 计数对象, 开始时间)
+        self._completed = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def __getstate__(self):
+        return {'metrics_dir': self.metrics_dir, 'job': self.job, 'interval': self.interval}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    @property
+    def path(self):
+        return os.path.join(self.metrics_dir, f"{self.job}_{os.getpid()}.prom")
+
+    def clear_previous(self):
+        """删除本作业上一次运行留下的 .prom 文件 (主进程启动时调用)。"""
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.metrics_dir, f"{self.job}_*.prom")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def begin(self, stage_name, total_rows, progress, labels):
+        with self._lock:
+            self._current = (stage_name, labels, total_rows, progress, time.perf_counter())
+        if self._thread is None:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name='live-metrics', daemon=True)
+            self._thread.start()
+        self.write()
+
+    def end(self):
+        with self._lock:
+            self._current = None
+            self._completed += 1
+        self.write()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def render(self):
+        """生成 Prometheus 文本格式的指标。"""
+        with self._lock:
+            current = self._current
+            completed = self._completed
+        base = {'job': self.job, 'pid': os.getpid()}
+        values = {'patent_pipeline_active': [(base, 1 if current else 0)],
+                  'patent_pipeline_stages_completed': [(base, completed)],
+                  'patent_pipeline_last_update_timestamp_seconds': [(base, round(time.time(), 3))]}
+        rss = current_rss_mb()
+        if rss is not None:
+            values['patent_pipeline_rss_bytes'] = [(base, int(rss * 1024 ** 2))]
+        if current:
+            stage_name, labels, total_rows, progress, started = current
+            stage_labels = {**base, 'stage': stage_name, **labels}
+            elapsed = time.perf_counter() - started
+            rows, blocks = progress.rows, progress.blocks_total
+            row_rate = rows / elapsed if elapsed > 0 else 0
+            values['patent_pipeline_rows_processed'] = [(stage_labels, rows)]
+            values['patent_pipeline_rows_total'] = [(stage_labels, total_rows)]
+            values['patent_pipeline_blocks_processed'] = [(stage_labels, blocks)]
+            values['patent_pipeline_rows_per_second'] = [(stage_labels, round(row_rate, 2))]
+            values['patent_pipeline_blocks_per_second'] = [(stage_labels, round(blocks / elapsed, 2) if elapsed > 0 else 0)]
+            values['patent_pipeline_stage_elapsed_seconds'] = [(stage_labels, round(elapsed, 3))]
+            if row_rate > 0:
+                values['patent_pipeline_eta_seconds'] = [(stage_labels, round(max(total_rows - rows, 0) / row_rate, 1))]
+
+        lines = []
+        for name, metric_type, help_text in METRIC_HELP:
+            if name not in values:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in values[name]:
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """原子地写出本进程的 .prom 文件 (采集方不会读到写了一半的文件)。"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass # 指标写入失败不影响主流程
+
+def track(metrics, stage_name, total_rows, progress=None, **labels):
+    """
+    实时指标的便捷入口 (用法同 run_report.stage)。
+    metrics 为 None 时返回不做任何事的上下文，as 得到的计数对象的 counting() 原样返回函数。
+    progress: 已有的计数对象 (如 ProcessingStats)；省略时新建一个 Progress。
+    """
+    if metrics is None:
+        return contextlib.nullcontext(progress if progress is not None else _NullProgress())
+    return _Tracking(metrics, stage_name, total_rows, progress if progress is not None else Progress(), labels)
+
+class _Tracking:
+    def __init__(self, metrics, stage_name, total_rows, progress, labels):
+        self.metrics = metrics
+        self.args = (stage_name, total_rows, progress, labels)
+
+    def __enter__(self):
+        self.metrics.begin(*self.args)
+        return self.args[2]
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.end()
+        return False
+
+def merge_prom_files(metrics_dir):
+    """合并目录下所有 .prom 文件: 同名指标的 HELP/TYPE 只保留一次，样本按指标归组。"""
+    headers, samples = {}, {}
+    for path in sorted(glob.glob(os.path.join(metrics_dir, '*.prom'))):
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            if line.startswith('# '):
+                name_headers = headers.setdefault(line.split()[2], [])
+                if line not in name_headers:
+                    name_headers.append(line)
+            elif line:
+                samples.setdefault(line.split('{')[0].split()[0], []).append(line)
+    out = []
+    for name in list(headers) + [n for n in samples if n not in headers]:
+        out.extend(headers.get(name, []))
+        out.extend(samples.get(name, []))
+    return '\n'.join(out) + '\n' if out else ''
+
+def serve_metrics(metrics_dir, port, host='127.0.0.1'):
+    """
+    在后台线程中启动本地 HTTP 端点，GET /metrics 返回目录下所有 .prom 文件的内容。
+    返回 server，结束时调用 server.shutdown()。
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = merge_prom_files(metrics_dir).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # 不把每次采集打印到控制台
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
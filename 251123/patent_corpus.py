@@ -0,0 +1,281 @@
+import os
+import re
+import json
+import time
+import shutil
+
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa # 可选依赖: 文本列和块 id 列直接由 memmap 的缓冲区构造为 Arrow 数组
+except ImportError:
+    pa = None
+
+# --- 已编译的专利语料 (v8 新增) ---
+#
+# 解析之后，一份输入表就是若干整数数组: 每个专利单元格包含哪些块、每个块包含哪些 (大组, 小类)。
+# 首次运行时把输入表和解析结果编译到一个带版本号的目录，之后的运行 (以及并行模式的各个子进程、
+# notebook 会话) 用 numpy 的 memmap 只读打开，多个进程共享操作系统的页缓存，无需再读 .xlsx、再跑正则。
+# 目录结构 (<语料目录>/<输入文件名>.corpus/):
+#   meta.json                    版本、源文件签名、列信息、大组/小类字典
+#   col_<i>.npy                  数值列
+#   col_<i>.utf8 / .offsets.npy / .missing.npy   文本列 (UTF-8 拼接 + 偏移 + 缺失标记)
+#   blocks.utf8 / .offsets.npy / .missing.npy    不同的块内容 (块 id 即下标)
+#   cell_block_offsets.npy, cell_block_ids.npy   每个专利单元格 (行优先) 的块 id 列表 (未去重，保持顺序)
+#   block_code_offsets.npy, code_main_group.npy, code_sub_class.npy
+#                                每个块中能解析出大组的分类号 -> 大组 id / 小类 id
+#   block_n_codes.npy            每个块的分类号数 (含解析不出大组的项)
+# 安装了 pyarrow 时，文本列和块 id 列表都直接由 memmap 的缓冲区构造为 Arrow 数组，不经过 Python 对象。
+
+CORPUS_VERSION = 2 # v2: 增加 block_n_codes、meta 中的 dangling_cells
+BLOCK_RE = re.compile(r'\{(.*?)\}')
+
+def corpus_path(source_path, corpus_dir):
+    return os.path.join(corpus_dir, os.path.basename(source_path) + '.corpus')
+
+def source_signature(source_path):
+    """源文件签名 (大小 + 修改时间)，不一致时语料视为过期。"""
+    st = os.stat(source_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _write_strings(out_dir, name, values):
+    """把一组字符串 (None 表示缺失) 写成 UTF-8 拼接 + int64 偏移 + 缺失标记。"""
+    encoded = [b'' if v is None else v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    np.save(os.path.join(out_dir, f"{name}.offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, f"{name}.missing.npy"), np.array([v is None for v in values], dtype=bool))
+    with open(os.path.join(out_dir, f"{name}.utf8"), 'wb') as f:
+        f.write(b''.join(encoded))
+
+def _read_strings(corpus_dir, name):
+    offsets = np.load(os.path.join(corpus_dir, f"{name}.offsets.npy"), mmap_mode='r')
+    missing = np.load(os.path.join(corpus_dir, f"{name}.missing.npy"), mmap_mode='r')
+    with open(os.path.join(corpus_dir, f"{name}.utf8"), 'rb') as f:
+        blob = f.read()
+    bounds = offsets.tolist()
+    return [None if missing[i] else blob[bounds[i]:bounds[i + 1]].decode('utf-8')
+            for i in range(len(bounds) - 1)]
+
+def _read_arrow_strings(corpus_dir, name):
+    """同 _read_strings，但返回 Arrow large_string 数组，数据和偏移直接引用 memmap (零拷贝)。"""
+    offsets = np.load(os.path.join(corpus_dir, f"{name}.offsets.npy"), mmap_mode='r')
+    missing = np.load(os.path.join(corpus_dir, f"{name}.missing.npy"))
+    data_path = os.path.join(corpus_dir, f"{name}.utf8")
+    data = np.memmap(data_path, dtype=np.uint8, mode='r') if os.path.getsize(data_path) else np.zeros(0, np.uint8)
+    validity = pa.array(~missing).buffers()[1] if missing.any() else None
+    return pa.LargeStringArray.from_buffers(len(missing), pa.py_buffer(offsets), pa.py_buffer(data), validity)
+
+def _cell_text(value):
+    return None if pd.isna(value) else str(value)
+
+def _has_dangling_brace(text):
+    """
+    最后一个 '}' 之后还有未闭合、且其后没有换行的 '{'。这样的单元格与下一行拼接 (分支1 的分组合并) 后，
+    正则会把两行的内容匹配成一个块，按单元格记录的块 id 列表与拼接后的文本不再一致。
+    """
+    tail = text[text.rfind('}') + 1:]
+    brace = tail.rfind('{')
+    return brace >= 0 and '\n' not in tail[brace:]
+
+def compile_corpus(df, data_cols, path, parse_code, parser_version, source_path=None):
+    """
+    把输入表 df 编译到 path 目录 (先写临时目录，完成后整体替换)。
+    - data_cols: 专利数据列 (单元格内容为 {块}{块}... 的列)
+    - parse_code: 单个分类号 -> (大组, 小类) 的解析函数 (即 01 的 extract_patent_parts)
+    - parser_version: 解析逻辑的版本 (01 的 PROCESSING_VERSION)，不一致时语料视为过期
+    返回编译统计 (行数、块数、分类号数)。
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            np.save(os.path.join(tmp_path, f"col_{i}.npy"), series.to_numpy())
+            kind = 'numeric'
+        else:
+            _write_strings(tmp_path, f"col_{i}", [_cell_text(v) for v in series])
+            kind = 'text'
+        columns.append({'name': str(col), 'kind': kind, 'dtype': str(series.dtype)})
+
+    # 块和分类号的整数化
+    block_ids, block_texts = {}, []
+    main_group_ids, sub_class_ids = {}, {}
+    cell_block_ids, cell_block_counts = [], []
+    code_main_group, code_sub_class, block_code_counts, block_n_codes = [], [], [], []
+    dangling_cells = 0
+    data_values = [df[col].tolist() for col in data_cols]
+    for r in range(len(df)):
+        for values in data_values:
+            value = values[r]
+            text = None if pd.isna(value) else str(value)
+            blocks = [] if text is None else BLOCK_RE.findall(text)
+            if text is not None and _has_dangling_brace(text):
+                dangling_cells += 1
+            for block in blocks:
+                block_id = block_ids.get(block)
+                if block_id is None:
+                    block_id = block_ids[block] = len(block_texts)
+                    block_texts.append(block)
+                    n_codes = n_items = 0
+                    for s in block.split(';'):
+                        s_clean = s.strip()
+                        if not s_clean:
+                            continue
+                        n_items += 1
+                        main_group, sub_class = parse_code(s_clean)
+                        if main_group:
+                            code_main_group.append(main_group_ids.setdefault(main_group, len(main_group_ids)))
+                            code_sub_class.append(sub_class_ids.setdefault(sub_class, len(sub_class_ids)))
+                            n_codes += 1
+                    block_code_counts.append(n_codes)
+                    block_n_codes.append(n_items)
+                cell_block_ids.append(block_id)
+            cell_block_counts.append(len(blocks))
+
+    def save_offsets(name, counts):
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(os.path.join(tmp_path, name), offsets)
+
+    _write_strings(tmp_path, 'blocks', block_texts)
+    save_offsets('cell_block_offsets.npy', cell_block_counts)
+    np.save(os.path.join(tmp_path, 'cell_block_ids.npy'), np.array(cell_block_ids, dtype=np.int32))
+    save_offsets('block_code_offsets.npy', block_code_counts)
+    np.save(os.path.join(tmp_path, 'code_main_group.npy'), np.array(code_main_group, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'code_sub_class.npy'), np.array(code_sub_class, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'block_n_codes.npy'), np.array(block_n_codes, dtype=np.int32))
+
+    meta = {
+        'version': CORPUS_VERSION,
+        'parser_version': parser_version,
+        'source': source_signature(source_path) if source_path else None,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': len(df),
+        'columns': columns,
+        'data_cols': [str(c) for c in data_cols],
+        'dangling_cells': dangling_cells,
+        'main_groups': list(main_group_ids),
+        'sub_classes': list(sub_class_ids),
+    }
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return {'rows': len(df), 'blocks': len(block_texts), 'block_occurrences': len(cell_block_ids),
+            'codes': len(code_main_group), 'main_groups': len(main_group_ids)}
+
+class PatentCorpus:
+    """
+    只读打开的已编译语料。整数数组均为 memmap (打开只需毫秒级)，
+    to_frame() / block_parts() 在需要时才还原数据 (安装了 pyarrow 时文本列为引用 memmap 的 Arrow 数组)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode='r')
+        self.cell_block_offsets = load('cell_block_offsets.npy')
+        self.cell_block_ids = load('cell_block_ids.npy')
+        self.block_code_offsets = load('block_code_offsets.npy')
+        self.code_main_group = load('code_main_group.npy')
+        self.code_sub_class = load('code_sub_class.npy')
+        self.block_n_codes = load('block_n_codes.npy')
+        self.main_groups = self.meta['main_groups']
+        self.sub_classes = self.meta['sub_classes']
+
+    @property
+    def n_blocks(self):
+        return len(self.block_code_offsets) - 1
+
+    def cost_slices(self, n_slices):
+        """
+        按估计代价 (每块 分类号数 + 1) 把块切成至多 n_slices 个连续片，各片代价尽量相等。
+        返回 [(起始块, 结束块, 代价), ...]。单个块不再拆分，代价极大的块自成一片。
+        """
+        n_blocks = self.n_blocks
+        if n_blocks == 0:
+            return []
+        cumulative = np.asarray(self.block_code_offsets) + np.arange(n_blocks + 1)
+        targets = cumulative[-1] * np.arange(1, n_slices) / n_slices
+        bounds = np.unique(np.concatenate([[0], np.searchsorted(cumulative, targets), [n_blocks]]))
+        return [(int(lo), int(hi), int(cumulative[hi] - cumulative[lo])) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def block_texts(self):
+        return _read_strings(self.path, 'blocks')
+
+    def block_texts_arrow(self):
+        """块文本 (按块 id 下标) 的 Arrow large_string 数组 (需要 pyarrow)。"""
+        return _read_arrow_strings(self.path, 'blocks')
+
+    @property
+    def block_ids_exact(self):
+        """
+        逐单元格的块 id 列表能否代替对 (分组拼接后的) 文本重新提取块: 没有 _has_dangling_brace 的单元格时可以。
+        """
+        return self.meta.get('dangling_cells', 0) == 0
+
+    def block_id_lists(self, col):
+        """
+        数据列 col 中每个单元格的块 id 列表 (与 BLOCK_RE.findall 的顺序相同，未去重)，
+        返回 Arrow list<int32> 数组 (需要 pyarrow)。由 cell_block_offsets/ids 按列抽取，不经过 Python 对象。
+        """
+        data_cols = self.meta['data_cols']
+        j, n_cols = data_cols.index(col), len(data_cols)
+        cell_offsets = np.asarray(self.cell_block_offsets)
+        starts, ends = cell_offsets[j:-1:n_cols], cell_offsets[j + 1::n_cols]
+        lengths = ends - starts
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        # 第 i 个单元格的块在 cell_block_ids 中的位置为 starts[i] ~ ends[i]
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return pa.ListArray.from_arrays(pa.array(offsets), pa.array(self.cell_block_ids[positions]))
+
+    def block_parts(self):
+        """逐块返回 [(大组, 小类), ...] (与 01 parse_block 的结果相同)。"""
+        offsets = self.block_code_offsets.tolist()
+        main_groups = [self.main_groups[i] for i in self.code_main_group.tolist()]
+        sub_classes = [self.sub_classes[i] for i in self.code_sub_class.tolist()]
+        for b in range(len(offsets) - 1):
+            lo, hi = offsets[b], offsets[b + 1]
+            yield list(zip(main_groups[lo:hi], sub_classes[lo:hi]))
+
+    def to_frame(self):
+        """还原编译时的输入表 (列顺序、数值列 dtype 不变; 文本列为字符串)。"""
+        data = {}
+        for i, col in enumerate(self.meta['columns']):
+            if col['kind'] == 'numeric':
+                data[col['name']] = np.load(os.path.join(self.path, f"col_{i}.npy"))
+                continue
+            if pa is not None:
+                values = pd.arrays.ArrowStringArray(_read_arrow_strings(self.path, f"col_{i}"))
+            else:
+                values = _read_strings(self.path, f"col_{i}")
+            try:
+                data[col['name']] = pd.Series(values, dtype=col['dtype'])
+            except (TypeError, ValueError):
+                data[col['name']] = pd.Series(values, dtype=object)
+        return pd.DataFrame(data)
+
+def open_corpus(path, source_path=None, parser_version=None):
+    """打开语料; 不存在、版本不符或源文件已变化时返回 None (由调用方重新编译)。"""
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        corpus = PatentCorpus(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    meta = corpus.meta
+    if meta.get('version') != CORPUS_VERSION:
+        return None
+    if parser_version is not None and meta.get('parser_version') != parser_version:
+        return None
+    if source_path is not None and meta.get('source') != source_signature(source_path):
+        return None
+    return corpus
@@ -0,0 +1,493 @@
+import io
+import os
+import re
+import glob
+import math
+import contextlib
+import traceback
+import threading
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait as futures_wait
+
+import numpy as np
+import pandas as pd
+
+from run_report import StageTimer
+
+try:
+    import xlsxwriter # 可选依赖: 流式写入 (constant_memory 模式)
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa # 可选依赖: Arrow 紧凑列表列 (01 v8) 的文本化
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Excel 单个工作表的行数上限 (含表头) 和单元格字符数上限
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_CHARS = 32767
+# 超过单元格上限的完整内容另存的旁路文件后缀 (<输出名>_超长单元格.csv)
+LONG_CELLS_SUFFIX = '_超长单元格.csv'
+
+# --- 输出工具: 流式写入 xlsx (v8 新增) ---
+
+def _cell_writer_for(series):
+    """
+    根据列的 dtype 选择单元格写入方式 ('number'/'bool'/'datetime'/'object')。
+    - 数值/布尔列: 直接写数字, NaN 留空
+    - 时间列: 按日期时间写入
+    - 其他 (object/category/string) 列: 逐个值判断;
+      list/dict/tuple (如 '方法1-专利质量列表', '方法3-专利大组分类计数')
+      按 str() 写成文本，与 DataFrame.to_excel 的结果一致，
+      下游脚本仍可用 ast.literal_eval 解析。
+    """
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'number'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    return 'object'
+
+def _write_object_cell(worksheet, row_idx, col_idx, value, long_cells, row_no):
+    """写入 object 列的一个单元格。超过字符数上限的截断写入，完整内容记入 long_cells (行号, 列号, 文本)。"""
+    if value is None:
+        return
+    if isinstance(value, (list, tuple, dict, set)):
+        text = str(value)
+    elif isinstance(value, str):
+        text = value
+    elif isinstance(value, (bool, np.bool_)):
+        worksheet.write_boolean(row_idx, col_idx, bool(value))
+        return
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+            return # NaN/inf 留空 (与 to_excel 一致)
+        worksheet.write_number(row_idx, col_idx, value)
+        return
+    elif value is pd.NA or value is pd.NaT:
+        return
+    else:
+        text = str(value)
+
+    if len(text) > EXCEL_MAX_CELL_CHARS:
+        long_cells.append((row_no, col_idx, text))
+        text = text[:EXCEL_MAX_CELL_CHARS]
+    worksheet.write_string(row_idx, col_idx, text)
+
+def write_excel_streaming(df, output_path, split='sheets', max_rows_per_sheet=EXCEL_MAX_ROWS - 1):
+    """
+    以 xlsxwriter 的 constant_memory 模式逐行写出 DataFrame。
+    与 DataFrame.to_excel 不同，不会先在内存中构建整个工作簿，
+    写入期间的额外内存与表的大小无关。
+
+    参数:
+    - df (pd.DataFrame): 要写出的表 (不写索引)
+    - output_path (str): 输出路径
+    - split (str): 超过单表行数上限时的拆分方式:
+      'sheets' -> 同一文件中的 Sheet1, Sheet1_2, Sheet1_3 ...
+      'files'  -> xxx.xlsx, xxx_part2.xlsx, xxx_part3.xlsx ...
+    - max_rows_per_sheet (int): 每个工作表最多写入的数据行数 (不含表头)
+
+    超过 Excel 单元格字符数上限的单元格在表中截断，完整内容写入旁路文件 <输出名>_超长单元格.csv
+    (列为 行号 (数据行在整表中的位置，从0开始), 列, 内容)，并打印警告; 没有超长单元格时删除上次留下的旁路文件。
+
+    上次写出的 xxx_partN.xlsx 分片文件先全部删除 (本次行数变少或改为按工作表拆分时，
+    留下的旧分片会被 read_result_excel 当作本次结果拼接)。
+
+    返回: 写出的文件路径列表 (不含旁路文件)
+    """
+    if xlsxwriter is None:
+        raise ImportError("流式写入需要 xlsxwriter: pip install xlsxwriter")
+    if split not in ('sheets', 'files'):
+        raise ValueError(f"未知的拆分方式: {split}")
+
+    columns = [str(c) for c in df.columns]
+    kinds = [_cell_writer_for(df[c]) for c in df.columns]
+    n_rows = len(df)
+    n_parts = max(1, math.ceil(n_rows / max_rows_per_sheet))
+    long_cells = []
+
+    base, ext = os.path.splitext(output_path)
+    for stale_path in _list_part_files(output_path):
+        os.remove(stale_path)
+    written_paths = []
+    workbook = None
+    date_format = None
+    rows_iter = df.itertuples(index=False, name=None)
+
+    for part in range(n_parts):
+        # 打开新文件 (第一个分片，或按文件拆分时的每个分片)
+        if workbook is None or split == 'files':
+            if workbook is not None:
+                workbook.close()
+            path = output_path if part == 0 else f"{base}_part{part + 1}{ext}"
+            workbook = xlsxwriter.Workbook(path, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_formulas': False,
+                'strings_to_urls': False,
+            })
+            date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+            written_paths.append(path)
+
+        sheet_name = 'Sheet1' if (part == 0 or split == 'files') else f'Sheet1_{part + 1}'
+        worksheet = workbook.add_worksheet(sheet_name)
+        for col_idx, name in enumerate(columns):
+            worksheet.write_string(0, col_idx, name)
+
+        rows_in_part = min(max_rows_per_sheet, n_rows - part * max_rows_per_sheet)
+        for row_offset in range(rows_in_part):
+            values = next(rows_iter)
+            row_idx = row_offset + 1
+            for col_idx, (kind, value) in enumerate(zip(kinds, values)):
+                if kind == 'number':
+                    if value is not None and value is not pd.NA and math.isfinite(value):
+                        worksheet.write_number(row_idx, col_idx, value)
+                elif kind == 'bool':
+                    if value is not None and value is not pd.NA:
+                        worksheet.write_boolean(row_idx, col_idx, bool(value))
+                elif kind == 'datetime':
+                    if value is not None and not pd.isna(value):
+                        worksheet.write_datetime(row_idx, col_idx, value.to_pydatetime(), date_format)
+                else:
+                    _write_object_cell(worksheet, row_idx, col_idx, value, long_cells,
+                                       part * max_rows_per_sheet + row_offset)
+
+    workbook.close()
+
+    if n_parts > 1:
+        unit = '个工作表' if split == 'sheets' else '个文件'
+        print(f"⚠️ {os.path.basename(output_path)}: 共 {n_rows} 行，超过 Excel 单表上限，已拆分为 {n_parts} {unit}。")
+    long_cells_path = base + LONG_CELLS_SUFFIX
+    if long_cells:
+        pd.DataFrame([(row_no, columns[col_idx], text) for row_no, col_idx, text in long_cells],
+                     columns=['行号', '列', '内容']).to_csv(long_cells_path, index=False, encoding='utf-8-sig')
+        print(f"⚠️⚠️ {os.path.basename(output_path)}: 有 {len(long_cells)} 个单元格超过 Excel 上限 "
+              f"{EXCEL_MAX_CELL_CHARS} 字符，表中已截断! 完整内容见 {os.path.basename(long_cells_path)}")
+    elif os.path.exists(long_cells_path):
+        os.remove(long_cells_path)
+    return written_paths
+
+def _list_part_files(output_path):
+    """按分片序号列出 write_excel_streaming 拆分出的 xxx_partN.xlsx 文件。"""
+    base, ext = os.path.splitext(output_path)
+    part_paths = glob.glob(f"{glob.escape(base)}_part*{ext}")
+    part_paths = [p for p in part_paths if re.fullmatch(r'\d+', p[len(base) + 5:-len(ext)])]
+    return sorted(part_paths, key=lambda p: int(p[len(base) + 5:-len(ext)]))
+
+def list_result_files(output_path):
+    """
+    列出一个结果文件及其全部附属文件 (分片文件、长表、汇总存储)，
+    返回 [(相对于 output_path 去掉扩展名后的后缀, 路径), ...]，例如
+    ('.xlsx', 主文件), ('_part2.xlsx', 分片), ('_汇总.sqlite', 汇总存储)。
+    """
+    if not os.path.exists(output_path):
+        return []
+    base, _ = os.path.splitext(output_path)
+    paths = [output_path] + _list_part_files(output_path)
+    for suffix in ('_方法3大组计数.csv', '_汇总.sqlite', LONG_CELLS_SUFFIX):
+        if os.path.exists(base + suffix):
+            paths.append(base + suffix)
+    return [(p[len(base):], p) for p in paths]
+
+def read_result_excel(input_path):
+    """
+    读取结果文件 (含 write_excel_streaming 拆分出的多个工作表/分片文件)，
+    按顺序拼接成一个 DataFrame。未拆分的文件与 pd.read_excel(input_path) 结果相同。
+    """
+    frames = []
+    for path in [input_path] + _list_part_files(input_path):
+        sheets = pd.read_excel(path, sheet_name=None)
+        if len(sheets) == 1:
+            frames.extend(sheets.values())
+        else:
+            # 只拼接 Sheet1, Sheet1_2, ... 这些拆分出的工作表
+            names = [n for n in sheets if n == 'Sheet1' or re.fullmatch(r'Sheet1_\d+', n)]
+            names.sort(key=lambda n: 1 if n == 'Sheet1' else int(n.split('_')[1]))
+            frames.extend(sheets[n] for n in names)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+# --- 输出工具: 长表 + 压缩汇总字符串 (v8 新增) ---
+
+class SummarySideStore:
+    """
+    汇总字符串的压缩旁路存储 (sqlite 文件, 每条记录 zlib 压缩)。
+    主结果表中只保存引用 "<存储文件名>#<编号>"，避免超过 Excel 单元格
+    32767 字符的上限，也让主表更小、加载更快。相同的字符串只存一次。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE summaries (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+        self._name = os.path.basename(path)
+        self._ids = {} # 字符串 -> 编号 (去重)
+
+    def put(self, text):
+        """存入一条汇总字符串，返回引用。空值返回 None。"""
+        if text is None or (isinstance(text, float) and math.isnan(text)):
+            return None
+        text = str(text)
+        summary_id = self._ids.get(text)
+        if summary_id is None:
+            summary_id = len(self._ids) + 1
+            self._ids[text] = summary_id
+            self._conn.execute("INSERT INTO summaries (id, data) VALUES (?, ?)",
+                               (summary_id, zlib.compress(text.encode('utf-8'))))
+        return f"{self._name}#{summary_id}"
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+        self._ids = {}
+
+def read_summary(ref, base_dir):
+    """
+    根据主表中的引用 "<存储文件名>#<编号>" 取回原始汇总字符串。
+    base_dir 为存储文件所在目录 (即主结果表所在目录)。
+    """
+    name, summary_id = str(ref).rsplit('#', 1)
+    conn = sqlite3.connect(os.path.join(base_dir, name))
+    try:
+        row = conn.execute("SELECT data FROM summaries WHERE id = ?", (int(summary_id),)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise KeyError(f"汇总存储中不存在: {ref}")
+    return zlib.decompress(row[0]).decode('utf-8')
+
+def split_long_format(df, summary_col_name, output_path, counts_col='方法3-专利大组分类计数',
+                      key_cols=('股票代码', '会计年度')):
+    """
+    长表输出模式:
+    - '方法3-专利大组分类计数' (dict) 从主表中移出，写成长表
+      <输出名>_方法3大组计数.csv，列为 (行号, 股票代码, 会计年度, 大组, 计数)，
+      其中 '行号' 是该行在主表中的位置 (从0开始)；
+    - 汇总列的原始字符串写入 <输出名>_汇总.sqlite，主表中替换为引用。
+    返回精简后的主表 (副本)。
+    """
+    base, _ = os.path.splitext(output_path)
+    df = df.reset_index(drop=True)
+
+    if counts_col in df.columns:
+        key_cols = [c for c in key_cols if c in df.columns]
+        key_values = [df[c].tolist() for c in key_cols]
+        records = []
+        for row_no, counts in enumerate(df[counts_col].tolist()):
+            if not isinstance(counts, dict):
+                continue
+            keys = tuple(values[row_no] for values in key_values)
+            for main_group, count in counts.items():
+                records.append((row_no,) + keys + (main_group, count))
+        df_counts = pd.DataFrame.from_records(records, columns=['行号'] + key_cols + ['大组', '计数'])
+        counts_path = f"{base}_方法3大组计数.csv"
+        df_counts.to_csv(counts_path, index=False, encoding='utf-8-sig')
+        print(f"  长表: {os.path.basename(counts_path)} ({len(df_counts)} 行)")
+        df = df.drop(columns=[counts_col])
+
+    if summary_col_name in df.columns:
+        store = SummarySideStore(f"{base}_汇总.sqlite")
+        try:
+            df[summary_col_name] = [store.put(text) for text in df[summary_col_name].tolist()]
+        finally:
+            store.close()
+        print(f"  汇总字符串: {os.path.basename(store.path)}")
+
+    return df
+
+# --- 输出工具: 紧凑列表列的文本化 (v8 新增) ---
+
+def is_ragged_column(series):
+    """是否为 Arrow 的 list<数值> 列 (01 中方法1/方法2 列表的紧凑存储)。"""
+    dtype = series.dtype
+    return (pa is not None and isinstance(dtype, pd.ArrowDtype)
+            and (pa.types.is_list(dtype.pyarrow_dtype) or pa.types.is_large_list(dtype.pyarrow_dtype)))
+
+def ragged_to_text(series):
+    """
+    list<float32>/list<uint16> 列 -> '[0.6666667, 1.5]' 形式的文本列 (Python 列表字面量，
+    下游脚本仍用 ast.literal_eval 解析)。数值按本身精度取最短表示 (numpy 的 astype(str))，全程向量化。
+    """
+    arr = pa.array(series.array)
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    values = arr.flatten()
+    texts = pa.array(values.to_numpy(zero_copy_only=False).astype(str), pa.large_string())
+    offsets = pc.subtract(arr.offsets, arr.offsets[0]) # 切片后的数组偏移不从 0 开始
+    lists = pa.LargeListArray.from_arrays(offsets.cast(pa.int64()), texts)
+    sep = lambda text: pa.scalar(text, pa.large_string())
+    joined = pc.binary_join(lists, sep(', '))
+    text = pc.binary_join_element_wise(sep('['), joined, sep(']'), sep(''))
+    return pd.Series(pd.arrays.ArrowStringArray(text), index=series.index, name=series.name)
+
+def render_ragged_columns(df):
+    """把表中所有紧凑列表列换成文本 (导出前调用; 没有这类列时原样返回)。"""
+    ragged = [col for col in df.columns if is_ragged_column(df[col])]
+    if not ragged:
+        return df
+    df = df.copy(deep=False)
+    for col in ragged:
+        df[col] = ragged_to_text(df[col])
+    return df
+
+# --- 输出工具: 后台 Excel 导出 (v8 新增) ---
+
+def _write_excel(df, output_path, writer='openpyxl', label="", profiler=None):
+    """
+    实际执行写入的函数 (模块级函数，便于进程模式下 pickle)。
+    writer: 'openpyxl' (DataFrame.to_excel) 或 'streaming' (write_excel_streaming)
+    profiler: 可选的 StageProfiler，对写入过程做采样分析
+    返回本次写入的阶段记录 (耗时、内存、行数)，供运行报告使用。
+    """
+    with StageTimer('export', {'label': label, 'file': os.path.basename(output_path),
+                               'writer': writer}, profiler=profiler) as timer:
+        timer.counts['rows'] = len(df)
+        df = render_ragged_columns(df)
+        if writer == 'streaming':
+            write_excel_streaming(df, output_path)
+        else:
+            df.to_excel(output_path, index=False)
+    return timer.record
+
+class ExcelExportQueue:
+    """
+    后台 Excel 导出队列。
+
+    计算完成的 DataFrame 交给后台写入 (openpyxl 写大表和计算一样耗时)，
+    主流程立即继续下一个分支/任务的计算。最后调用 wait() 等待所有写入完成，
+    并按提交顺序打印每个文件的保存结果。
+
+    参数:
+    - mode (str): 'thread' (后台线程, 默认), 'process' (后台进程, 需要 pickle 整个表),
+      'sync' (立即在当前线程写入, 即 v7 行为)
+    - max_pending (int): 最多允许多少个表在排队/写入中。超过时 submit 会阻塞，
+      避免计算速度远快于写入时内存中堆积太多结果表。
+    - writer (str): 'openpyxl' (DataFrame.to_excel, 默认) 或 'streaming'
+      (xlsxwriter constant_memory 流式写入，超过行数上限时自动拆分工作表)
+    - report (RunReport): 可选，每次写入的耗时/内存记录在 wait() 时加入运行报告
+    """
+
+    def __init__(self, mode='thread', max_pending=2, writer='openpyxl', report=None):
+        if mode not in ('thread', 'process', 'sync'):
+            raise ValueError(f"未知的导出模式: {mode}")
+        if writer not in ('openpyxl', 'streaming'):
+            raise ValueError(f"未知的写入方式: {writer}")
+        if writer == 'streaming' and xlsxwriter is None:
+            print("⚠️ 未安装 xlsxwriter，流式写入不可用，改用 openpyxl 写入。")
+            writer = 'openpyxl'
+        self.mode = mode
+        self.writer = writer
+        self.report = report
+        self.profiler = report.profiler if report is not None else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._jobs = [] # (label, output_path, future 或 (耗时, 错误))
+        self._reported = 0
+        self._executor = None
+        if mode == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='excel-export')
+        elif mode == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=1)
+
+    def submit(self, df, output_path, label="", on_success=None):
+        """
+        提交一个待写入的表。sync 模式下直接写入。
+        on_success: 可选的无参回调，写入成功后调用 (例如把结果存入阶段缓存)。
+        """
+        if self.mode == 'sync':
+            try:
+                record = _write_excel(df, output_path, self.writer, label, self.profiler)
+                self._jobs.append((label, output_path, (record, None)))
+            except Exception as e:
+                self._jobs.append((label, output_path, (None, e)))
+                return
+            self._run_callback(on_success, label)
+            return
+
+        self._slots.acquire() # 排队的表过多时在此等待
+        future = self._executor.submit(_write_excel, df, output_path, self.writer, label, self.profiler)
+
+        def _done(f):
+            self._slots.release()
+            if f.exception() is None:
+                self._run_callback(on_success, label)
+
+        future.add_done_callback(_done)
+        self._jobs.append((label, output_path, future))
+        print(f"⏳ [{label}] 已提交后台导出: {os.path.basename(output_path)}")
+
+    @staticmethod
+    def _run_callback(callback, label):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"⚠️ [{label}] 写入后回调失败: {e}")
+
+    def flush(self):
+        """
+        等待已提交的写入全部完成 (不打印、不清点结果，由 wait()/close() 照常汇报)。
+        写完的表随即释放，内存紧张时用来避免结果表在队列中堆积。
+        """
+        for _, _, job in self._jobs[self._reported:]:
+            if not isinstance(job, tuple):
+                futures_wait([job])
+
+    def wait(self):
+        """
+        等待所有已提交的写入完成，按提交顺序打印结果。
+        返回写入失败的列表: [(label, output_path, 错误), ...]
+        """
+        errors = []
+        for label, output_path, job in self._jobs[self._reported:]:
+            if isinstance(job, tuple):
+                record, error = job
+            else:
+                try:
+                    record, error = job.result(), None
+                except Exception as e:
+                    record, error = None, e
+            if error is None:
+                if self.report is not None:
+                    self.report.add(record)
+                print(f"✅ [{label}] 已保存结果到: {output_path} (写入耗时 {record['wall_seconds']:.2f} 秒)")
+            else:
+                print(f"❌ [{label}] 保存文件失败: {error}")
+                errors.append((label, output_path, error))
+        self._reported = len(self._jobs)
+        return errors
+
+    def close(self):
+        """等待全部写入并关闭后台线程/进程。返回写入失败的列表。"""
+        errors = self.wait()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return errors
+
+# --- 并行工具: 子进程中运行并捕获日志 (v8 新增, 01 与 02/03/05 共用) ---
+
+def call_with_captured_output(func, *args, **kwargs):
+    """
+    在子进程中执行 func，并把其 print 输出捕获为字符串返回，
+    以便主进程按固定顺序打印日志 (并行时日志不会交错)。
+    返回: (结果, 日志文本, 错误信息或 None)
+    """
+    buffer = io.StringIO()
+    result = None
+    error = None
+    with contextlib.redirect_stdout(buffer):
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            error = traceback.format_exc()
+    return result, buffer.getvalue(), error
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource # 仅 Unix
+except ImportError:
+    resource = None
+
+try:
+    import psutil # 可选依赖: 读取当前 RSS (macOS 上没有 /proc)
+except ImportError:
+    psutil = None
+
+# --- 运行报告: 分阶段耗时与内存 (v8 新增) ---
+
+def current_rss_mb():
+    """当前进程的常驻内存 (MB)，无法获取时返回 None。"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_mb():
+    """进程启动以来的 RSS 峰值 (MB)，无法获取时返回 None。"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB, macOS 为字节
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+class StageTimer:
+    """
+    记录一个阶段的墙钟时间、CPU 时间、内存和计数。
+    在 with 块中可通过 timer.counts['rows'] = ... 补充行数/块数等计数。
+    退出时把记录交给 sink (通常是 RunReport.add)。
+    profiler (StageProfiler) 不为 None 时，对本阶段做采样分析并写出分析文件。
+    """
+
+    def __init__(self, name, fields=None, sink=None, profiler=None):
+        self.name = name
+        self.fields = dict(fields or {})
+        self.counts = {}
+        self.record = None
+        self._sink = sink
+        self._profiler = profiler
+        self._sampler = None
+
+    def __enter__(self):
+        self._rss_start = current_rss_mb()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._thread_cpu_start = time.thread_time()
+        if self._profiler is not None:
+            self._sampler = self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        if self._sampler is not None:
+            samples, profile_file = self._profiler.finish(self._sampler, self.name, self.fields)
+            self.counts['profile_samples'] = samples
+            self.counts['profile_file'] = os.path.basename(profile_file)
+        record = {
+            'stage': self.name,
+            **self.fields,
+            'wall_seconds': round(wall, 4),
+            # 进程 CPU 时间包含后台线程; 线程 CPU 时间只计当前线程
+            'cpu_seconds': round(time.process_time() - self._cpu_start, 4),
+            'thread_cpu_seconds': round(time.thread_time() - self._thread_cpu_start, 4),
+            'rss_start_mb': _round(self._rss_start),
+            'rss_end_mb': _round(current_rss_mb()),
+            'rss_peak_mb': _round(peak_rss_mb()), # 进程级峰值 (截至本阶段结束)
+            'pid': os.getpid(),
+        }
+        if tracemalloc.is_tracing():
+            record['tracemalloc_peak_mb'] = _round(tracemalloc.get_traced_memory()[1] / 1024 ** 2)
+        record.update(self.counts)
+        if wall > 0:
+            for key in ('rows', 'blocks', 'codes'):
+                if isinstance(self.counts.get(key), (int, float)):
+                    record[f'{key}_per_second'] = round(self.counts[key] / wall, 1)
+        if exc is not None:
+            record['error'] = repr(exc)
+        self.record = record
+        if self._sink is not None:
+            self._sink(record)
+        return False
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+def stage(report, name, **fields):
+    """
+    阶段计时的便捷入口。report 为 None 时只计时不记录，
+    因此被测函数可以无条件地写 `with stage(report, ...)`。
+    """
+    if report is None:
+        return StageTimer(name, fields)
+    return StageTimer(name, fields, sink=report.add, profiler=report.profiler)
+
+class RunReport:
+    """
+    一次运行的分阶段报告，最终写成 JSON 文件。
+
+    参数:
+    - name (str): 运行名称 (如 '01数据处理')
+    - trace_python_memory (bool): 是否启用 tracemalloc 记录每个阶段的 Python 内存峰值
+      (开销较大，默认关闭; RSS 始终记录)
+    - profiler (StageProfiler): 可选，对每个阶段做采样分析 (见 stage_profiler.py)
+    """
+
+    def __init__(self, name, trace_python_memory=False, meta=None, profiler=None):
+        self.name = name
+        self.meta = dict(meta or {})
+        self.profiler = profiler
+        self.stages = []
+        self.started_at = datetime.now()
+        self._wall_start = time.perf_counter()
+        if trace_python_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add(self, record):
+        self.stages.append(record)
+
+    def extend(self, records):
+        """合并子进程/后台线程返回的阶段记录。"""
+        self.stages.extend(records)
+
+    def to_dict(self):
+        return {
+            'run': self.name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._wall_start, 3),
+            'peak_rss_mb': _round(peak_rss_mb()),
+            'host': socket.gethostname(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'argv': sys.argv,
+            'meta': self.meta,
+            'stages': self.stages,
+        }
+
+    def write(self, directory, prefix='run_report'):
+        """把报告写到 directory/<prefix>_<时间戳>.json，返回文件路径。"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started_at.strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(directory, f"{prefix}_{stamp}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+    def print_summary(self):
+        """打印各阶段耗时汇总 (按记录顺序)。"""
+        print("\n--- 分阶段耗时 ---")
+        for r in self.stages:
+            label = '/'.join(str(r[k]) for k in ('task', 'branch', 'file') if r.get(k))
+            label = f"[{label}] " if label else ""
+            extra = f", {r['rows']} 行" if 'rows' in r else ""
+            print(f"{label}{r['stage']}: 墙钟 {r['wall_seconds']:.2f} 秒, "
+                  f"CPU {r['cpu_seconds']:.2f} 秒, RSS {r['rss_end_mb']} MB{extra}")
@@ -0,0 +1,74 @@
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# --- 共享内存数组 (v8 新增) ---
+#
+# 并行模式下，主进程把输出缓冲区放在 multiprocessing.shared_memory 中，
+# 子进程按名字挂接后直接写入自己负责的切片; 进程间只传递 descriptor() (段名、dtype、形状)
+# 和切片范围，不再 pickle 大数组或结果列表。
+# 创建方 (主进程) 负责 unlink; 挂接方用完后 close。
+
+def _attach_segment(name):
+    """
+    挂接已有的共享内存段，不登记到本进程的 resource_tracker。
+    (Python 3.13 之前挂接也会登记，进程池子进程退出时会把仍在使用的段当作泄漏删除并告警)
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class SharedArrays:
+    """一组放在共享内存中的 numpy 数组，按名字访问: arrays['method1']。"""
+
+    def __init__(self, segments, arrays, owner):
+        self._segments = segments
+        self.arrays = arrays
+        self.owner = owner
+
+    @classmethod
+    def create(cls, specs):
+        """specs: {名字: (dtype, 长度)}，新建并清零。"""
+        segments, arrays = {}, {}
+        for name, (dtype, length) in specs.items():
+            dtype = np.dtype(dtype)
+            shm = shared_memory.SharedMemory(create=True, size=max(dtype.itemsize * length, 1))
+            segments[name] = shm
+            arrays[name] = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+            arrays[name][:] = 0
+        return cls(segments, arrays, owner=True)
+
+    def descriptor(self):
+        """可 pickle 的描述: {名字: (段名, dtype, 长度)}。"""
+        return {name: (self._segments[name].name, arr.dtype.str, len(arr)) for name, arr in self.arrays.items()}
+
+    @classmethod
+    def attach(cls, descriptor):
+        segments, arrays = {}, {}
+        for name, (shm_name, dtype, length) in descriptor.items():
+            shm = _attach_segment(shm_name)
+            segments[name] = shm
+            arrays[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf)
+        return cls(segments, arrays, owner=False)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+    def close(self):
+        """释放本进程的映射 (数组视图随之失效); 创建方同时删除共享内存段。"""
+        self.arrays = {}
+        for shm in self._segments.values():
+            shm.close()
+            if self.owner:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+        self._segments = {}
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import zipfile
+
+import pandas as pd
+
+from pipeline_io import list_result_files
+
+# --- 阶段结果缓存 (v8 新增) ---
+#
+# 每个阶段的输出按 "输入数据内容 + 阶段参数" 的哈希存放，与文件名、快照目录无关，
+# 因此 251108 / 251123 等快照之间、以及同一快照的多次运行之间可以复用相同的结果。
+# 目录结构:
+#   <缓存目录>/objects/<key前2位>/<key>/meta.json
+#   <缓存目录>/objects/<key前2位>/<key>/<后缀>  (如 ".xlsx", "_part2.xlsx", "_汇总.sqlite")
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3 # 默认上限 20 GB
+CACHE_DIR_ENV = 'PATENT_STAGE_CACHE' # 设置该环境变量可指定所有快照共用的缓存目录
+
+def default_cache_dir():
+    """
+    所有快照共用的缓存目录，与快照目录、数据目录无关:
+    环境变量 PATENT_STAGE_CACHE 指定的目录，未设置时为 <用户缓存目录>/patent_stage_cache
+    ($XDG_CACHE_HOME，默认 ~/.cache)。
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir:
+        return os.path.abspath(os.path.expanduser(cache_dir))
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'patent_stage_cache')
+
+def fingerprint_frame(df):
+    """计算 DataFrame 内容 (列名、dtype、所有值) 的哈希，不含索引。"""
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode('utf-8'))
+    h.update(json.dumps([str(t) for t in df.dtypes]).encode('utf-8'))
+    try:
+        values = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # 含 list/dict 等不可哈希的单元格时退化为按字符串哈希
+        values = pd.util.hash_pandas_object(df.astype(str), index=False)
+    h.update(values.values.tobytes())
+    return h.hexdigest()
+
+def fingerprint_files(paths):
+    """
+    按顺序计算若干文件内容的哈希 (只看内容，不看文件名)。
+    .xlsx 文件只哈希工作表等数据部分，跳过 docProps/ (其中的创建/修改时间
+    每次写入都会变化)，因此同样的数据重新写一遍仍得到相同的哈希。
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        if path.endswith('.xlsx') and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                for name in sorted(zf.namelist()):
+                    if name.startswith('docProps/'):
+                        continue
+                    h.update(name.encode('utf-8'))
+                    h.update(zf.read(name))
+        else:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        total += os.path.getsize(os.path.join(path, name))
+    return total
+
+class StageCache:
+    """
+    内容寻址的阶段结果缓存，按总大小做 LRU 淘汰。
+
+    参数:
+    - cache_dir (str): 缓存目录 (默认见 default_cache_dir)
+    - max_bytes (int): 缓存总大小上限，超过时按最近访问时间从旧到新淘汰
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'tmp'), exist_ok=True)
+
+    def make_key(self, stage, params, data_fingerprint):
+        """由阶段名、参数 (需可 JSON 序列化) 和输入数据哈希生成缓存键。"""
+        payload = json.dumps(
+            {'stage': stage, 'params': params, 'data': data_fingerprint},
+            ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, 'objects', key[:2], key)
+
+    def restore(self, key, output_path):
+        """
+        命中时把缓存的结果文件复制到 output_path (及其附属文件) 并返回 True，
+        未命中返回 False。
+        """
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, 'meta.json')
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        base, _ = os.path.splitext(output_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        try:
+            for suffix in meta['suffixes']:
+                target = base + suffix
+                tmp_target = f"{target}.tmp{os.getpid()}"
+                shutil.copyfile(os.path.join(entry, 'file' + suffix.replace(os.sep, '_')), tmp_target)
+                os.replace(tmp_target, target)
+        except OSError:
+            return False # 条目在复制过程中被淘汰，当作未命中
+
+        # 记录访问时间，用于 LRU 淘汰
+        now = time.time()
+        try:
+            os.utime(meta_path, (now, now))
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, output_path, stage=""):
+        """把 output_path (及其附属文件) 存入缓存，然后按大小上限淘汰旧条目。"""
+        entry = self._entry_dir(key)
+        if os.path.exists(entry):
+            return
+        files = list_result_files(output_path)
+        if not files:
+            return
+
+        tmp_dir = tempfile.mkdtemp(dir=os.path.join(self.cache_dir, 'tmp'))
+        try:
+            for suffix, path in files:
+                shutil.copyfile(path, os.path.join(tmp_dir, 'file' + suffix.replace(os.sep, '_')))
+            meta = {
+                'stage': stage,
+                'suffixes': [suffix for suffix, _ in files],
+                'created': time.time(),
+            }
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.replace(tmp_dir, entry) # 原子地发布条目
+        except OSError:
+            # 其他进程已写入同一条目，或磁盘错误: 放弃本次缓存
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，按最近访问时间淘汰最旧的条目。"""
+        objects_dir = os.path.join(self.cache_dir, 'objects')
+        entries = []
+        total = 0
+        for prefix in os.listdir(objects_dir):
+            prefix_dir = os.path.join(objects_dir, prefix)
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    size = _dir_size(entry)
+                    last_access = os.path.getmtime(os.path.join(entry, 'meta.json'))
+                except OSError:
+                    continue
+                entries.append((last_access, size, entry))
+                total += size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+import glob
+import threading
+from collections import Counter
+
+# --- 分阶段采样分析器 (v8 新增) ---
+#
+# 只依赖标准库: 阶段开始时启动一个后台线程，每隔 interval 秒读取一次
+# 进入该阶段的线程的调用栈 (sys._current_frames)，按完整调用栈计数。
+# 每个阶段写两个文件到 profile_dir:
+#   <序号>_<阶段>_<标签>_<pid>.collapsed  折叠栈 ("外层;...;内层 次数")，可直接交给 flamegraph.pl / speedscope
+#   <序号>_<阶段>_<标签>_<pid>.txt        按自身/累计采样数排序的热点函数
+# 运行结束后 merge_collapsed() 把所有阶段合并为 all_stages.collapsed (以阶段名作为最外层帧)。
+# 未启用时 stage() 不创建任何对象，没有额外开销。
+
+DEFAULT_INTERVAL = 0.005 # 默认每 5 毫秒采样一次
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _Sampler(threading.Thread):
+    """采样线程: 对 target_thread_id 的调用栈计数，直到 stop()。"""
+
+    def __init__(self, target_thread_id, interval):
+        super().__init__(name='stage-profiler', daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+class StageProfiler:
+    """
+    分阶段采样分析器的配置 (只包含目录和采样间隔，可以 pickle 传给子进程)。
+
+    参数:
+    - profile_dir (str): 分析结果目录
+    - interval (float): 采样间隔 (秒)
+    """
+
+    def __init__(self, profile_dir, interval=DEFAULT_INTERVAL):
+        self.profile_dir = profile_dir
+        self.interval = interval
+        self._seq = 0
+        self._lock = threading.Lock() # 主线程和后台导出线程共用同一个实例
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """对当前线程开始采样，返回采样线程。"""
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler, stage_name, fields):
+        """停止采样并写出本阶段的折叠栈和热点函数文件，返回 (采样数, 折叠栈文件路径)。"""
+        stacks = sampler.stop()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        label = '-'.join(str(fields[k]) for k in ('task', 'branch', 'file', 'label') if fields.get(k))
+        name = re.sub(r'[\\/:*?"<>|\s]+', '_', f"{seq:03d}_{stage_name}_{label}_{os.getpid()}")
+        path = os.path.join(self.profile_dir, name + '.collapsed')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.profile_dir, name + '.txt'), 'w', encoding='utf-8') as f:
+            f.write(format_hotspots(stacks, title=f"{stage_name} {label}".strip()))
+        return sampler.samples, path
+
+def format_hotspots(stacks, title="", top=25):
+    """按自身采样数 (栈顶) 和累计采样数 (出现在栈中) 列出热点函数。"""
+    total = sum(stacks.values())
+    self_counts, inclusive_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            inclusive_counts[frame] += count
+    lines = [f"# {title} (共 {total} 次采样)", "", "## 自身", ""]
+    for frame, count in self_counts.most_common(top):
+        lines.append(f"{count:>8} {count / total:>7.1%}  {frame}")
+    lines += ["", "## 累计", ""]
+    for frame, count in inclusive_counts.most_common(top):
+        lines.append(f"{count:>8} {count / total:>7.1%}  {frame}")
+    return '\n'.join(lines) + '\n'
+
+def merge_collapsed(profile_dir, output_name='all_stages.collapsed'):
+    """把各阶段的折叠栈合并为一个文件，每条栈以 '<阶段文件名>' 作为最外层帧。返回文件路径。"""
+    out_path = os.path.join(profile_dir, output_name)
+    with open(out_path, 'w', encoding='utf-8') as out:
+        for path in sorted(glob.glob(os.path.join(profile_dir, '*.collapsed'))):
+            if os.path.basename(path) == output_name:
+                continue
+            stage_label = os.path.splitext(os.path.basename(path))[0]
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        out.write(f"{stage_label};{line}")
+    return out_path
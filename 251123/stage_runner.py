@@ -0,0 +1,139 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline_io import call_with_captured_output
+from stage_cache import StageCache, default_cache_dir
+from run_report import RunReport
+from stage_profiler import StageProfiler, merge_collapsed
+from live_metrics import LiveMetrics, serve_metrics
+
+# --- 02/03/05 的公共运行设施 ---
+#
+# 02/03/05 都是对 6 个结果文件逐个 "读取 -> 计算 -> 导出"，命令行选项和运行设施完全相同:
+# 进程池 (--workers)、阶段缓存 (--cache)、运行报告、采样分析 (--profile)、实时指标 (--metrics-*)。
+# 各脚本只提供自己的文件列表和单个文件的处理函数 run_file_job(输入, 输出, cache, profiler, metrics)，
+# 后者返回 (是否成功, 阶段记录)。
+
+def add_stage_arguments(parser, task):
+    """
+    添加公共命令行选项。dest 与 main() 的参数名一致，解析结果可直接 main(**vars(args))。
+    task: 任务名 ('task1' 等)，用于帮助文本中的目录名
+    """
+    parser.add_argument('--workers', dest='max_workers', metavar='WORKERS', type=int, default=None,
+                        help="并行进程数 (默认: min(文件数, CPU核数); 1 表示按顺序处理)")
+    parser.add_argument('--cache', dest='use_cache', action='store_true',
+                        help="启用阶段结果缓存: 输入文件内容相同时直接复用结果 (各快照共用)")
+    parser.add_argument('--cache-dir', default=None, help="缓存目录 (默认: 环境变量 PATENT_STAGE_CACHE，未设置时为 ~/.cache/patent_stage_cache)")
+    parser.add_argument('--cache-max-gb', type=float, default=20, help="缓存大小上限 (GB)，默认 20")
+    parser.add_argument('--root-dir', default=None,
+                        help="根目录 (其下的 result/ 为输入)，默认使用脚本中写死的路径")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"对每个阶段做采样分析: 输出热点函数和折叠栈 (可生成火焰图) 到 根目录/profile_{task}_<时间戳>/")
+    parser.add_argument('--metrics-dir', default=None,
+                        help="实时指标目录: 定期写 Prometheus 文本文件 (可作为 node_exporter 的 textfile 目录)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="在本机该端口提供 /metrics HTTP 端点 (默认目录: 根目录/metrics)")
+    parser.add_argument('--metrics-interval', type=float, default=5.0, help="实时指标写入间隔 (秒)，默认 5")
+    return parser
+
+class StageRun:
+    """
+    一次运行的公共设施。创建时按选项建立阶段缓存、采样分析器、运行报告和实时指标 (并打印相应信息)，
+    run_jobs() 串行或用进程池处理各文件，finish() 写出运行报告、合并折叠栈并关闭指标端点。
+
+    参数:
+    - task (str): 任务名 ('task1' 等)，用于各输出名 (profile_<task>_*、<task>_<pid>.prom、run_report_<task>_*)
+    - script_name (str): 运行报告中的脚本名
+    - root_dir (str): 根目录
+    - n_jobs (int): 文件数 (max_workers 为 None 时取 min(文件数, CPU核数))
+    - max_workers (int): 进程池大小; 1 表示按顺序处理
+    - use_cache / cache_dir / cache_max_gb: 阶段结果缓存 (各快照共用) 及其目录、大小上限
+    - profile (bool): 对每个阶段做采样分析，分析文件写到 根目录/profile_<task>_<时间戳>/
+    - metrics_dir / metrics_port / metrics_interval: 实时指标目录 (每个进程写一个 <task>_<pid>.prom)、
+      本机 /metrics HTTP 端点端口 (未指定目录时使用 根目录/metrics)、写入间隔 (秒)
+    - meta (dict): 写入运行报告的其他信息 (如阶段计算版本)
+    """
+
+    def __init__(self, task, script_name, root_dir, n_jobs, max_workers=None, use_cache=False, cache_dir=None,
+                 cache_max_gb=20, profile=False, metrics_dir=None, metrics_port=None, metrics_interval=5.0, meta=None):
+        self.task = task
+        self.root_dir = root_dir
+        self.cache = None
+        if use_cache:
+            self.cache = StageCache(cache_dir or default_cache_dir(), max_bytes=int(cache_max_gb * 1024 ** 3))
+
+        if max_workers is None:
+            max_workers = min(n_jobs, os.cpu_count() or 1)
+        self.max_workers = max_workers
+        print(f"并行进程数: {max_workers}")
+
+        # 分阶段运行报告 (JSON, 写在 result/ 目录旁)
+        self.profiler = None
+        if profile:
+            self.profiler = StageProfiler(os.path.join(root_dir, f"profile_{task}_{time.strftime('%Y%m%d_%H%M%S')}"))
+            print(f"采样分析: 开启 (输出目录 {self.profiler.profile_dir})")
+        self.report = RunReport(script_name, profiler=self.profiler, meta={
+            'max_workers': max_workers, 'cache': use_cache, **(meta or {})})
+
+        self.metrics = None
+        self._metrics_server = None
+        if metrics_dir or metrics_port:
+            self.metrics = LiveMetrics(metrics_dir or os.path.join(root_dir, 'metrics'), task, interval=metrics_interval)
+            self.metrics.clear_previous()
+            print(f"实时指标: {self.metrics.metrics_dir}")
+            if metrics_port:
+                self._metrics_server = serve_metrics(self.metrics.metrics_dir, metrics_port)
+                print(f"实时指标 HTTP 端点: http://127.0.0.1:{metrics_port}/metrics")
+
+    def run_jobs(self, jobs, run_file_job):
+        """
+        处理 jobs [(文件名, 输入路径, 输出路径), ...]，单个文件出错不影响其他文件。返回失败的文件名列表。
+        进程池模式下子进程的输出先捕获，按文件顺序打印 (并行时日志不交错)。
+        """
+        failed_files = []
+        job_args = (self.cache, self.profiler, self.metrics)
+        if self.max_workers <= 1:
+            for basename, input_path, output_path in jobs:
+                try:
+                    ok, stages = run_file_job(input_path, output_path, *job_args)
+                    self.report.extend(stages)
+                except Exception as e:
+                    print(f"❌ 处理文件 {basename} 时发生未预期的错误: {e}")
+                    ok = False
+                if not ok:
+                    failed_files.append(basename)
+            return failed_files
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                (basename, executor.submit(call_with_captured_output, run_file_job,
+                                           input_path, output_path, *job_args))
+                for basename, input_path, output_path in jobs
+            ]
+            for basename, future in futures:
+                try:
+                    result, log_text, error = future.result()
+                except Exception as e:
+                    # 单个文件失败 (包括子进程崩溃) 不影响其他文件
+                    result, log_text, error = None, "", str(e)
+                print(log_text, end='')
+                if error is not None:
+                    print(f"❌ 处理文件 {basename} 时发生未预期的错误:\n{error}")
+                    failed_files.append(basename)
+                    continue
+                ok, stages = result
+                self.report.extend(stages)
+                if not ok:
+                    failed_files.append(basename)
+        return failed_files
+
+    def finish(self):
+        """写出运行报告 (根目录/run_report_<task>_*.json)，合并采样分析的折叠栈，关闭指标端点。"""
+        report_path = self.report.write(self.root_dir, prefix=f'run_report_{self.task}')
+        print(f"\n运行报告已保存到: {report_path}")
+        if self.profiler is not None and os.path.isdir(self.profiler.profile_dir):
+            print(f"采样分析折叠栈 (全部阶段): {merge_collapsed(self.profiler.profile_dir)}")
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+        return report_path
@@ -0,0 +1,25 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+# 各脚本和辅助模块都直接放在快照目录下 (脚本之间以 "from pipeline_io import ..." 方式引用)
+SNAPSHOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SNAPSHOT_DIR not in sys.path:
+    sys.path.insert(0, SNAPSHOT_DIR)
+
+def load_script(filename, module_name):
+    """按文件名加载快照目录下的脚本 (文件名为中文，不能直接 import)。"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SNAPSHOT_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope='session')
+def dp():
+    """01数据处理.py"""
+    return load_script('01数据处理.py', 'data_processing')
@@ -0,0 +1,57 @@
+import pandas as pd
+
+COLS = ['发明申请A类', '实用新型申请A类']
+
+def test_canonical_block_ignores_order_version_and_outer_spacing(dp):
+    assert dp.canonical_block("A01B 1/00(2006.01); B02C 3/00") == dp.canonical_block(" B02C 3/00;A01B 1/00")
+    assert dp.canonical_block("A01B 1/00") == dp.canonical_block("A01B 1/01") # 大组相同
+    assert dp.canonical_block("A01B 1/00") != dp.canonical_block("A01B 2/00")
+    # 大组内部的写法不同时方法3 分别计数，不算同一形式
+    assert dp.canonical_block("A01B 1/00") != dp.canonical_block("A01B1/00")
+
+def test_canonical_classes_group_blocks_with_same_form(dp):
+    store = dp.BlockStore()
+    ids = [store.intern(text) for text in
+           ["A01B 1/00(2006.01); B02C 3/00", "B02C 3/00;A01B 1/00", "A01B1/00;B02C3/00", "", " "]]
+    classes = store.canonical_classes(ids).tolist()
+    assert classes[0] == classes[1]
+    assert len(set(classes)) == 4 # 没有可解析分类号的块各自成一类
+    assert store.canonical_classes(ids[::-1]).tolist() == classes[::-1]
+
+def test_dedup_canonical_merges_rewritten_blocks(dp):
+    df = pd.DataFrame({
+        '股票代码': ['000001'],
+        '发明申请A类': ['{A01B 1/00(2006.01); B02C 3/00}'],
+        '实用新型申请A类': ['{B02C 3/00;A01B 1/00}'],
+    })
+    merged, plain = dp.ProcessingStats(), dp.ProcessingStats()
+    out, _ = dp.process_rows(df, COLS, '汇总', stats=merged, dedup_canonical=True)
+    dp.process_rows(df, COLS, '汇总', stats=plain)
+    assert merged.blocks_canonical_merged == 1
+    assert plain.blocks_canonical_merged == 0
+    # 合并后只按一个块计分，与只有发明专利列时相同
+    alone, _ = dp.process_rows(df.drop(columns='实用新型申请A类'), COLS[:1], '汇总')
+    assert out['方法1-专利质量列表'].iloc[0] == alone['方法1-专利质量列表'].iloc[0]
+    assert out['方法3-专利大组分类计数'].iloc[0] == alone['方法3-专利大组分类计数'].iloc[0]
+
+def test_dedup_canonical_never_increases_row_counts(dp):
+    # 同一形式的块在不同行中先后出现、写法不同; 第二行的块不能换成第一行的写法
+    df = pd.DataFrame({
+        '股票代码': ['000001', '000002', '000003', '000004'],
+        '发明申请A类': ['{A01B1/00;B02C 3/00}{A01B 1/00}', '{A01B 1/00; B02C 3/00}', None, '{ }{C01D 5/00}'],
+        '实用新型申请A类': ['{B02C 3/00;A01B1/00(2006.01)}', '{A01B 1/02}{B02C 3/00;A01B 1/00}',
+                         '{A01B1/00}', '{C01D 5/00(2006.01)}{ }'],
+    })
+    block_store = dp.BlockStore()
+    dedup, _ = dp.process_rows(df, COLS, '汇总', block_store=block_store, dedup_canonical=True)
+    plain, _ = dp.process_rows(df, COLS, '汇总', block_store=block_store)
+    for (_, d), (_, p) in zip(dedup.iterrows(), plain.iterrows()):
+        counts, plain_counts = d['方法3-专利大组分类计数'], p['方法3-专利大组分类计数']
+        assert all(n <= plain_counts.get(key, 0) for key, n in counts.items()), (counts, plain_counts)
+        assert len(d['方法1-专利质量列表']) <= len(p['方法1-专利质量列表'])
+    assert [len(q) for q in dedup['方法1-专利质量列表']] == [2, 2, 1, 1]
+    # 逐行实现 (process_row) 与按列实现的结果相同
+    by_row = df.apply(dp.process_row, axis=1, patent_cols=COLS, summary_col_name='汇总',
+                      block_store=dp.BlockStore(), dedup_canonical=True)
+    assert by_row['方法3-专利大组分类计数'].tolist() == dedup['方法3-专利大组分类计数'].tolist()
+    assert [list(q) for q in by_row['方法1-专利质量列表']] == [list(q) for q in dedup['方法1-专利质量列表']]
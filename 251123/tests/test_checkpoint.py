@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+from checkpoint import CheckpointStore
+from pipeline_io import read_result_excel
+
+def _input_frame(dp):
+    return dp.normalize_keys(pd.DataFrame({
+        '股票代码': ['000001', '000001', '000002'],
+        '会计年度': [2020, 2020, 2021],
+        '公司类型': ['上市公司本身', '子公司', '上市公司本身'],
+        '发明申请A类': ['CN1{A01B 1/00;A01B 3/00}', 'CN2{B02C 3/00}', 'CN3{C01D 5/00;C01D 7/00}'],
+        '发明申请A类数量': [1, 1, 1],
+    }))
+
+def test_store_save_load_and_fingerprint(tmp_path):
+    df = pd.DataFrame({'a': [1, 2]})
+    store = CheckpointStore(str(tmp_path / 'ckpt'))
+    assert store.load('unit', 'fp1') is None
+    store.save('unit', 'fp1', df)
+    store.mark('unit', 'fp1', exported=True)
+    pd.testing.assert_frame_equal(store.load('unit', 'fp1'), df)
+    assert store.status('unit', 'fp1')['exported'] # 已有的状态字段保留
+    assert store.load('unit', 'fp2') is None # 指纹不符: 重新计算
+
+    resumed = CheckpointStore(str(tmp_path / 'ckpt'), resume=True)
+    pd.testing.assert_frame_equal(resumed.load('unit', 'fp1'), df)
+    fresh = CheckpointStore(str(tmp_path / 'ckpt')) # 新的一次运行清空目录
+    assert fresh.status('unit', 'fp1') is None
+
+def test_resume_skips_exported_branches_and_reexports_the_rest(dp, tmp_path, monkeypatch):
+    outputs = dict(output_merged_excel=str(tmp_path / 'merged.xlsx'), output_listed_excel=str(tmp_path / 'listed.xlsx'))
+    task = dict(data_prefixes=['发明申请'], count_prefixes=['发明申请'], summary_col_name='发明专利汇总',
+                task_name='发明专利', **outputs)
+    ckpt_dir = str(tmp_path / 'ckpt')
+    dp.run_processing_task(_input_frame(dp), checkpoint=CheckpointStore(ckpt_dir), **task)
+    expected = {name: read_result_excel(path) for name, path in outputs.items()}
+
+    # 分支2 的输出丢失 (例如导出中途被打断): 从检查点恢复结果重新导出，两个分支都不再计算
+    os.remove(outputs['output_listed_excel'])
+    def fail(*args, **kwargs):
+        pytest.fail("--resume 时不应重新计算")
+    monkeypatch.setattr(dp, 'process_rows', fail)
+    dp.run_processing_task(_input_frame(dp), checkpoint=CheckpointStore(ckpt_dir, resume=True), **task)
+    for name, path in outputs.items():
+        pd.testing.assert_frame_equal(read_result_excel(path), expected[name])
+
+    # 输入改变: 指纹不符，重新计算
+    changed = _input_frame(dp).assign(发明申请A类=['CN9{A01B 9/00}'] * 3)
+    with pytest.raises(pytest.fail.Exception):
+        dp.run_processing_task(changed, checkpoint=CheckpointStore(ckpt_dir, resume=True), **task)
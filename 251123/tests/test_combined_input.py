@@ -0,0 +1,25 @@
+import pandas as pd
+
+def _frames():
+    keys = {'股票代码': ['000001', '000001', '000002'], '会计年度': [2020, 2020, 2020], '公司类型': ['子公司'] * 3}
+    df_invention = pd.DataFrame({**keys, '公司名称': ['甲-子公司1', '甲-子公司2', '乙'],
+                                 '发明申请A类': ['{A01B 1/00}', '{B02C 3/00}', '{C01D 5/00}']})
+    # 实用新型一侧同一键下的子公司顺序不同，且 乙 没有实用新型专利
+    df_utility = pd.DataFrame({**{k: v[:2] for k, v in keys.items()}, '公司名称': ['甲-子公司2', '甲-子公司1'],
+                               '实用新型申请A类': ['{E04B 1/00}', '{F16K 1/00}']})
+    return df_invention, df_utility
+
+def test_subsidiaries_sharing_a_key_are_aligned_by_name(dp):
+    df_combined = dp.build_combined_input(*_frames())
+    assert list(df_combined.columns) == ['股票代码', '会计年度', '公司类型', '公司名称', '发明申请A类', '实用新型申请A类']
+    rows = df_combined.set_index('公司名称')
+    assert rows.loc['甲-子公司1', '实用新型申请A类'] == '{F16K 1/00}'
+    assert rows.loc['甲-子公司2', '实用新型申请A类'] == '{E04B 1/00}'
+    assert pd.isna(rows.loc['乙', '实用新型申请A类'])
+
+def test_name_only_on_one_side_is_kept(dp):
+    df_invention, df_utility = _frames()
+    df_combined = dp.build_combined_input(df_invention.drop(columns='公司名称'), df_utility)
+    assert len(df_combined) == 3 # 没有 公司名称 时按 键内序号 一一对应
+    assert df_combined['公司名称'].iloc[:2].tolist() == ['甲-子公司2', '甲-子公司1']
+    assert pd.isna(df_combined['公司名称'].iloc[2])
@@ -0,0 +1,84 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from patent_corpus import open_corpus
+
+COLS = ['发明申请A类', '实用新型申请A类']
+
+def _frame():
+    return pd.DataFrame({
+        '股票代码': ['000001', '000001', '000002', '000003'],
+        '会计年度': [2020, 2020, 2021, 2021],
+        '发明申请A类': ['CN1{A01B 1/00;A01B 3/00}\nCN2{B02C 3/00;(2006.01)}', 'CN3{A01B 1/00;A01B 3/00}',
+                    None, 'CN4{A01B 1/00(2006.01); B02C 3/00}CN5{C01D 5/00}'],
+        '实用新型申请A类': ['CN6{C01D 5/00}', None, 'CN7{B02C3/00;A01B1/00}', 'CN8{A01B 1/00;A01B 3/00}'],
+    })
+
+@pytest.fixture
+def loaded(dp, tmp_path):
+    """同一文件分别按原文件 (xlsx 模式) 和已编译语料 (语料模式) 加载。"""
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'input.xlsx')
+    _frame().to_excel(path, index=False)
+    df_xlsx = dp.load_data(path)
+    dp.load_data(path, corpus_dir=str(tmp_path / 'corpus')) # 编译
+    df_corpus = dp.load_data(path, corpus_dir=str(tmp_path / 'corpus')) # 从语料打开
+    return df_xlsx, df_corpus
+
+def _block_id_remaps(df, store):
+    for path in df.attrs['patent_corpora']:
+        store.load_corpus(open_corpus(path))
+    return {col: store.corpus_remaps[path] for col, path in df.attrs['block_id_corpora'].items()}
+
+@pytest.mark.parametrize('dedup_canonical', [False, True])
+def test_corpus_mode_matches_xlsx_mode(dp, loaded, dedup_canonical):
+    df_xlsx, df_corpus = loaded
+    assert sorted(df_corpus.attrs['block_id_corpora']) == sorted(dp.block_id_col(c) for c in COLS)
+    pd.testing.assert_frame_equal(dp.without_block_ids(df_corpus), df_xlsx)
+
+    store = dp.BlockStore()
+    remaps = _block_id_remaps(df_corpus, store)
+    out_corpus, _ = dp.process_rows(df_corpus, COLS, '汇总', block_store=store, dedup_canonical=dedup_canonical,
+                                    block_id_remaps=remaps)
+    out_xlsx, _ = dp.process_rows(df_xlsx, COLS, '汇总', dedup_canonical=dedup_canonical)
+    assert store.parsed == 0 # 块全部来自语料，按块 id 取值，不再从文本中提取
+    pd.testing.assert_frame_equal(dp.without_block_ids(out_corpus), out_xlsx)
+
+def test_merged_block_ids_match_joined_text(dp, loaded):
+    _, df_corpus = loaded
+    id_cols = [dp.block_id_col(c) for c in COLS]
+    merged = dp.merge_block_id_lists(df_corpus, ['股票代码', '会计年度'], id_cols)
+    joined = df_corpus.groupby(['股票代码', '会计年度'], observed=True)[COLS].agg(
+        lambda s: ''.join(s.dropna().astype(str)))
+    corpus = open_corpus(df_corpus.attrs['patent_corpora'][0])
+    texts = np.asarray(corpus.block_texts(), dtype=object)
+    for col, id_col in zip(COLS, id_cols):
+        assert [list(texts[ids]) for ids in merged[id_col].to_pylist()] == \
+            [re.findall(r'\{(.*?)\}', text) for text in joined[col]]
+
+def test_vectorized_scores_match_score_block(dp, loaded):
+    _, df_corpus = loaded
+    corpus = open_corpus(df_corpus.attrs['patent_corpora'][0])
+    scores = dp.score_blocks(corpus.block_code_offsets, corpus.code_main_group, corpus.code_sub_class)
+    for block_id, text in enumerate(corpus.block_texts()):
+        expected = dp.score_block(dp.parse_block(text))
+        assert scores['valid'][block_id] == (expected is not None)
+        if expected is not None:
+            method1, N, n, method2, _ = expected
+            assert (scores['method1'][block_id], scores['N'][block_id], scores['n'][block_id],
+                    scores['method2'][block_id]) == (method1, N, n, method2)
+
+def test_store_loaded_from_corpus_matches_parsing(dp, loaded):
+    _, df_corpus = loaded
+    corpus = open_corpus(df_corpus.attrs['patent_corpora'][0])
+    parsed = dp.BlockStore()
+    ids = [parsed.intern(text) for text in corpus.block_texts()]
+    loaded_store = dp.BlockStore()
+    loaded_store.load_corpus(corpus)
+    remap = loaded_store.corpus_remaps[corpus.path]
+    assert loaded_store.parsed == 0
+    for name, column in loaded_store.typed_columns().items():
+        assert (column[remap] == parsed.typed_columns()[name][ids]).all(), name
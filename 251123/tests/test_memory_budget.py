@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+COLS = ['发明申请A类']
+
+def _frame(n_rows):
+    return pd.DataFrame({
+        '股票代码': [f"{i:06d}" for i in range(n_rows)],
+        '发明申请A类': [f"CN{i}{{A01B {i}/00;B02C 3/00}}" * (1 + i % 3) for i in range(n_rows)],
+    })
+
+@pytest.fixture
+def no_rss(dp, monkeypatch):
+    """固定 "当前占用": 不计进程基础内存，只有 df 内存 + 块库。"""
+    monkeypatch.setattr(dp, 'BASE_RSS_MB', None)
+
+def _budget_for(dp, df, rows_per_chunk, store=None):
+    ratio = store.new_block_ratio() if store is not None else 1.0
+    peak, kept = dp.estimate_row_bytes(df, COLS, COLS, ratio)
+    current = df.memory_usage(deep=True).sum() + (len(store) if store is not None else 0) * dp.BYTES_PER_STORED_BLOCK
+    return int(current + kept.sum() + peak.max() * rows_per_chunk)
+
+def test_small_frame_is_chunked(dp, no_rss):
+    df = _frame(50) # 远少于旧的 1000 行下限
+    chunks = dp.plan_row_chunks(df, COLS, COLS, _budget_for(dp, df, 2))
+    assert len(chunks) > 1
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(df)
+    assert all(lo < hi for lo, hi in chunks)
+    assert all(hi == next_lo for (_, hi), (next_lo, _) in zip(chunks, chunks[1:]))
+    peak, _ = dp.estimate_row_bytes(df, COLS, COLS, 1.0)
+    assert all(peak.iloc[lo:hi].sum() <= peak.max() * 2 for lo, hi in chunks)
+
+def test_budget_below_one_row_falls_back_to_single_rows(dp, no_rss, capsys):
+    df = _frame(10)
+    chunks = dp.plan_row_chunks(df, COLS, COLS, _budget_for(dp, df, 0.5), label='小预算')
+    assert chunks == [(i, i + 1) for i in range(10)]
+    assert "⚠️ [小预算] 内存预算不足" in capsys.readouterr().out
+
+def test_budget_ignores_memory_released_by_earlier_tasks(dp, no_rss, monkeypatch):
+    # 运行中的 RSS 包含前面任务用过的内存，不能据此判断本任务放不下
+    df = _frame(50)
+    monkeypatch.setattr(dp, 'current_rss_mb', lambda: 10 ** 6)
+    assert len(dp.plan_row_chunks(df, COLS, COLS, _budget_for(dp, df, 50))) == 1
+
+def test_block_store_is_counted(dp, no_rss):
+    df = _frame(50)
+    store = dp.BlockStore()
+    for i in range(5000):
+        store.intern(f"X{i:05d}/00")
+    budget = _budget_for(dp, df, 50) # 忽略块库时足够整表一次处理
+    assert len(dp.plan_row_chunks(df, COLS, COLS, budget + len(store) * dp.BYTES_PER_STORED_BLOCK, block_store=store)) == 1
+    chunks = dp.plan_row_chunks(df, COLS, COLS, budget - len(store) * dp.BYTES_PER_STORED_BLOCK, block_store=store)
+    assert len(chunks) == len(df)
+
+def test_chunked_processing_matches_single_pass(dp, no_rss):
+    df = _frame(30)
+    whole, n_whole = dp.process_rows(df, COLS, '汇总', memory_budget=10 ** 12, drop_cols=COLS)
+    parts, n_parts = dp.process_rows(df, COLS, '汇总', memory_budget=_budget_for(dp, df, 3), drop_cols=COLS)
+    assert n_whole == 1 and n_parts > 1
+    pd.testing.assert_frame_equal(whole.astype(str), parts.astype(str))
@@ -0,0 +1,92 @@
+import os
+import ast
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline_io import (split_long_format, read_summary, ragged_to_text, render_ragged_columns,
+                         write_excel_streaming, read_result_excel, list_result_files, EXCEL_MAX_CELL_CHARS)
+
+def test_split_long_format_round_trip(tmp_path):
+    long_text = 'CN1{A01B 1/00}' * 5000 # 超过 Excel 单元格 32767 字符上限
+    df = pd.DataFrame({
+        '股票代码': ['000001', '000002', '000003', '000004'],
+        '会计年度': [2020, 2020, 2021, 2021],
+        '汇总': [long_text, 'CN2{B02C 3/00}', None, long_text],
+        '方法3-专利大组分类计数': [{'A01B 1': 2, 'B02C 3': 1}, {}, None, {'C01D 5': 4}],
+    }, index=[10, 11, 12, 13])
+    output_path = str(tmp_path / 'task.xlsx')
+    slim = split_long_format(df, '汇总', output_path)
+
+    assert '方法3-专利大组分类计数' not in slim.columns
+    assert list(slim.index) == [0, 1, 2, 3] # 行号即主表中的位置
+    # 汇总列: 引用 -> 原字符串，相同字符串只存一次
+    assert slim['汇总'].iloc[0] == slim['汇总'].iloc[3]
+    assert pd.isna(slim['汇总'].iloc[2])
+    restored = [None if pd.isna(ref) else read_summary(ref, str(tmp_path)) for ref in slim['汇总']]
+    assert restored == [long_text, 'CN2{B02C 3/00}', None, long_text]
+
+    # 长表: 按行号聚合回 dict (空 dict / 缺失值的行没有记录)
+    counts = pd.read_csv(os.path.join(tmp_path, 'task_方法3大组计数.csv'), dtype={'股票代码': str})
+    assert list(counts.columns) == ['行号', '股票代码', '会计年度', '大组', '计数']
+    rebuilt = {row_no: dict(zip(group['大组'], group['计数'])) for row_no, group in counts.groupby('行号')}
+    assert rebuilt == {0: {'A01B 1': 2, 'B02C 3': 1}, 3: {'C01D 5': 4}}
+    assert counts.set_index('行号')[['股票代码', '会计年度']].drop_duplicates().to_dict('index') == \
+        {0: {'股票代码': '000001', '会计年度': 2020}, 3: {'股票代码': '000004', '会计年度': 2021}}
+
+def test_streaming_writer_keeps_over_limit_cells_in_side_file(tmp_path, capsys):
+    pytest.importorskip('xlsxwriter')
+    long_text = 'CN1{A01B 1/00}' * 5000
+    df = pd.DataFrame({'股票代码': ['000001', '000002', '000003'], '汇总': ['短', None, long_text]})
+    output_path = str(tmp_path / 'task.xlsx')
+    write_excel_streaming(df, output_path, max_rows_per_sheet=2) # 超长单元格在第二个工作表
+    assert "超过 Excel 上限" in capsys.readouterr().out
+
+    assert len(read_result_excel(output_path)['汇总'].iloc[2]) == EXCEL_MAX_CELL_CHARS
+    side = pd.read_csv(str(tmp_path / 'task_超长单元格.csv'))
+    assert side[['行号', '列']].values.tolist() == [[2, '汇总']] # 行号为整表中的位置
+    assert side['内容'].iloc[0] == long_text
+    assert [suffix for suffix, _ in list_result_files(output_path)] == ['.xlsx', '_超长单元格.csv']
+
+    # 重新写出时没有超长单元格: 删除上次的旁路文件
+    write_excel_streaming(df.iloc[:2], output_path)
+    assert not os.path.exists(tmp_path / 'task_超长单元格.csv')
+
+def test_streaming_writer_removes_stale_part_files(tmp_path):
+    pytest.importorskip('xlsxwriter')
+    df = pd.DataFrame({'公司名称': [f"公司{i}" for i in range(5)], '计数': range(5)})
+    output_path = str(tmp_path / 'task.xlsx')
+    assert len(write_excel_streaming(df, output_path, split='files', max_rows_per_sheet=2)) == 3
+    # 重新写出的行数变少: 不能留下上次的 task_part3.xlsx
+    write_excel_streaming(df.iloc[:3], output_path, split='files', max_rows_per_sheet=2)
+    assert sorted(os.listdir(tmp_path)) == ['task.xlsx', 'task_part2.xlsx']
+    pd.testing.assert_frame_equal(read_result_excel(output_path), df.iloc[:3], check_dtype=False)
+    # 改为按工作表拆分: 分片文件全部删除
+    write_excel_streaming(df, output_path, max_rows_per_sheet=2)
+    assert os.listdir(tmp_path) == ['task.xlsx']
+    pd.testing.assert_frame_equal(read_result_excel(output_path), df, check_dtype=False)
+
+def _ragged(offsets, values):
+    pa = pytest.importorskip('pyarrow')
+    return pd.Series(pd.arrays.ArrowExtensionArray(pa.ListArray.from_arrays(pa.array(offsets, pa.int32()),
+                                                                           pa.array(values))))
+
+def test_ragged_to_text_matches_python_list_literals():
+    quality = _ragged([0, 2, 2, 3], np.array([2 / 3, 1.5, 0.1], dtype=np.float32))
+    counts = _ragged([0, 1, 1, 3], np.array([3, 65535, 0], dtype=np.uint16))
+    # float32 按本身精度取最短表示; 空列表为 '[]'
+    assert ragged_to_text(quality).tolist() == ['[0.6666667, 1.5]', '[]', '[0.1]']
+    assert ragged_to_text(counts).tolist() == ['[3]', '[]', '[65535, 0]']
+    # 切片后偏移不从 0 开始
+    assert ragged_to_text(quality.iloc[1:]).tolist() == ['[]', '[0.1]']
+    # 下游脚本用 ast.literal_eval 读回
+    assert [ast.literal_eval(text) for text in ragged_to_text(quality)] == [[0.6666667, 1.5], [], [0.1]]
+
+def test_render_ragged_columns_only_touches_list_columns():
+    df = pd.DataFrame({'股票代码': ['000001', '000002', '000003'], '计数': [1, 2, 3]})
+    assert render_ragged_columns(df) is df
+    df['方法2-小类数量列表'] = _ragged([0, 1, 1, 3], np.array([3, 65535, 0], dtype=np.uint16))
+    rendered = render_ragged_columns(df)
+    assert rendered['方法2-小类数量列表'].tolist() == ['[3]', '[]', '[65535, 0]']
+    assert rendered[['股票代码', '计数']].equals(df[['股票代码', '计数']])
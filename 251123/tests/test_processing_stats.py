@@ -0,0 +1,30 @@
+import pandas as pd
+
+COLS = ['发明申请A类', '发明申请B类']
+
+def _frame():
+    return pd.DataFrame({
+        '股票代码': ['000001', '000002'],
+        '发明申请A类': ['CN1{A01B 1/00;A01B 3/00}\nCN2{B02C 3/00;(2006.01)}', 'CN3{A01B 1/00;A01B 3/00}'],
+        '发明申请B类': [None, 'CN4{C01D 5/00}'],
+    })
+
+def test_codes_are_counted_per_occurrence(dp):
+    store = dp.BlockStore()
+    first, second = dp.ProcessingStats(), dp.ProcessingStats()
+    dp.process_rows(_frame(), COLS, '汇总', stats=first, block_store=store)
+    dp.process_rows(_frame(), COLS, '汇总', stats=second, block_store=store)
+    for stats in (first, second):
+        # 第 1 行: 2 + 2 个分类号 ((2006.01) 解析不出大组); 第 2 行: 2 + 1 个
+        assert stats.codes == 7
+        assert stats.codes_no_main_group == 1
+        assert stats.codes_per_block == {2: 3, 1: 1}
+    assert first.blocks_parsed == 3
+    assert second.blocks_parsed == 0 # 第二次全部查表，分类号数仍按出现次数统计
+
+def test_row_and_frame_paths_count_the_same(dp):
+    by_frame, by_row = dp.ProcessingStats(), dp.ProcessingStats()
+    dp.process_rows(_frame(), COLS, '汇总', stats=by_frame, block_store=dp.BlockStore())
+    store = dp.BlockStore()
+    _frame().apply(dp.process_row, axis=1, patent_cols=COLS, summary_col_name='汇总', stats=by_row, block_store=store)
+    assert by_frame.to_counts() == by_row.to_counts()
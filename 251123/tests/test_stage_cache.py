@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+
+from stage_cache import StageCache, default_cache_dir, fingerprint_files, fingerprint_frame
+
+def test_make_key_is_stable(tmp_path):
+    a = StageCache(str(tmp_path / 'a'))
+    b = StageCache(str(tmp_path / 'b'))
+    key = a.make_key('task1', {'version': 'task1-v1', 'x': 1}, 'abc')
+    # 与缓存目录、实例、参数顺序无关
+    assert key == b.make_key('task1', {'x': 1, 'version': 'task1-v1'}, 'abc')
+    assert key != a.make_key('task1', {'version': 'task1-v2', 'x': 1}, 'abc')
+    assert key != a.make_key('task2', {'version': 'task1-v1', 'x': 1}, 'abc')
+    assert key != a.make_key('task1', {'version': 'task1-v1', 'x': 1}, 'abd')
+
+def test_fingerprint_ignores_xlsx_metadata_and_file_name(tmp_path):
+    df = pd.DataFrame({'股票代码': ['000001', '000002'], '值': [1.5, 2.5]})
+    first, second = str(tmp_path / 'a.xlsx'), str(tmp_path / 'b.xlsx')
+    df.to_excel(first, index=False)
+    df.to_excel(second, index=False)
+    assert fingerprint_files([first]) == fingerprint_files([second])
+    df.assign(值=[1.5, 3.5]).to_excel(second, index=False)
+    assert fingerprint_files([first]) != fingerprint_files([second])
+
+def test_fingerprint_frame_ignores_index():
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    assert fingerprint_frame(df) == fingerprint_frame(df.set_axis([10, 11]))
+    assert fingerprint_frame(df) != fingerprint_frame(df.assign(a=[1, 3]))
+
+def test_store_and_restore(tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'))
+    output = tmp_path / 'out' / 'task1-x.xlsx'
+    output.parent.mkdir()
+    output.write_bytes(b'payload')
+    key = cache.make_key('task1', {}, 'abc')
+    assert not cache.restore(key, str(tmp_path / 'restored' / 'task1-x.xlsx'))
+    cache.store(key, str(output), stage='task1')
+    assert cache.restore(key, str(tmp_path / 'restored' / 'task1-x.xlsx'))
+    assert (tmp_path / 'restored' / 'task1-x.xlsx').read_bytes() == b'payload'
+
+def test_default_cache_dir_is_snapshot_independent(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATENT_STAGE_CACHE', str(tmp_path / 'shared'))
+    assert default_cache_dir() == str(tmp_path / 'shared')
+    monkeypatch.delenv('PATENT_STAGE_CACHE')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'xdg'))
+    monkeypatch.chdir(tmp_path)
+    assert default_cache_dir() == os.path.join(str(tmp_path / 'xdg'), 'patent_stage_cache')
@@ -0,0 +1,19 @@
+import argparse
+import inspect
+
+import pytest
+
+from conftest import load_script
+from stage_runner import add_stage_arguments
+
+@pytest.mark.parametrize('filename, task', [
+    ('02方法1结果企业汇总处理.py', 'task1'),
+    ('03方法2结果企业汇总处理.py', 'task2'),
+    ('05方法4结果企业汇总处理.py', 'task4'),
+])
+def test_stage_arguments_match_main(filename, task):
+    script = load_script(filename, f"stage_{task}")
+    parser = add_stage_arguments(argparse.ArgumentParser(), task)
+    args = vars(parser.parse_args(['--workers', '2', '--cache', '--profile', '--metrics-port', '9100']))
+    assert set(args) == set(inspect.signature(script.main).parameters)
+    assert args['max_workers'] == 2 and args['use_cache'] and args['profile'] and args['metrics_port'] == 9100